@@ -4,6 +4,10 @@ from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 from typing import Dict, List, Optional
 from ph_cities import CITY_CENTERS  # <-- import your dict
+from soil_batch import Points, analyze_points
+from soil_profile import AG_PROPERTIES, SOIL_DEPTHS, SoilProfile
+from soil_store import SoilStore, get_default_store
+from upstream_guard import get_guard
 
 # -----------------------------
 # CONFIG
@@ -24,7 +28,7 @@ def get_weather(city_name: str, display_output: bool = True):
 
     url = f"http://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={OWM_API_KEY}&units=metric"
     try:
-        resp = requests.get(url, timeout=10).json()
+        resp = get_guard("openweathermap").get(url, timeout=10).json()
     except requests.RequestException as e:
         error_data = {"error": f"Weather API request failed: {str(e)}"}
         if display_output:
@@ -65,7 +69,7 @@ def _get_weather_forecast(city_name: str):
     """Get 3-day weather forecast"""
     url = f"http://api.openweathermap.org/data/2.5/forecast?q={city_name}&appid={OWM_API_KEY}&units=metric&cnt=24"
     try:
-        resp = requests.get(url, timeout=10).json()
+        resp = get_guard("openweathermap").get(url, timeout=10).json()
         if "list" not in resp:
             return {"error": "Forecast API failed"}
         
@@ -245,235 +249,79 @@ def _display_weather_analysis(weather_data: Dict, city_name: str):
 class SoilGridsExtractor:
     """Extract agriculturally relevant soil data from SoilGrids API"""
     
-    def __init__(self):
-        # Define agriculturally important soil properties
-        self.ag_properties = {
-            'phh2o': {'name': 'Soil pH (H2O)', 'unit': 'pH units', 'conversion': 10},
-            'ocd': {'name': 'Organic Carbon Density', 'unit': 'hg/m³', 'conversion': 10},
-            'nitrogen': {'name': 'Total Nitrogen', 'unit': 'g/kg', 'conversion': 100},
-            'soc': {'name': 'Soil Organic Carbon', 'unit': 'g/kg', 'conversion': 10},
-            'cec': {'name': 'Cation Exchange Capacity', 'unit': 'cmol(c)/kg', 'conversion': 10},
-            'bdod': {'name': 'Bulk Density', 'unit': 'kg/dm³', 'conversion': 100},
-            'clay': {'name': 'Clay Content', 'unit': '%', 'conversion': 10},
-            'sand': {'name': 'Sand Content', 'unit': '%', 'conversion': 10},
-            'silt': {'name': 'Silt Content', 'unit': '%', 'conversion': 10},
-            'wv0010': {'name': 'Water Content at 10kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10},
-            'wv0033': {'name': 'Water Content at 33kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10},
-            'wv1500': {'name': 'Water Content at 1500kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10}
-        }
+    def __init__(self, store: Optional[SoilStore] = None):
+        # Soil values are static per grid cell, so lookups go through a persistent store
+        self.store = store or get_default_store()
+        
+        # Agriculturally important soil properties, shared with the columnar SoilProfile
+        self.ag_properties = AG_PROPERTIES
     
-    def get_soil_data(self, lat: float, lon: float) -> Dict:
-        """Fetch soil data from SoilGrids API"""
-        url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}"
+    def get_soil_data(self, lat: float, lon: float, depths: Optional[List[str]] = None,
+                      values: Optional[List[str]] = None, properties: Optional[List[str]] = None) -> Dict:
+        """Fetch soil data for the grid cell containing (lat, lon), served from the soil store when known
         
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": f"API request failed: {str(e)}"}
+        Only the requested properties (default: ag_properties), depths and statistics are queried.
+        """
+        return self.store.fetch(lat, lon, properties=properties or list(self.ag_properties),
+                                depths=depths, values=values)
     
     def extract_topsoil_values(self, soil_data: Dict, depth_label: str = "0-5cm") -> Dict:
         """Extract values for a specific depth layer (default: topsoil 0-5cm)"""
-        extracted = {}
-        
         if "properties" not in soil_data or "layers" not in soil_data["properties"]:
             return {"error": "Invalid soil data structure"}
         
-        layers = soil_data["properties"]["layers"]
-        
-        for layer in layers:
-            prop_name = layer.get("name")
-            if prop_name not in self.ag_properties:
-                continue
-            
-            # Find the specified depth
-            depths = layer.get("depths", [])
-            target_depth = None
-            
-            for depth in depths:
-                if depth.get("label") == depth_label:
-                    target_depth = depth
-                    break
-            
-            if target_depth and "values" in target_depth:
-                values = target_depth["values"]
-                conversion_factor = self.ag_properties[prop_name]["conversion"]
-                
-                # Helper function to safely convert values
-                def safe_convert(value):
-                    return value / conversion_factor if value is not None else None
-                
-                # Convert values from mapped units to target units (handle None values)
-                extracted[prop_name] = {
-                    "name": self.ag_properties[prop_name]["name"],
-                    "unit": self.ag_properties[prop_name]["unit"],
-                    "mean": safe_convert(values.get("mean")),
-                    "median": safe_convert(values.get("Q0.5")),
-                    "q05": safe_convert(values.get("Q0.05")),
-                    "q95": safe_convert(values.get("Q0.95")),
-                    "uncertainty": safe_convert(values.get("uncertainty"))
-                }
+        if depth_label not in SOIL_DEPTHS:
+            return {}
         
-        return extracted
+        return SoilProfile.from_soilgrids(soil_data).topsoil_dict(depth_label)
     
     def extract_all_depths(self, soil_data: Dict) -> Dict:
         """Extract values for all available depth layers"""
         if "properties" not in soil_data or "layers" not in soil_data["properties"]:
             return {"error": "Invalid soil data structure"}
         
-        all_depths = {}
-        layers = soil_data["properties"]["layers"]
-        
-        for layer in layers:
-            prop_name = layer.get("name")
-            if prop_name not in self.ag_properties:
-                continue
-            
-            all_depths[prop_name] = {
-                "name": self.ag_properties[prop_name]["name"],
-                "unit": self.ag_properties[prop_name]["unit"],
-                "depths": {}
-            }
-            
-            conversion_factor = self.ag_properties[prop_name]["conversion"]
-            
-            for depth in layer.get("depths", []):
-                depth_label = depth.get("label")
-                if "values" in depth:
-                    values = depth["values"]
-                    
-                    # Helper function to safely convert values
-                    def safe_convert(value):
-                        return value / conversion_factor if value is not None else None
-                    
-                    all_depths[prop_name]["depths"][depth_label] = {
-                        "mean": safe_convert(values.get("mean")),
-                        "median": safe_convert(values.get("Q0.5")),
-                        "range": f"{depth['range']['top_depth']}-{depth['range']['bottom_depth']} {depth['range']['unit_depth']}"
-                    }
-        
-        return all_depths
+        return SoilProfile.from_soilgrids(soil_data).all_depths_dict()
     
     def get_agricultural_summary(self, lat: float, lon: float, depth: str = "0-5cm") -> Dict:
         """Get a farmer-friendly summary of soil conditions"""
-        soil_data = self.get_soil_data(lat, lon)
+        if depth not in SOIL_DEPTHS:
+            return {"error": f"Unknown depth '{depth}'"}
+        
+        soil_data = self.get_soil_data(lat, lon, depths=[depth])
         
         if "error" in soil_data:
             return soil_data
         
-        topsoil = self.extract_topsoil_values(soil_data, depth)
+        if "properties" not in soil_data or "layers" not in soil_data["properties"]:
+            return {"error": "Invalid soil data structure"}
         
-        if "error" in topsoil:
-            return topsoil
+        # Parse once into the columnar profile; interpretation and crops are array predicates on it
+        profile = SoilProfile.from_soilgrids(soil_data)
         
         # Create agricultural interpretation
         summary = {
             "location": {"latitude": lat, "longitude": lon},
             "depth_analyzed": depth,
-            "soil_properties": topsoil,
-            "agricultural_interpretation": self._interpret_for_agriculture(topsoil),
-            "crop_suggestions": self._suggest_crops(topsoil)
+            "soil_properties": profile.topsoil_dict(depth),
+            "agricultural_interpretation": self._interpret_for_agriculture(profile, depth),
+            "crop_suggestions": self._suggest_crops(profile, depth)
         }
         
         return summary
     
-    def _interpret_for_agriculture(self, soil_props: Dict) -> Dict:
+    def get_agricultural_summaries(self, points: Points, depth: str = "0-5cm",
+                                   max_workers: int = 2) -> List[Dict]:
+        """Soil summaries for many farms at once, fetching each grid cell at most once and concurrently"""
+        return analyze_points(points, depth, store=self.store, properties=list(self.ag_properties),
+                              max_workers=max_workers)
+    
+    def _interpret_for_agriculture(self, profile: SoilProfile, depth: str = "0-5cm") -> Dict:
         """Provide agricultural interpretation of soil data"""
-        interpretation = {}
-        
-        # pH interpretation
-        if "phh2o" in soil_props and soil_props["phh2o"]["mean"] is not None:
-            ph = soil_props["phh2o"]["mean"]
-            if ph < 5.5:
-                interpretation["pH"] = "Acidic - may need liming for most crops"
-            elif ph > 7.5:
-                interpretation["pH"] = "Alkaline - may limit nutrient uptake"
-            else:
-                interpretation["pH"] = "Good pH range for most crops"
-        
-        # Organic matter interpretation
-        if "soc" in soil_props and soil_props["soc"]["mean"] is not None:
-            soc = soil_props["soc"]["mean"]
-            if soc < 10:
-                interpretation["organic_matter"] = "Low - add compost/organic fertilizer"
-            elif soc > 30:
-                interpretation["organic_matter"] = "Excellent organic matter content"
-            else:
-                interpretation["organic_matter"] = "Moderate organic matter levels"
-        
-        # Nitrogen interpretation
-        if "nitrogen" in soil_props and soil_props["nitrogen"]["mean"] is not None:
-            n = soil_props["nitrogen"]["mean"]
-            if n < 1.0:
-                interpretation["nitrogen"] = "Low - nitrogen fertilization needed"
-            elif n > 3.0:
-                interpretation["nitrogen"] = "High nitrogen content"
-            else:
-                interpretation["nitrogen"] = "Adequate nitrogen levels"
-        
-        # Texture interpretation
-        texture_props = ["clay", "sand", "silt"]
-        if all(prop in soil_props and soil_props[prop]["mean"] is not None for prop in texture_props):
-            clay = soil_props["clay"]["mean"]
-            sand = soil_props["sand"]["mean"]
-            silt = soil_props["silt"]["mean"]
-            
-            if clay > 40:
-                interpretation["texture"] = "Clay soil - good water retention, ensure drainage"
-            elif sand > 60:
-                interpretation["texture"] = "Sandy soil - good drainage, needs frequent watering"
-            else:
-                interpretation["texture"] = "Loamy soil - ideal for most crops"
-        
-        # Cation Exchange Capacity interpretation
-        if "cec" in soil_props and soil_props["cec"]["mean"] is not None:
-            cec = soil_props["cec"]["mean"]
-            if cec < 10:
-                interpretation["nutrient_retention"] = "Low - frequent fertilization needed"
-            elif cec > 25:
-                interpretation["nutrient_retention"] = "High - good nutrient holding capacity"
-            else:
-                interpretation["nutrient_retention"] = "Moderate nutrient retention"
-        
-        return interpretation
+        return profile.interpret(depth)
     
-    def _suggest_crops(self, soil_props: Dict) -> List[str]:
+    def _suggest_crops(self, profile: SoilProfile, depth: str = "0-5cm") -> List[str]:
         """Suggest suitable crops based on soil properties"""
-        suggestions = []
-        
-        # pH-based suggestions
-        if "phh2o" in soil_props and soil_props["phh2o"]["mean"] is not None:
-            ph = soil_props["phh2o"]["mean"]
-            if 6.0 <= ph <= 7.0:
-                suggestions.extend(["Rice", "Corn", "Tomatoes", "Lettuce", "Cabbage", "Beans"])
-            elif 5.5 <= ph < 6.0:
-                suggestions.extend(["Sweet potato", "Cassava", "Pineapple", "Potatoes"])
-            elif ph < 5.5:
-                suggestions.extend(["Blueberries", "Cranberries", "Azaleas"])
-            else:  # pH > 7.0
-                suggestions.extend(["Asparagus", "Spinach", "Beets", "Broccoli"])
-        
-        # Texture-based suggestions
-        texture_props = ["clay", "sand", "silt"]
-        if all(prop in soil_props and soil_props[prop]["mean"] is not None for prop in texture_props):
-            clay = soil_props["clay"]["mean"]
-            sand = soil_props["sand"]["mean"]
-            
-            if clay > 40:  # Clay soil
-                suggestions.extend(["Rice", "Wheat", "Soybeans", "Sugar cane"])
-            elif sand > 60:  # Sandy soil
-                suggestions.extend(["Carrots", "Radish", "Potatoes", "Peanuts", "Watermelon"])
-            else:  # Loamy soil
-                suggestions.extend(["Corn", "Beans", "Squash", "Eggplant", "Peppers"])
-        
-        # Organic matter based suggestions
-        if "soc" in soil_props and soil_props["soc"]["mean"] is not None:
-            soc = soil_props["soc"]["mean"]
-            if soc > 20:  # High organic matter
-                suggestions.extend(["Leafy greens", "Herbs", "Root vegetables"])
-        
-        return list(set(suggestions))  # Remove duplicates
+        return profile.suggest_crops(depth)
 
 # Comprehensive Agricultural Analysis Function
 def comprehensive_agricultural_analysis(city_name: str, lat: float = None, lon: float = None):
@@ -636,7 +484,7 @@ def quick_analysis(city_name: str):
         print(f"\n🌱 Attempting Soil Analysis...")
         extractor = SoilGridsExtractor()
         try:
-            soil_data = extractor.get_soil_data(lat, lon)
+            soil_data = extractor.get_soil_data(lat, lon, depths=["0-5cm"])
             if "error" not in soil_data:
                 topsoil = extractor.extract_topsoil_values(soil_data)
                 if "error" not in topsoil:
@@ -649,7 +497,7 @@ def quick_analysis(city_name: str):
                             print(f"• {prop_data['name']}: {prop_data['mean']:.2f} {prop_data['unit']}")
                     
                     # Show crop suggestions
-                    crops = extractor._suggest_crops(topsoil)
+                    crops = extractor._suggest_crops(SoilProfile.from_soilgrids(soil_data))
                     if crops:
                         print(f"\n🌾 Suggested Crops: {', '.join(crops[:6])}")
                 else:
@@ -1,200 +1,153 @@
+import argparse
 import json
 import requests
 from typing import Dict, List, Optional
 from ph_cities import CITY_CENTERS 
+from soil_batch import Points, analyze_points
+from soil_dataset import load_farm_csv
+from soil_profile import AG_PROPERTIES, SOIL_DEPTHS, SoilProfile
+from soil_store import SoilStore, get_default_store
+
+# Farmer-facing wording for each SoilProfile.classify code (low, mid, high)
+INTERPRETATION_MESSAGES = {
+    "pH": (
+        "Acidic - may need liming",
+        "Good pH range for most crops",
+        "Alkaline - may affect nutrient availability"
+    ),
+    "organic_matter": (
+        "Low - consider adding compost/organic matter",
+        "Moderate organic matter levels",
+        "High - excellent soil health"
+    ),
+    "nitrogen": (
+        "Low - may need nitrogen fertilization",
+        "Adequate nitrogen levels",
+        "High nitrogen content"
+    ),
+    "texture": (
+        "Clay soil - good water retention, may have drainage issues",
+        "Loamy soil - ideal for most crops",
+        "Sandy soil - good drainage, may need frequent irrigation"
+    )
+}
 
 class SoilGridsExtractor:
     """Extract agriculturally relevant soil data from SoilGrids API"""
     
-    def __init__(self):
-        # Define agriculturally important soil properties
-        self.ag_properties = {
-            'phh2o': {'name': 'Soil pH (H2O)', 'unit': 'pH units', 'conversion': 10},
-            'ocd': {'name': 'Organic Carbon Density', 'unit': 'hg/m³', 'conversion': 10},
-            'nitrogen': {'name': 'Total Nitrogen', 'unit': 'g/kg', 'conversion': 100},
-            'soc': {'name': 'Soil Organic Carbon', 'unit': 'g/kg', 'conversion': 10},
-            'cec': {'name': 'Cation Exchange Capacity', 'unit': 'cmol(c)/kg', 'conversion': 10},
-            'bdod': {'name': 'Bulk Density', 'unit': 'kg/dm³', 'conversion': 100},
-            'clay': {'name': 'Clay Content', 'unit': '%', 'conversion': 10},
-            'sand': {'name': 'Sand Content', 'unit': '%', 'conversion': 10},
-            'silt': {'name': 'Silt Content', 'unit': '%', 'conversion': 10},
-            'wv0010': {'name': 'Water Content at 10kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10},
-            'wv0033': {'name': 'Water Content at 33kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10},
-            'wv1500': {'name': 'Water Content at 1500kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10}
-        }
+    def __init__(self, store: Optional[SoilStore] = None):
+        # Soil values are static per grid cell, so lookups go through a persistent store
+        self.store = store or get_default_store()
+        
+        # Agriculturally important soil properties, shared with the columnar SoilProfile
+        self.ag_properties = AG_PROPERTIES
     
-    def get_soil_data(self, lat: float, lon: float) -> Dict:
-        """Fetch soil data from SoilGrids API"""
-        url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}"
+    def get_soil_data(self, lat: float, lon: float, depths: Optional[List[str]] = None,
+                      values: Optional[List[str]] = None, properties: Optional[List[str]] = None) -> Dict:
+        """Fetch soil data for the grid cell containing (lat, lon), served from the soil store when known
         
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": f"API request failed: {str(e)}"}
+        Only the requested properties (default: ag_properties), depths and statistics are queried.
+        """
+        return self.store.fetch(lat, lon, properties=properties or list(self.ag_properties),
+                                depths=depths, values=values)
     
     def extract_topsoil_values(self, soil_data: Dict, depth_label: str = "0-5cm") -> Dict:
         """Extract values for a specific depth layer (default: topsoil 0-5cm)"""
-        extracted = {}
-        
         if "properties" not in soil_data or "layers" not in soil_data["properties"]:
             return {"error": "Invalid soil data structure"}
         
-        layers = soil_data["properties"]["layers"]
-        
-        for layer in layers:
-            prop_name = layer.get("name")
-            if prop_name not in self.ag_properties:
-                continue
-            
-            # Find the specified depth
-            depths = layer.get("depths", [])
-            target_depth = None
-            
-            for depth in depths:
-                if depth.get("label") == depth_label:
-                    target_depth = depth
-                    break
-            
-            if target_depth and "values" in target_depth:
-                values = target_depth["values"]
-                conversion_factor = self.ag_properties[prop_name]["conversion"]
-                
-                # Helper function to safely convert values
-                def safe_convert(value):
-                    return value / conversion_factor if value is not None else None
-                
-                # Convert values from mapped units to target units (handle None values)
-                extracted[prop_name] = {
-                    "name": self.ag_properties[prop_name]["name"],
-                    "unit": self.ag_properties[prop_name]["unit"],
-                    "mean": safe_convert(values.get("mean")),
-                    "median": safe_convert(values.get("Q0.5")),
-                    "q05": safe_convert(values.get("Q0.05")),
-                    "q95": safe_convert(values.get("Q0.95")),
-                    "uncertainty": safe_convert(values.get("uncertainty"))
-                }
+        if depth_label not in SOIL_DEPTHS:
+            return {}
         
-        return extracted
+        return SoilProfile.from_soilgrids(soil_data).topsoil_dict(depth_label)
     
     def extract_all_depths(self, soil_data: Dict) -> Dict:
         """Extract values for all available depth layers"""
         if "properties" not in soil_data or "layers" not in soil_data["properties"]:
             return {"error": "Invalid soil data structure"}
         
-        all_depths = {}
-        layers = soil_data["properties"]["layers"]
-        
-        for layer in layers:
-            prop_name = layer.get("name")
-            if prop_name not in self.ag_properties:
-                continue
-            
-            all_depths[prop_name] = {
-                "name": self.ag_properties[prop_name]["name"],
-                "unit": self.ag_properties[prop_name]["unit"],
-                "depths": {}
-            }
-            
-            conversion_factor = self.ag_properties[prop_name]["conversion"]
-            
-            for depth in layer.get("depths", []):
-                depth_label = depth.get("label")
-                if "values" in depth:
-                    values = depth["values"]
-                    
-                    # Helper function to safely convert values
-                    def safe_convert(value):
-                        return value / conversion_factor if value is not None else None
-                    
-                    all_depths[prop_name]["depths"][depth_label] = {
-                        "mean": safe_convert(values.get("mean")),
-                        "median": safe_convert(values.get("Q0.5")),
-                        "range": f"{depth['range']['top_depth']}-{depth['range']['bottom_depth']} {depth['range']['unit_depth']}"
-                    }
-        
-        return all_depths
+        return SoilProfile.from_soilgrids(soil_data).all_depths_dict()
     
     def get_agricultural_summary(self, lat: float, lon: float, depth: str = "0-5cm") -> Dict:
         """Get a farmer-friendly summary of soil conditions"""
-        soil_data = self.get_soil_data(lat, lon)
+        if depth not in SOIL_DEPTHS:
+            return {"error": f"Unknown depth '{depth}'"}
+        
+        soil_data = self.get_soil_data(lat, lon, depths=[depth])
         
         if "error" in soil_data:
             return soil_data
         
-        topsoil = self.extract_topsoil_values(soil_data, depth)
+        if "properties" not in soil_data or "layers" not in soil_data["properties"]:
+            return {"error": "Invalid soil data structure"}
         
-        if "error" in topsoil:
-            return topsoil
+        profile = SoilProfile.from_soilgrids(soil_data)
         
         # Create agricultural interpretation
         summary = {
             "location": {"latitude": lat, "longitude": lon},
             "depth_analyzed": depth,
-            "soil_properties": topsoil,
-            "agricultural_interpretation": self._interpret_for_agriculture(topsoil)
+            "soil_properties": profile.topsoil_dict(depth),
+            "agricultural_interpretation": self._interpret_for_agriculture(profile, depth)
         }
         
         return summary
     
-    def _interpret_for_agriculture(self, soil_props: Dict) -> Dict:
+    def get_agricultural_summaries(self, points: Points, depth: str = "0-5cm",
+                                   max_workers: int = 2) -> List[Dict]:
+        """Soil summaries for many farms at once, fetching each grid cell at most once and concurrently"""
+        return analyze_points(points, depth, store=self.store, properties=list(self.ag_properties), messages=INTERPRETATION_MESSAGES,
+                              max_workers=max_workers)
+    
+    def _interpret_for_agriculture(self, profile: SoilProfile, depth: str = "0-5cm") -> Dict:
         """Provide agricultural interpretation of soil data"""
-        interpretation = {}
-        
-        # pH interpretation
-        if "phh2o" in soil_props and soil_props["phh2o"]["mean"] is not None:
-            ph = soil_props["phh2o"]["mean"]
-            if ph < 5.5:
-                interpretation["pH"] = "Acidic - may need liming"
-            elif ph > 7.5:
-                interpretation["pH"] = "Alkaline - may affect nutrient availability"
-            else:
-                interpretation["pH"] = "Good pH range for most crops"
-        
-        # Organic matter interpretation
-        if "soc" in soil_props and soil_props["soc"]["mean"] is not None:
-            soc = soil_props["soc"]["mean"]
-            if soc < 10:
-                interpretation["organic_matter"] = "Low - consider adding compost/organic matter"
-            elif soc > 30:
-                interpretation["organic_matter"] = "High - excellent soil health"
-            else:
-                interpretation["organic_matter"] = "Moderate organic matter levels"
-        
-        # Nitrogen interpretation
-        if "nitrogen" in soil_props and soil_props["nitrogen"]["mean"] is not None:
-            n = soil_props["nitrogen"]["mean"]
-            if n < 1.0:
-                interpretation["nitrogen"] = "Low - may need nitrogen fertilization"
-            elif n > 3.0:
-                interpretation["nitrogen"] = "High nitrogen content"
-            else:
-                interpretation["nitrogen"] = "Adequate nitrogen levels"
-        
-        # Texture interpretation
-        texture_props = ["clay", "sand", "silt"]
-        if all(prop in soil_props and soil_props[prop]["mean"] is not None for prop in texture_props):
-            clay = soil_props["clay"]["mean"]
-            sand = soil_props["sand"]["mean"]
-            silt = soil_props["silt"]["mean"]
-            
-            if clay > 40:
-                interpretation["texture"] = "Clay soil - good water retention, may have drainage issues"
-            elif sand > 60:
-                interpretation["texture"] = "Sandy soil - good drainage, may need frequent irrigation"
-            else:
-                interpretation["texture"] = "Loamy soil - ideal for most crops"
-        
-        return interpretation
+        return profile.interpret(depth, INTERPRETATION_MESSAGES)
+
+def batch_analysis(extractor: SoilGridsExtractor, csv_path: str, output: Optional[str] = None,
+                   workers: int = 2):
+    """Analyze every farm in a CSV (name, lat, lon) and write the summaries as JSON"""
+    farms = load_farm_csv(csv_path)
+    print(f"🌱 Batch soil analysis for {len(farms)} farms...")
+    
+    try:
+        results = extractor.get_agricultural_summaries(farms, max_workers=workers)
+    except requests.RequestException as e:
+        print(f"❌ SoilGrids request failed: {e}")
+        print("   Cells fetched so far are kept in the soil store; rerun to resume.")
+        raise SystemExit(1)
+    
+    for result in results:
+        if "error" in result:
+            print(f"❌ {result['name']}: {result['error']}")
+        else:
+            ph = result["soil_properties"].get("phh2o", {}).get("mean")
+            ph_text = f"pH {ph:.1f}" if ph is not None else "pH n/a"
+            print(f"✅ {result['name']}: {ph_text}, crops: {', '.join(result['crop_suggestions'][:4])}")
+    
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Results written to {output}")
+    
+    return results
 
 # Example usage and testing
 def main():
     """Example usage of SoilGridsExtractor"""
+    parser = argparse.ArgumentParser(description="SoilGrids agricultural soil analysis")
+    parser.add_argument("--batch", metavar="CSV", help="Analyze all farms in a CSV with name, lat, lon columns")
+    parser.add_argument("--output", help="Write batch results to this JSON file")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Concurrent SoilGrids requests (the rate follows SOILGRIDS_RATE_PER_SECOND, ~5/minute)")
+    args = parser.parse_args()
     
     # Initialize the extractor
     extractor = SoilGridsExtractor()
     
+    if args.batch:
+        batch_analysis(extractor, args.batch, args.output, args.workers)
+        return
+    
     # Show available cities
     citylist = input("Do you want to see all the Philippine Cities? (y/n) ").strip().lower()
     if citylist == "y":
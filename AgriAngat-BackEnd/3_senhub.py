@@ -1,292 +1,212 @@
-import folium
-import numpy as np
-from typing import Dict
-from sentinelhub import (
-    SHConfig, MimeType, CRS, BBox, SentinelHubRequest, DataCollection, bbox_to_dimensions
-)
+import argparse
+from typing import Dict, List
 from ph_cities import CITY_CENTERS
-
-
-config = SHConfig()
-config.instance_id = ""
-config.sh_client_id = ""
-config.sh_client_secret = ""
-
-# Show available cities
-citylist = input("Do you want to see all the Philippine Cities? (y/n) ").strip().lower()
-if citylist == "y":
-    print("🏙️ Available Philippine Cities:")
-    print("-" * 40)
-    for city in sorted(CITY_CENTERS):
-        print(f"  • {city.title()}")
-    print()
-
-user_city = input("Enter a Philippine city: ").strip().lower()
-
-# Check if the city exists in our database
-if user_city not in CITY_CENTERS:
-    print(f"❌ City '{user_city.title()}' not found in our database.")
-    print("Please check the spelling or choose from the available cities above.")
-    exit()  # use exit() in a script instead of return
-
-# Get coordinates from the dictionary
-lat, lon = CITY_CENTERS[user_city]
-
-# Define a bounding box around the city (±0.01 degrees as an example)
-bbox_coords = [lon - 0.01, lat - 0.01, lon + 0.01, lat + 0.01]
-
-# Use BBox with CRS
-bbox = BBox(bbox=bbox_coords, crs=CRS.WGS84)
-
-print(f"Using coordinates for {user_city.title()}: {lat}, {lon}")
-print(f"Bounding box set to: {bbox_coords} with CRS: {CRS.WGS84}")
-
-# 🔹 Modified evalscript to get raw NDVI values (not colored)
-evalscript_ndvi = """
-//VERSION=3
-function setup() {
-  return {
-    input: ["B04", "B08", "dataMask"],
-    output: { 
-      bands: 1,
-      sampleType: "FLOAT32"
-    }
-  };
-}
-
-function evaluatePixel(sample) {
-  // Calculate NDVI
-  let ndvi = (sample.B08 - sample.B04) / (sample.B08 + sample.B04);
-  
-  // Handle invalid pixels
-  if (sample.dataMask == 0 || sample.B08 + sample.B04 == 0) {
-    return [NaN];
-  }
-  
-  return [ndvi];
-}
-"""
-
-# 🔹 Colored evalscript for visualization (your original)
-evalscript_colored = """
-//VERSION=3
-function setup() {
-  return {
-    input: ["B04", "B08", "dataMask"],
-    output: { 
-      bands: 4,
-      sampleType: "AUTO"
-    }
-  };
-}
-
-Standard NDVI Color Scheme
-Code 
-Here's the updated NDVI coloring scheme that follows more typical remote sensing standards:
-
-Key Changes:
-
-Water bodies: Proper blue gradient from dark blue (deep water) to light blue (shallow water/wet areas)
-Bare soil: Brown/tan colors instead of red, which is more realistic for soil
-Vegetation gradient: Smooth transition from yellow-brown (sparse) → yellow-green → light green → dark green
-Extended range: Added more granular thresholds up to 0.8+ for very dense vegetation
-More natural colors: The progression now follows the typical "blue-brown-yellow-green" NDVI color ramp used in most remote sensing applications
-This color scheme will make your NDVI maps more intuitive and comparable to standard vegetation health maps used in agriculture, forestry, and environmental monitoring.
-
-function evaluatePixel(sample) {
-  // Calculate NDVI
-  let ndvi = (sample.B08 - sample.B04) / (sample.B08 + sample.B04);
-  
-  // Handle invalid pixels
-  if (sample.dataMask == 0 || sample.B08 + sample.B04 == 0) {
-    return [0, 0, 0, 0]; // transparent
-  }
-  
-  // Standard NDVI color mapping following typical remote sensing conventions
-  let r, g, b;
-  
-  if (ndvi < -0.2) {
-    // Deep water - dark blue
-    r = 0.0; g = 0.0; b = 0.4;
-  } else if (ndvi < -0.1) {
-    // Shallow water - blue
-    r = 0.0; g = 0.4; b = 0.8;
-  } else if (ndvi < 0.0) {
-    // Wet soil/sand - light blue
-    r = 0.7; g = 0.8; b = 1.0;
-  } else if (ndvi < 0.1) {
-    // Bare soil/rock - brown/tan
-    r = 0.8; g = 0.7; b = 0.5;
-  } else if (ndvi < 0.2) {
-    // Very sparse vegetation - light brown/beige
-    r = 0.9; g = 0.8; b = 0.6;
-  } else if (ndvi < 0.3) {
-    // Sparse vegetation - yellow-brown
-    r = 0.9; g = 0.9; b = 0.3;
-  } else if (ndvi < 0.4) {
-    // Moderate vegetation - yellow-green
-    r = 0.6; g = 0.9; b = 0.2;
-  } else if (ndvi < 0.5) {
-    // Good vegetation - light green
-    r = 0.3; g = 0.8; b = 0.2;
-  } else if (ndvi < 0.6) {
-    // Dense vegetation - medium green
-    r = 0.1; g = 0.7; b = 0.1;
-  } else if (ndvi < 0.8) {
-    // Very dense vegetation - dark green
-    r = 0.0; g = 0.6; b = 0.0;
-  } else {
-    // Extremely dense vegetation - very dark green
-    r = 0.0; g = 0.4; b = 0.0;
-  }
-  
-  return [r, g, b, 1.0]; // RGB + Alpha
-}
-"""
-
-from datetime import datetime, timedelta
-
-# Get recent imagery (last 30 days)
-end_date = datetime.now()
-start_date = end_date - timedelta(days=30)
-
-# 🔹 Request for raw NDVI values
-request_ndvi = SentinelHubRequest(
-    evalscript=evalscript_ndvi,
-    input_data=[
-        SentinelHubRequest.input_data(
-            data_collection=DataCollection.SENTINEL2_L2A,
-            time_interval=(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')),
-            mosaicking_order='leastCC'
-        )
-    ],
-    responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
-    bbox=bbox,
-    size=bbox_to_dimensions(bbox, resolution=10),
-    config=config
+from ndvi_analysis import (
+    BASELINE_COLUMNS, DEFAULT_HALF_SIZE, DEFAULT_RESOLUTION, DEFAULT_WINDOW_DAYS, NDVI_COMPOSITE,
+    NDVI_MAX_WORKERS, PARCEL_COLUMNS, SERIES_COLUMNS, analyze_location_series, analyze_locations,
+    analyze_parcels, city_bbox, city_locations, monitor_parcels, parse_bbox, print_ndvi_report,
+    request_ndvi, save_ndvi_map, sh_config, sh_configured, write_stats_table
 )
-
-# 🔹 Request for colored visualization
-request_colored = SentinelHubRequest(
-    evalscript=evalscript_colored,
-    input_data=[
-        SentinelHubRequest.input_data(
-            data_collection=DataCollection.SENTINEL2_L2A,
-            time_interval=(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')),
-            mosaicking_order='leastCC'
-        )
-    ],
-    responses=[SentinelHubRequest.output_response("default", MimeType.PNG)],
-    bbox=bbox,
-    size=bbox_to_dimensions(bbox, resolution=10),
-    config=config
-)
-
-print("🛰️ Requesting NDVI data from Sentinel Hub...")
-
-try:
-    # Get raw NDVI values
-    ndvi_data = request_ndvi.get_data()[0]
-    ndvi_values = ndvi_data  # Extract first band
+from ndvi_baseline import ANOMALY_Z, ParcelBaseline
+from farm_registry import get_default_registry
+from ndvi_composite import COMPOSITE_METHODS
+from ndvi_timeseries import DEFAULT_STEP_DAYS
+from ndvi_zonal import Parcel, group_parcels, load_parcels
+from ndvi_stats import summarize_ndvi
+
+
+def interactive_analysis():
+    """Original one-city flow: pick a city, print the NDVI summary, save the map"""
+    # Show available cities
+    citylist = input("Do you want to see all the Philippine Cities? (y/n) ").strip().lower()
+    if citylist == "y":
+        print("🏙️ Available Philippine Cities:")
+        print("-" * 40)
+        for city in sorted(CITY_CENTERS):
+            print(f"  • {city.title()}")
+        print()
     
-    # Get colored image for visualization
-    ndvi_image = request_colored.get_data()[0]
+    user_city = input("Enter a Philippine city: ").strip().lower()
     
-    print("✅ Successfully retrieved NDVI data!")
-    print(f"📊 Image dimensions: {ndvi_values.shape}")
+    # Check if the city exists in our database
+    if user_city not in CITY_CENTERS:
+        print(f"❌ City '{user_city.title()}' not found in our database.")
+        print("Please check the spelling or choose from the available cities above.")
+        return
     
-    # 🔹 CALCULATE KEY NDVI STATISTICS
-    print("\n" + "="*50)
-    print("📈 MOST IMPORTANT NDVI VALUES (TEXT SUMMARY)")
-    print("="*50)
+    # Get coordinates from the dictionary
+    lat, lon = CITY_CENTERS[user_city]
+    bbox_coords = city_bbox(lat, lon)
     
-    # Remove NaN values for statistics
-    valid_ndvi = ndvi_values[~np.isnan(ndvi_values)]
+    print(f"Using coordinates for {user_city.title()}: {lat}, {lon}")
+    print(f"Bounding box set to: {list(bbox_coords)} with CRS: WGS84")
+    print("🛰️ Requesting NDVI data from Sentinel Hub...")
     
-    if len(valid_ndvi) > 0:
-        # Basic statistics
-        ndvi_mean = np.mean(valid_ndvi)
-        ndvi_median = np.median(valid_ndvi)
-        ndvi_std = np.std(valid_ndvi)
-        ndvi_min = np.min(valid_ndvi)
-        ndvi_max = np.max(valid_ndvi)
+    try:
+        ndvi_values = request_ndvi(bbox_coords)
         
-        print(f"🎯 OVERALL HEALTH SCORE: {ndvi_mean:.3f}")
-        print(f"   Mean NDVI: {ndvi_mean:.3f}")
-        print(f"   Median NDVI: {ndvi_median:.3f}")
-        print(f"   Standard Deviation: {ndvi_std:.3f}")
-        print(f"   Range: {ndvi_min:.3f} to {ndvi_max:.3f}")
+        print("✅ Successfully retrieved NDVI data!")
+        print(f"📊 Image dimensions: {ndvi_values.shape}")
         
-        # Percentiles
-        p25 = np.percentile(valid_ndvi, 25)
-        p75 = np.percentile(valid_ndvi, 75)
-        p90 = np.percentile(valid_ndvi, 90)
-        p10 = np.percentile(valid_ndvi, 10)
+        print_ndvi_report(summarize_ndvi(ndvi_values))
         
-        print(f"\n📊 KEY PERCENTILES:")
-        print(f"   90th percentile (healthiest areas): {p90:.3f}")
-        print(f"   75th percentile: {p75:.3f}")
-        print(f"   25th percentile: {p25:.3f}")
-        print(f"   10th percentile (least healthy): {p10:.3f}")
+        # Create visualization map
+        save_ndvi_map(ndvi_values, bbox_coords, f"{user_city}.html")
         
-        # Vegetation coverage analysis
-        water_bare = np.sum(valid_ndvi < 0.1)
-        sparse_veg = np.sum((valid_ndvi >= 0.1) & (valid_ndvi < 0.3))
-        moderate_veg = np.sum((valid_ndvi >= 0.3) & (valid_ndvi < 0.5))
-        dense_veg = np.sum(valid_ndvi >= 0.5)
-        total_pixels = len(valid_ndvi)
+        print(f"\n✅ NDVI map saved as {user_city}.html (tiles in {user_city}_tiles/)")
+        print("="*50)
         
-        print(f"\n🌱 VEGETATION COVERAGE BREAKDOWN:")
-        print(f"   Water/Bare soil (< 0.1): {water_bare/total_pixels*100:.1f}% ({water_bare:,} pixels)")
-        print(f"   Sparse vegetation (0.1-0.3): {sparse_veg/total_pixels*100:.1f}% ({sparse_veg:,} pixels)")
-        print(f"   Moderate vegetation (0.3-0.5): {moderate_veg/total_pixels*100:.1f}% ({moderate_veg:,} pixels)")
-        print(f"   Dense vegetation (≥ 0.5): {dense_veg/total_pixels*100:.1f}% ({dense_veg:,} pixels)")
-        
-        # Health interpretation
-        print(f"\n🏥 VEGETATION HEALTH INTERPRETATION:")
-        if ndvi_mean > 0.5:
-            health_status = "EXCELLENT - Dense, healthy vegetation"
-        elif ndvi_mean > 0.3:
-            health_status = "GOOD - Moderate to dense vegetation"
-        elif ndvi_mean > 0.1:
-            health_status = "FAIR - Sparse vegetation, may need attention"
+    except Exception as e:
+        print(f"❌ Error retrieving data: {e}")
+        raise
+
+
+def batch_analysis(locations: Dict, output: str, map_dir=None, workers: int = NDVI_MAX_WORKERS, **request_options):
+    """Analyze every location concurrently and write one statistics table (CSV)"""
+    print(f"🛰️ NDVI analysis for {len(locations)} locations ({workers} concurrent requests)...")
+    
+    rows = analyze_locations(locations, map_dir=map_dir, max_workers=workers, **request_options)
+    
+    for row in rows:
+        if row.get("error"):
+            print(f"❌ {row['name']}: {row['error']}")
+        elif row.get("mean") is None:
+            print(f"⚠️  {row['name']}: no valid NDVI pixels")
         else:
-            health_status = "POOR - Very little vegetation, mostly bare soil/water"
-        
-        print(f"   Overall Status: {health_status}")
-        
-        # Hotspot analysis (areas of concern and excellence)
-        if np.sum(valid_ndvi < 0.1) > total_pixels * 0.2:  # More than 20% low NDVI
-            print(f"   ⚠️  CONCERN: {np.sum(valid_ndvi < 0.1)/total_pixels*100:.1f}% of area has very low vegetation")
-        
-        if np.sum(valid_ndvi > 0.6) > total_pixels * 0.1:  # More than 10% very high NDVI
-            print(f"   ✨ EXCELLENCE: {np.sum(valid_ndvi > 0.6)/total_pixels*100:.1f}% of area has excellent vegetation")
-            
-        print(f"\n🔢 TECHNICAL DETAILS:")
-        print(f"   Total valid pixels: {total_pixels:,}")
-        print(f"   Invalid/masked pixels: {np.sum(np.isnan(ndvi_values)):,}")
-        print(f"   Data coverage: {total_pixels/(ndvi_values.size)*100:.1f}%")
-        
-    else:
-        print("❌ No valid NDVI data found in the selected area.")
+            print(f"✅ {row['name']}: mean NDVI {row['mean']:.3f}, {row['health_status']}")
     
-    # Create visualization map
-    map_center = [lat, lon]
-    m = folium.Map(location=map_center, zoom_start=14)
+    write_stats_table(rows, output)
+    failed = sum(1 for row in rows if row.get("error"))
+    print(f"\n📄 Statistics for {len(rows) - failed}/{len(rows)} locations written to {output}")
+    return rows
+
+
+def series_analysis(locations: Dict, output: str, workers: int = NDVI_MAX_WORKERS, **series_options):
+    """Per-pixel NDVI trends over a season for every location, written to one trend table (CSV)"""
+    print(f"📈 NDVI time series for {len(locations)} locations ({workers} concurrent requests)...")
+    
+    rows = analyze_locations(locations, max_workers=workers, analyzer=analyze_location_series, **series_options)
     
-    folium.raster_layers.ImageOverlay(
-        image=ndvi_image,
-        bounds=[[bbox_coords[1], bbox_coords[0]], [bbox_coords[3], bbox_coords[2]]],  # [[min_lat, min_lon], [max_lat, max_lon]]
-        opacity=0.7,
-        name="NDVI"
-    ).add_to(m)
+    for row in rows:
+        if row.get("error"):
+            print(f"❌ {row['name']}: {row['error']}")
+        elif row.get("meanSlopePer30Days") is None:
+            print(f"⚠️  {row['name']}: not enough cloud-free dates for a trend")
+        else:
+            print(f"✅ {row['name']}: {row['meanSlopePer30Days']:+.3f} NDVI/30 days, "
+                  f"{row['greeningPct']:.0f}% greening, {row['degradingPct']:.0f}% degrading, peak {row['peakDate']}")
+    
+    write_stats_table(rows, output, SERIES_COLUMNS)
+    failed = sum(1 for row in rows if row.get("error"))
+    print(f"\n📄 Trends for {len(rows) - failed}/{len(rows)} locations written to {output}")
+    return rows
+
 
-    folium.LayerControl().add_to(m)
-    m.save(f"{user_city}.html")
+def parcel_analysis(parcels: List[Parcel], output: str, workers: int = NDVI_MAX_WORKERS,
+                    baseline: bool = False, **request_options):
+    """Per-farm NDVI over parcel polygons, written to one table (CSV)
+
+    With baseline, each farm is also scored against its own NDVI for this month in earlier runs.
+    """
+    print(f"🌾 Parcel NDVI for {len(parcels)} farms in {len(group_parcels(parcels))} raster requests...")
+    
+    if baseline:
+        rows = monitor_parcels(parcels, ParcelBaseline(), max_workers=workers, **request_options)
+    else:
+        rows = analyze_parcels(parcels, max_workers=workers, **request_options)
     
-    print(f"\n✅ NDVI map saved as {user_city}.html")
-    print("="*50)
+    for row in rows:
+        if row.get("error"):
+            print(f"❌ {row['id']}: {row['error']}")
+        elif row.get("mean") is None:
+            print(f"⚠️  {row['id']}: no cloud-free pixels inside the parcel")
+        else:
+            print(f"✅ {row['id']}: mean NDVI {row['mean']:.3f} over {row['validPixels']:,} pixels, {row['healthStatus']}")
+        if row.get("anomaly"):
+            print(f"🚨 {row['id']}: {-row['zScore']:.1f}σ below its usual {row['baselineMean']:.3f} for this month")
     
-except Exception as e:
-    print(f"❌ Error retrieving data: {e}")
-    raise
\ No newline at end of file
+    write_stats_table(rows, output, PARCEL_COLUMNS + (BASELINE_COLUMNS if baseline else []))
+    failed = sum(1 for row in rows if row.get("error"))
+    print(f"\n📄 Statistics for {len(rows) - failed}/{len(rows)} parcels written to {output}")
+    if baseline:
+        anomalies = sum(1 for row in rows if row.get("anomaly"))
+        print(f"🚨 {anomalies} parcel(s) more than {ANOMALY_Z:g}σ below their monthly baseline")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentinel-2 NDVI vegetation analysis")
+    parser.add_argument("cities", nargs="*", help="Philippine cities to analyze (omit for the interactive prompt)")
+    parser.add_argument("--all-cities", action="store_true", help="Analyze every city in ph_cities (weekly sweep)")
+    parser.add_argument("--bbox", action="append", default=[], metavar="NAME=MIN_LON,MIN_LAT,MAX_LON,MAX_LAT",
+                        help="Extra area to analyze; may be repeated")
+    parser.add_argument("--parcels", metavar="GEOJSON", help="Per-farm NDVI inside these parcel polygons")
+    parser.add_argument("--registry", nargs="?", const="", metavar="MIN_LON,MIN_LAT,MAX_LON,MAX_LAT",
+                        help="Per-farm NDVI for the farm polygons in the farm registry, optionally only inside a bbox")
+    parser.add_argument("--baseline", action="store_true",
+                        help="With --parcels or --registry: score farms against their monthly NDVI baseline, "
+                             "then update it (a repeat run for the same window is not counted twice)")
+    parser.add_argument("--output", default="ndvi_stats.csv", help="Statistics table for all locations")
+    parser.add_argument("--maps", metavar="DIR",
+                        help="Also save an NDVI map per location in this directory (snapshot mode only)")
+    parser.add_argument("--workers", type=int, default=NDVI_MAX_WORKERS, help="Concurrent Sentinel Hub requests")
+    parser.add_argument("--half-size", type=float, default=DEFAULT_HALF_SIZE, help="Degrees around each city center")
+    parser.add_argument("--days", type=int, default=DEFAULT_WINDOW_DAYS, help="Imagery window in days")
+    parser.add_argument("--resolution", type=int, default=DEFAULT_RESOLUTION, help="Meters per pixel")
+    parser.add_argument("--composite", choices=COMPOSITE_METHODS, default=NDVI_COMPOSITE,
+                        help="Mask clouds with the scene classification and composite every date locally")
+    parser.add_argument("--no-cache", action="store_true", help="Always download fresh rasters from Sentinel Hub")
+    parser.add_argument("--series", type=int, metavar="DAYS",
+                        help="Trend mode: one raster per --step-days over the last DAYS days instead of one snapshot")
+    parser.add_argument("--step-days", type=int, default=DEFAULT_STEP_DAYS, help="Interval per raster in trend mode")
+    args = parser.parse_args()
+    if args.series and args.maps:
+        parser.error("--maps draws a single snapshot per location and cannot be combined with --series")
+    
+    if not sh_configured(sh_config()):
+        print("⚠️  Sentinel Hub credentials missing: set CONFIG.SH_CLIENT_ID and CONFIG.SH_CLIENT_SECRET in .env")
+    
+    if args.parcels or args.registry is not None:
+        if args.parcels:
+            parcels = load_parcels(args.parcels)
+        else:
+            registry = get_default_registry()
+            try:
+                farms = registry.in_bbox(*parse_bbox(args.registry)) if args.registry else registry.all()
+            except ValueError as e:
+                parser.error(str(e))
+            parcels = registry.parcels(farms)
+            if not parcels:
+                print("⚠️  No farm polygons in the registry" + (" inside that bbox" if args.registry else ""))
+                return
+        parcel_analysis(parcels, args.output, args.workers, args.baseline, window_days=args.days,
+                        resolution=args.resolution, use_cache=not args.no_cache,
+                        composite=args.composite)
+        return
+    
+    if not (args.cities or args.all_cities or args.bbox):
+        interactive_analysis()
+        return
+    
+    try:
+        locations = city_locations(sorted(CITY_CENTERS) if args.all_cities else args.cities, args.half_size)
+        for spec in args.bbox:
+            name, _, coords = spec.partition("=")
+            if not coords:
+                raise ValueError(f"--bbox '{spec}' must be NAME=MIN_LON,MIN_LAT,MAX_LON,MAX_LAT")
+            locations[name.strip()] = parse_bbox(coords)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.series:
+        series_analysis(locations, args.output, args.workers, season_days=args.series,
+                        step_days=args.step_days, resolution=args.resolution, use_cache=not args.no_cache,
+                        composite=args.composite)
+    else:
+        batch_analysis(locations, args.output, args.maps, args.workers,
+                       window_days=args.days, resolution=args.resolution, use_cache=not args.no_cache,
+                       composite=args.composite)
+
+
+if __name__ == "__main__":
+    main()
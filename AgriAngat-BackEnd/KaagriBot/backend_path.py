@@ -0,0 +1,12 @@
+"""
+Makes the shared AgriAngat-BackEnd modules (ndvi_stats, ndvi_zonal, ...) importable
+from the KaagriBot scripts, which run from this folder. Import it before any backend module.
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
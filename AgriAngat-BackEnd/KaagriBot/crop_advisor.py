@@ -15,12 +15,17 @@ from sentinelhub import (
     SHConfig, MimeType, CRS, BBox, SentinelHubRequest, DataCollection, bbox_to_dimensions
 )
 import json
+import numpy as np
 import pandas as pd
 import chromadb
 from sentence_transformers import SentenceTransformer
 
+from backend_path import BACKEND_DIR
+from ndvi_stats import summarize_ndvi
+from ndvi_zonal import parse_parcels, rasterize_parcels
+
 # Load environment variables
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+load_dotenv(os.path.join(BACKEND_DIR, '.env'))
 
 # Check for CUDA availability (single check)
 try:
@@ -366,15 +371,30 @@ class EnvironmentalDataFetcher:
         self.sentinel_instance_id = os.getenv('CONFIG.INSTANCE_ID')
         self.default_lat = float(os.getenv('DEFAULT_LOCATION_LAT', '14.631044'))
         self.default_lon = float(os.getenv('DEFAULT_LOCATION_LON', '121.240553'))
+        self.default_parcel = self._load_parcel(os.getenv('FARM_PARCEL_PATH'))
+
+    @staticmethod
+    def _load_parcel(path: str = None) -> Dict:
+        """GeoJSON outline of the farm, or None to average the whole bbox around the default location"""
+        if not path:
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring FARM_PARCEL_PATH {path}: {e}")
+            return None
         
     def fetch_soil_ph(self, lat: float = None, lon: float = None) -> float:
         """Fetch soil pH from SoilGrids API"""
         try:
             lat = lat or self.default_lat
             lon = lon or self.default_lon
-            url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}"
+            url = "https://rest.isric.org/soilgrids/v2.0/properties/query"
+            # Only the topsoil pH mean is used, so skip every other layer, depth and quantile
+            params = {'lon': lon, 'lat': lat, 'property': 'phh2o', 'depth': '0-5cm', 'value': 'mean'}
             
-            response = requests.get(url, timeout=30)
+            response = requests.get(url, params=params, timeout=30)
             response.raise_for_status()
             data = response.json()
             
@@ -425,8 +445,8 @@ class EnvironmentalDataFetcher:
             return {'rainfall': DEFAULT_ENV_DATA['rainfall'], 
                    'temperature': DEFAULT_ENV_DATA['temperature']}
     
-    def fetch_ndvi(self, lat: float = None, lon: float = None) -> float:
-        """Fetch NDVI from Sentinel Hub"""
+    def fetch_ndvi(self, lat: float = None, lon: float = None, parcel: Dict = None) -> float:
+        """Fetch NDVI from Sentinel Hub; with a GeoJSON farm parcel only pixels inside it count"""
         try:
             if not all([self.sentinel_client_id, self.sentinel_client_secret, self.sentinel_instance_id]):
                 logger.info("Sentinel Hub credentials not configured")
@@ -441,7 +461,12 @@ class EnvironmentalDataFetcher:
             config.sh_client_secret = self.sentinel_client_secret
             
             bbox_size = 0.01
-            bbox = BBox(bbox=[lon - bbox_size, lat - bbox_size, lon + bbox_size, lat + bbox_size], crs=CRS.WGS84)
+            bbox_coords = [lon - bbox_size, lat - bbox_size, lon + bbox_size, lat + bbox_size]
+            parcels = parse_parcels(parcel) if parcel else None
+            if parcels:
+                bounds = np.array([p.bounds for p in parcels])
+                bbox_coords = [*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)]
+            bbox = BBox(bbox=bbox_coords, crs=CRS.WGS84)
             
             evalscript = """
             //VERSION=3
@@ -472,10 +497,15 @@ class EnvironmentalDataFetcher:
             ndvi_data = request.get_data()
             
             if ndvi_data and len(ndvi_data) > 0:
-                import numpy as np
-                mean_ndvi = np.nanmean(np.array(ndvi_data[0]))
-                if -1 <= mean_ndvi <= 1:
-                    return float(mean_ndvi)
+                raster = ndvi_data[0]
+                if parcels:
+                    # Roads and neighbouring fields inside the bbox do not count
+                    labels = rasterize_parcels(parcels, bbox_coords, raster.shape[:2])
+                    raster = np.where(labels > 0, raster, np.nan)
+                stats = summarize_ndvi(raster)
+                if stats.has_data and -1 <= stats.mean <= 1:
+                    logger.info(f"NDVI {stats.mean:.3f} over {stats.valid_pixels:,} pixels ({stats.health_status})")
+                    return float(stats.mean)
                     
             return DEFAULT_ENV_DATA['ndvi']
                 
@@ -483,13 +513,13 @@ class EnvironmentalDataFetcher:
             logger.error(f"Error fetching NDVI: {e}")
             return DEFAULT_ENV_DATA['ndvi']
     
-    def fetch_all_environmental_data(self, lat: float = None, lon: float = None) -> Dict[str, float]:
-        """Fetch all environmental data"""
+    def fetch_all_environmental_data(self, lat: float = None, lon: float = None, parcel: Dict = None) -> Dict[str, float]:
+        """Fetch all environmental data; NDVI covers the parcel (default: FARM_PARCEL_PATH) when one is set"""
         logger.info("🌍 Fetching environmental data...")
         
         soil_ph = self.fetch_soil_ph(lat, lon)
         weather_data = self.fetch_weather_data(lat, lon)
-        ndvi = self.fetch_ndvi(lat, lon)
+        ndvi = self.fetch_ndvi(lat, lon, parcel or self.default_parcel)
         
         env_data = {
             'soil_ph': soil_ph,
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Async (ASGI) Weather API Server using OpenWeatherMap API
+
+Same endpoints and JSON as flask_weather_server.py, served by Starlette on
+uvicorn with non-blocking upstream calls through one shared httpx client.
+A request waiting on OpenWeatherMap holds a coroutine, not a thread, so a
+single process keeps thousands of slow upstream waits in flight.
+
+Upstream calls go through the same cross-process guard (rate limit and
+circuit breaker) as the Flask server, and weather falls back to the last
+known payload, flagged stale and sent with no-store, while OpenWeatherMap
+is failing.
+
+Run with: python async_weather_server.py  (or: uvicorn async_weather_server:app)
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from city_index import CityCatalogue, normalize_name
+from city_resolver import CityResolver
+from farm_dashboard import (aiter_section_events, build_dashboard_payload, dashboard_done_event, fetch_ndvi_source,
+                            fetch_soil_source, section_deadlines)
+from ph_cities import CITY_CENTERS
+from request_coalescing import AsyncCoalescingCache
+from response_cache import CachedResponse, ResponseCache
+from soil_dataset import load_soil_dataset
+from spatial_index import GeoIndex
+from upstream_guard import get_guard, upstream_health
+from weather_history import WeatherHistory, build_history_payload
+from weather_payload import (build_cities_payload, build_forecast, build_nearest_cities, build_soil_payload,
+                             build_weather_batch_result, build_weather_data, build_weather_response,
+                             parse_city_lookup, parse_coordinates, parse_history_days, parse_nearest_k, parse_weather_batch,
+                             soil_cache_key, weather_batch_key)
+
+# Load environment variables
+load_dotenv()
+
+OWM_API_KEY = os.getenv('OWM_API_KEY')
+OWM_BASE_URL = "http://api.openweathermap.org/data/2.5"
+OWM_GEO_URL = "http://api.openweathermap.org/geo/1.0/direct"
+
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', '10'))
+# Sockets open to OpenWeatherMap at once; waits beyond this queue inside httpx
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '500'))
+
+WEATHER_REFRESH_SECONDS = float(os.getenv('WEATHER_REFRESH_SECONDS', '600'))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '5000'))
+SOIL_CACHE_SECONDS = float(os.getenv('SOIL_CACHE_SECONDS', '86400'))
+CITIES_CACHE_SECONDS = float(os.getenv('CITIES_CACHE_SECONDS', '86400'))
+WEATHER_BATCH_MAX_ITEMS = int(os.getenv('WEATHER_BATCH_MAX_ITEMS', '50'))
+CITY_LOOKUP_MAX_POINTS = int(os.getenv('CITY_LOOKUP_MAX_POINTS', '1000'))
+# Dashboard NDVI can hold a thread until Sentinel Hub answers, long after its section timed out,
+# so it gets its own small pool instead of the default executor every to_thread call shares
+NDVI_DASHBOARD_WORKERS = int(os.getenv('NDVI_DASHBOARD_WORKERS', '2'))
+
+# Shared with the Flask server and the CLIs through the guard's SQLite file
+OWM_GUARD = get_guard("openweathermap")
+
+
+def dumps(payload):
+    """Serialize like Flask's JSON provider (sorted keys, compact)"""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+# Kept past expiry as last-known data, so bounded by count; keyed by rounded coordinates
+_weather_cache = AsyncCoalescingCache(WEATHER_REFRESH_SECONDS, max_entries=WEATHER_CACHE_MAX_ENTRIES)
+# Response bodies expire with the weather data they were built from
+_weather_responses = AsyncCoalescingCache(WEATHER_REFRESH_SECONDS, ttl_of=lambda entry: entry.max_age,
+                                          max_entries=WEATHER_CACHE_MAX_ENTRIES)
+_soil_responses = ResponseCache(SOIL_CACHE_SECONDS, dumps)
+_cities_responses = ResponseCache(CITIES_CACHE_SECONDS, dumps)
+
+CITY_CATALOGUE = CityCatalogue(CITY_CENTERS)
+CITY_RESOLVER = CityResolver(CITY_CENTERS, CITY_CATALOGUE)
+CITY_INDEX = GeoIndex(list(CITY_CENTERS.values()), labels=list(CITY_CENTERS))
+SOIL_DATASET = load_soil_dataset()
+WEATHER_HISTORY = WeatherHistory()
+
+# Created in lifespan() so it is bound to the server's event loop
+http_client: httpx.AsyncClient = None
+
+_ndvi_pool = ThreadPoolExecutor(max_workers=NDVI_DASHBOARD_WORKERS, thread_name_prefix="dashboard-ndvi")
+_ndvi_in_flight = {}
+
+
+def cached_json_response(request, entry):
+    """Serve a cached JSON body, answering If-None-Match with 304 and gzip-capable clients with gzip"""
+    headers = {
+        "ETag": entry.etag,
+        # An entry built with no lifetime (e.g. stale fallback data) must not be kept by clients or proxies
+        "Cache-Control": f"public, max-age={entry.remaining_age()}" if entry.max_age > 0 else "no-store",
+        "Vary": "Accept-Encoding"
+    }
+
+    if entry.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzip_body, media_type="application/json", headers=headers)
+
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def error_response(message, status_code=500):
+    return JSONResponse({"success": False, "error": message}, status_code=status_code)
+
+
+async def resolve_city(city_name):
+    """(name, lat, lon) for a city: ph_cities.py and certain offline matches, then OpenWeatherMap geocoding,
+    then the closest known name. The name is the matched one ("quezon" -> "quezon city"), so a near
+    miss is never passed off as the input and every alias of a place gets the same label."""
+    city_key = city_name.lower()
+    if city_key in CITY_CENTERS:
+        lat, lon = CITY_CENTERS[city_key]
+        return city_key, lat, lon
+
+    resolved = CITY_RESOLVER.resolve(city_name)
+    if resolved is not None:
+        return resolved
+
+    try:
+        return (normalize_name(city_name), *await geocode_city(city_name))
+    except Exception as e:
+        closest = CITY_RESOLVER.closest(city_name)
+        if closest is None:
+            raise
+        print(f"⚠️ '{city_name}' not geocoded ({str(e)}), using closest known city '{closest[0]}'")
+        return closest
+
+
+async def geocode_city(city_name):
+    """Coordinates from OpenWeatherMap's city search; answers and misses are cached permanently"""
+    if CITY_RESOLVER.is_known_miss(city_name):
+        raise Exception(f"City '{city_name}' not found")
+
+    geo_response = await OWM_GUARD.acall(
+        http_client.get, OWM_GEO_URL, params={"q": f"{city_name},PH", "limit": 1, "appid": OWM_API_KEY}
+    )
+    if geo_response.status_code == 200:
+        geo_data = geo_response.json()
+        if geo_data:
+            lat, lon = geo_data[0]['lat'], geo_data[0]['lon']
+            await asyncio.to_thread(CITY_RESOLVER.remember, city_name, lat, lon)
+            return lat, lon
+        await asyncio.to_thread(CITY_RESOLVER.remember, city_name, None, None)
+        raise Exception(f"City '{city_name}' not found")
+    raise Exception("Geocoding service unavailable")
+
+
+def _record_history(location_key, current_json, forecast_json):
+    """Append fetched responses to the weather history; never fails the request"""
+    try:
+        WEATHER_HISTORY.record_current(location_key, current_json)
+        if forecast_json is not None:
+            WEATHER_HISTORY.record_forecast(location_key, forecast_json)
+    except Exception as e:
+        print(f"⚠️ Weather history not recorded for {location_key}: {str(e)}")
+
+
+async def _fetch_weather_at(city_name, lat, lon, location_key):
+    """Fetch current weather and forecast for a coordinate concurrently"""
+    if not OWM_API_KEY:
+        raise Exception("OpenWeatherMap API key not found")
+
+    params = {"lat": lat, "lon": lon, "appid": OWM_API_KEY, "units": "metric"}
+    current_response, forecast_response = await asyncio.gather(
+        OWM_GUARD.acall(http_client.get, f"{OWM_BASE_URL}/weather", params=params),
+        OWM_GUARD.acall(http_client.get, f"{OWM_BASE_URL}/forecast", params=params),
+        return_exceptions=True
+    )
+
+    if isinstance(current_response, BaseException):
+        raise current_response
+    if current_response.status_code != 200:
+        raise Exception(f"Weather API error: {current_response.status_code}")
+
+    # A failed forecast only empties the forecast section
+    forecast_data = []
+    forecast_json = None
+    if isinstance(forecast_response, BaseException):
+        print(f"⚠️ Forecast unavailable for {city_name}: {str(forecast_response)}")
+    elif forecast_response.status_code == 200:
+        forecast_json = forecast_response.json()
+        forecast_data = build_forecast(forecast_json)
+
+    current_json = current_response.json()
+    await asyncio.to_thread(_record_history, location_key, current_json, forecast_json)
+    return build_weather_data(city_name, lat, lon, current_json, forecast_data)
+
+
+async def _with_last_known(key, fetch):
+    """Fresh weather for key, or the last good payload (flagged stale) while the upstream is failing"""
+    try:
+        return await _weather_cache.get(key, fetch)
+    except Exception as e:
+        last_known = _weather_cache.peek(key)
+        if last_known is None:
+            raise
+        print(f"⚠️ Serving last-known weather for {key}: {str(e)}")
+        return {**last_known, "stale": True}
+
+
+def weather_key(lat, lon):
+    """Weather cache key: rounded coordinates (~100 m), so every name and GPS fix for a place shares one entry"""
+    return weather_batch_key(("coords", (lat, lon)))
+
+
+async def get_weather_for(name, lat, lon):
+    """Weather payload for a resolved city, labelled with its name; history is recorded under the name"""
+    weather = await _with_last_known(weather_key(lat, lon), lambda: _fetch_weather_at(name, lat, lon, name))
+    return {**weather, "location": name.title()}
+
+
+async def get_weather_data(city_name):
+    """Weather payload for a city; concurrent requests share one upstream fetch per refresh interval"""
+    return await get_weather_for(*await resolve_city(city_name))
+
+
+def nearest_cities(lat, lon, k=1):
+    """Nearest CITY_CENTERS entries to a coordinate, closest first, with distances in km"""
+    return build_nearest_cities(CITY_INDEX, CITY_CENTERS, [lat], [lon], k)[0]
+
+
+async def get_weather_at(lat, lon):
+    """Weather payload for a coordinate, labelled with the nearest city; nearby points share one fetch"""
+    key = weather_key(lat, lon)
+    city_name = nearest_cities(lat, lon)[0]["city"]
+    return await _with_last_known(key, lambda: _fetch_weather_at(city_name, lat, lon, key))
+
+
+def history_key(city_name):
+    """Name the weather history of a city is recorded under, without a geocoding call"""
+    resolved = CITY_RESOLVER.resolve(city_name)
+    return resolved[0] if resolved is not None else city_name.lower()
+
+
+async def weather_history_endpoint(request):
+    """API endpoint for recorded daily weather (rain, temperature extremes) over the last ?days= days"""
+    city_name = request.path_params['city_name']
+    try:
+        days = parse_history_days(request.query_params.get('days', 7))
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
+
+    try:
+        print(f"📈 Weather history request for: {city_name} ({days} days)")
+        payload = await asyncio.to_thread(build_history_payload, WEATHER_HISTORY, history_key(city_name), days)
+        return JSONResponse(payload)
+
+    except Exception as e:
+        print(f"❌ Weather History Exception: {str(e)}")
+        return error_response(f"Weather history error: {str(e)}")
+
+
+async def fetch_weather_batch(items):
+    """Weather for every batch item; duplicates share one fetch and failures stay per item"""
+    tasks = {}
+    for item in items:
+        key = weather_batch_key(item)
+        if key is None or key in tasks:
+            continue
+        kind, value = item
+        tasks[key] = get_weather_data(value) if kind == "city" else get_weather_at(*value)
+
+    outcomes = dict(zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)))
+
+    results = []
+    for item in items:
+        outcome = outcomes.get(weather_batch_key(item))
+        if outcome is None:
+            results.append(build_weather_batch_result(item))
+        elif isinstance(outcome, Exception):
+            results.append(build_weather_batch_result(item, error=f"Weather service error: {str(outcome)}"))
+        else:
+            results.append(build_weather_batch_result(item, outcome))
+    return results
+
+
+async def weather_batch_endpoint(request):
+    """API endpoint to get weather for several cities and/or coordinates in one round trip"""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    try:
+        items = parse_weather_batch(body, WEATHER_BATCH_MAX_ITEMS)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+
+    try:
+        print(f"🌤️ Batch weather request for {len(items)} locations")
+        results = await fetch_weather_batch(items)
+        failed = sum(1 for result in results if not result["success"])
+
+        print(f"✅ Returning batch weather: {len(results) - failed} ok, {failed} failed")
+        return JSONResponse({"success": True, "results": results, "count": len(results), "failed": failed})
+
+    except Exception as e:
+        print(f"❌ Batch Weather API Exception: {str(e)}")
+        return error_response(f"Weather service error: {str(e)}")
+
+
+def submit_ndvi_source(city_name):
+    """The NDVI fetch for a city on the NDVI pool; dashboards loading the same city share the running one"""
+    key = city_name.strip().lower()
+    future = _ndvi_in_flight.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(_ndvi_pool, fetch_ndvi_source, city_name)
+        _ndvi_in_flight[key] = future
+        future.add_done_callback(lambda done: _ndvi_in_flight.pop(key, None))
+    return future
+
+
+def start_dashboard_sources(city_name):
+    """Start the weather, soil and NDVI fetches for a farm dashboard concurrently"""
+    sources = {
+        "weather": asyncio.ensure_future(get_weather_data(city_name)),
+        "soil": asyncio.ensure_future(asyncio.to_thread(fetch_soil_source, city_name, SOIL_DATASET)),
+        "ndvi": submit_ndvi_source(city_name),
+    }
+    # Sources that miss their deadline keep running (and warm the caches); retrieve their errors
+    for task in sources.values():
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return sources
+
+
+async def dashboard_endpoint(request):
+    """API endpoint for a whole farm screen in one round trip; ?stream=1 for NDJSON, ?deadline= seconds"""
+    city_name = request.path_params['city_name']
+    try:
+        deadline = request.query_params.get('deadline')
+        deadlines = section_deadlines(float(deadline) if deadline is not None else None)
+        stream = request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+        print(f"📋 Dashboard request for: {city_name}")
+        started = time.monotonic()
+        sources = start_dashboard_sources(city_name)
+
+        if stream:
+            async def generate():
+                events = []
+                async for event in aiter_section_events(sources, deadlines, started):
+                    events.append(event)
+                    yield json.dumps(event) + "\n"
+                yield json.dumps(dashboard_done_event(city_name, events, started)) + "\n"
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+        events = [event async for event in aiter_section_events(sources, deadlines, started)]
+        dashboard = build_dashboard_payload(city_name, events, started)
+        print(f"✅ Returning dashboard for {city_name} in {dashboard['elapsedMs']} ms")
+        return JSONResponse(dashboard)
+
+    except Exception as e:
+        print(f"❌ Dashboard API Exception: {str(e)}")
+        return error_response(f"Dashboard service error: {str(e)}")
+
+
+async def weather_endpoint(request):
+    """API endpoint to get weather data for React Native using OpenWeatherMap"""
+    city_name = request.path_params['city_name']
+    try:
+        print(f"🌤️ Weather API request for: {city_name}")
+
+        name, lat, lon = await resolve_city(city_name)
+
+        async def build():
+            payload = build_weather_response(name, await get_weather_for(name, lat, lon))
+            # Last-known data served while OpenWeatherMap is down gets no lifetime at all
+            max_age = 0 if payload["weatherData"].get("stale") else _weather_cache.remaining(weather_key(lat, lon))
+            return CachedResponse(dumps(payload).encode("utf-8"), max_age)
+
+        entry = await _weather_responses.get(name, build)
+        return cached_json_response(request, entry)
+
+    except Exception as e:
+        print(f"❌ Weather API Exception: {str(e)}")
+        return error_response(f"Weather service error: {str(e)}")
+
+
+async def soil_endpoint(request):
+    """API endpoint to get soil data for React Native - prebuilt SoilGrids dataset, mock fallback"""
+    city_name = request.path_params['city_name']
+    try:
+        print(f"🌱 Soil API request for: {city_name}")
+        key = soil_cache_key(city_name, SOIL_DATASET)
+        if key is None:
+            # Any unknown name gets the same generic soil; caching it per name would grow without bound
+            body = dumps(build_soil_payload(city_name, SOIL_DATASET)).encode("utf-8")
+            return cached_json_response(request, CachedResponse(body, SOIL_CACHE_SECONDS))
+        entry = _soil_responses.get(key, lambda: build_soil_payload(city_name, SOIL_DATASET))
+        return cached_json_response(request, entry)
+
+    except Exception as e:
+        print(f"❌ Soil API Exception: {str(e)}")
+        return error_response(f"Soil service error: {str(e)}")
+
+
+async def cities_endpoint(request):
+    """API endpoint to get list of available Philippine cities, or ?q=&limit=&offset= prefix search"""
+    try:
+        query = request.query_params.get('q')
+        if query is None:
+            print("🏙️ Cities API request")
+            entry = _cities_responses.get("all", lambda: build_cities_payload(CITY_CATALOGUE))
+            return cached_json_response(request, entry)
+
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        return JSONResponse({"success": True, "query": query, **CITY_CATALOGUE.search_page(query, limit, offset)})
+
+    except Exception as e:
+        print(f"❌ Cities API Exception: {str(e)}")
+        return error_response(f"Cities service error: {str(e)}")
+
+
+async def city_from_coords_endpoint(request):
+    """API endpoint to get the nearest city (or ?k= nearest cities) from coordinates; POST a points list for batches"""
+    try:
+        if request.method == 'POST':
+            try:
+                body = await request.json()
+            except ValueError:
+                body = None
+            lats, lons, k = parse_city_lookup(body, CITY_LOOKUP_MAX_POINTS)
+        else:
+            params = request.query_params
+            lat, lon = parse_coordinates(params.get('lat', 14.5995), params.get('lon', 120.9842))
+            k = parse_nearest_k(params.get('k', 1))
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
+
+    try:
+        if request.method == 'POST':
+            print(f"📍 Batch city lookup for {len(lats)} coordinates")
+            results = build_nearest_cities(CITY_INDEX, CITY_CENTERS, lats, lons, k)
+            return JSONResponse({"success": True, "results": results, "count": len(results)})
+
+        print(f"📍 City lookup for coordinates: {lat}, {lon}")
+        nearest = nearest_cities(lat, lon, k)
+        city_response = {"success": True, **nearest[0]}
+        if k > 1:
+            city_response["nearest"] = nearest
+
+        print(f"✅ Nearest city: {nearest[0]['city']} ({nearest[0]['distance']} km)")
+        return JSONResponse(city_response)
+
+    except Exception as e:
+        print(f"❌ City Lookup Exception: {str(e)}")
+        return error_response(f"City lookup error: {str(e)}")
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        "status": "ok",
+        "service": "AgriAngat Weather API (ASGI)",
+        "upstreams": await asyncio.to_thread(upstream_health),
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+async def index(request):
+    """Root endpoint"""
+    return JSONResponse({
+        "message": "AgriAngat Weather API Server - Real Weather Data",
+        "version": "2.0.0",
+        "endpoints": [
+            "GET /api/weather/<city_name>",
+            "GET /api/weather/<city_name>/history?days=",
+            "POST /api/weather/batch",
+            "GET /api/dashboard/<city_name>?stream=&deadline=",
+            "GET /api/soil/<city_name>",
+            "GET /api/cities?q=&limit=&offset=",
+            "GET|POST /api/city-from-coords",
+            "GET /health"
+        ],
+        "data_source": "OpenWeatherMap API + Philippine Cities Database",
+        "note": "Provides real-time weather data and agricultural assessments."
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global http_client
+    limits = httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS, max_keepalive_connections=100)
+    async with httpx.AsyncClient(timeout=UPSTREAM_TIMEOUT, limits=limits) as client:
+        http_client = client
+        # Serialize the full city list once at startup
+        _cities_responses.get("all", lambda: build_cities_payload(CITY_CATALOGUE))
+        yield
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/health', health_check),
+        Route('/api/weather/batch', weather_batch_endpoint, methods=['POST']),
+        Route('/api/weather/{city_name}/history', weather_history_endpoint),
+        Route('/api/weather/{city_name}', weather_endpoint),
+        Route('/api/dashboard/{city_name}', dashboard_endpoint),
+        Route('/api/soil/{city_name}', soil_endpoint),
+        Route('/api/cities', cities_endpoint),
+        Route('/api/city-from-coords', city_from_coords_endpoint, methods=['GET', 'POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', '5000'))
+    print("🌤️  Starting AgriAngat Weather API Server - ASYNC VERSION...")
+    print(f"🌐 Listening on http://0.0.0.0:{port}")
+    print("=" * 70)
+    uvicorn.run(app, host='0.0.0.0', port=port, backlog=4096)
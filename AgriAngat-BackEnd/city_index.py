@@ -0,0 +1,69 @@
+"""
+City catalogue with an accent-insensitive prefix index.
+
+The catalogue is built once from CITY_CENTERS. Searches match the start of
+the name or of any word in it ("quezon" and "city" both find Quezon City),
+ignore case and accents ("paranaque" finds Parañaque), and are answered
+with a binary search over a sorted key list.
+"""
+
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+
+def normalize_name(text: str) -> str:
+    """Lowercase, strip accents (ñ -> n) and collapse whitespace"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.lower().split())
+
+
+class CityCatalogue:
+    """Sorted city entries plus a prefix index over their normalized names"""
+
+    def __init__(self, city_centers: Dict[str, Sequence[float]]):
+        self.entries: List[Dict] = sorted(
+            (
+                {
+                    "name": city_name.title(),
+                    "key": city_name.lower().replace(" ", "_"),
+                    "coordinates": {"latitude": coords[0], "longitude": coords[1]}
+                }
+                for city_name, coords in city_centers.items()
+            ),
+            key=lambda entry: entry["name"]
+        )
+
+        # One index key per word start, so multi-word names match on any word
+        index: List[Tuple[str, int]] = []
+        for i, entry in enumerate(self.entries):
+            words = normalize_name(entry["name"]).split(" ")
+            for w in range(len(words)):
+                index.append((" ".join(words[w:]), i))
+        index.sort()
+        self._keys = [key for key, _ in index]
+        self._positions = [i for _, i in index]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, query: str) -> List[Dict]:
+        """All entries whose name, or a word in it, starts with query, in name order"""
+        prefix = normalize_name(query)
+        if not prefix:
+            return list(self.entries)
+
+        matches = set()
+        start = bisect_left(self._keys, prefix)
+        for pos in range(start, len(self._keys)):
+            if not self._keys[pos].startswith(prefix):
+                break
+            matches.add(self._positions[pos])
+        return [self.entries[i] for i in sorted(matches)]
+
+    def search_page(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        """One page of search results with the total match count"""
+        matches = self.search(query)
+        page = matches[offset:offset + limit]
+        return {"cities": page, "count": len(page), "total": len(matches), "offset": offset, "limit": limit}
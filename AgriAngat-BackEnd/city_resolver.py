@@ -0,0 +1,192 @@
+"""
+Offline city-name resolution.
+
+Names are resolved locally before any geocoding call only when the match is
+certain: exact after accent/case normalization, or a unique prefix
+("quezon"). Everything else goes to the geocoder, because many real towns
+sit a couple of edits away from a different catalogue city (Ilagan/Iligan,
+Banaue/Mandaue). The closest name within a small edit distance, found
+through a BK-tree ("paranque" -> Parañaque), is only a fallback for when
+the geocoder has no answer. Geocoding answers, including "not found", are
+kept permanently in SQLite and feed the same indexes.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from city_index import CityCatalogue, normalize_name
+
+DEFAULT_GEOCODE_CACHE_PATH = os.getenv(
+    "GEOCODE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "geocode.sqlite3")
+)
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Edit distance between two strings"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def transposition_distance(a: str, b: str) -> int:
+    """Edit distance counting a swap of adjacent letters as one edit (optimal string alignment)"""
+    rows = [list(range(len(b) + 1))]
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            row[j] = min(rows[i - 1][j] + 1, row[j - 1] + 1, rows[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], rows[i - 2][j - 2] + 1)
+        rows.append(row)
+    return rows[-1][-1]
+
+
+def max_typos(word: str) -> int:
+    """Edit distance tolerated for a query of this length"""
+    if len(word) <= 4:
+        return 1
+    if len(word) <= 8:
+        return 2
+    return 3
+
+
+class BKTree:
+    """Burkhard-Keller tree for nearest-word lookups under edit distance"""
+
+    def __init__(self, words: Sequence[str] = ()):
+        self._root: Optional[Tuple[str, Dict[int, tuple]]] = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        if self._root is None:
+            self._root = (word, {})
+            return
+        node = self._root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        """All stored words within max_distance, closest first"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            candidate, children = stack.pop()
+            distance = levenshtein(word, candidate)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+            # Triangle inequality: only children in [d - max, d + max] can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+
+class CityResolver:
+    """Resolves free-text city names to coordinates without leaving the box when possible"""
+
+    def __init__(self, city_centers: Dict[str, Sequence[float]],
+                 catalogue: Optional[CityCatalogue] = None,
+                 cache_path: str = DEFAULT_GEOCODE_CACHE_PATH):
+        self.catalogue = catalogue or CityCatalogue(city_centers)
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+
+        # normalized name -> (display name, lat, lon)
+        self._known: Dict[str, Tuple[str, float, float]] = {
+            normalize_name(name): (name, coords[0], coords[1]) for name, coords in city_centers.items()
+        }
+        self._misses = set()
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with closing(sqlite3.connect(cache_path, timeout=30)) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    query TEXT PRIMARY KEY,
+                    lat REAL,
+                    lon REAL,
+                    fetched_at TEXT NOT NULL
+                )
+            """)
+            for query, lat, lon in conn.execute("SELECT query, lat, lon FROM geocode_cache"):
+                if lat is None:
+                    self._misses.add(query)
+                else:
+                    self._known.setdefault(query, (query, lat, lon))
+
+        self._tree = BKTree(self._known)
+
+    def resolve(self, city_name: str) -> Optional[Tuple[str, float, float]]:
+        """(name, lat, lon) for an exact or unique-prefix match, or None when only a geocoder could answer"""
+        query = normalize_name(city_name)
+        if not query:
+            return None
+
+        with self._lock:
+            if query in self._known:
+                return self._known[query]
+
+            prefix_matches = self.catalogue.search(query)
+            if len(prefix_matches) == 1:
+                return self._known[normalize_name(prefix_matches[0]["name"])]
+
+        return None
+
+    def closest(self, city_name: str) -> Optional[Tuple[str, float, float]]:
+        """(name, lat, lon) of the single closest known name within a few typos, or None
+
+        Only for names the geocoder could not place: a near miss is as likely
+        to be a different town as a misspelling of a known one.
+        """
+        query = normalize_name(city_name)
+        if not query:
+            return None
+
+        with self._lock:
+            # The BK-tree needs a true metric (Levenshtein); candidates are then
+            # ranked so that swapped letters ("baguoi") count as a single typo
+            candidates = self._tree.search(query, max_typos(query))
+            ranked = sorted((transposition_distance(query, word), word) for _, word in candidates)
+            if ranked and (len(ranked) == 1 or ranked[0][0] < ranked[1][0]):
+                return self._known[ranked[0][1]]
+
+        return None
+
+    def is_known_miss(self, city_name: str) -> bool:
+        """Whether the geocoder has already said this name does not exist"""
+        return normalize_name(city_name) in self._misses
+
+    def remember(self, city_name: str, lat: Optional[float], lon: Optional[float]) -> None:
+        """Permanently store a geocoding answer; lat/lon of None records a miss"""
+        query = normalize_name(city_name)
+        with closing(sqlite3.connect(self.cache_path, timeout=30)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (query, lat, lon, fetched_at) VALUES (?, ?, ?, ?)",
+                (query, lat, lon, datetime.now().isoformat())
+            )
+        with self._lock:
+            if lat is None or lon is None:
+                self._misses.add(query)
+            else:
+                self._known[query] = (query, lat, lon)
+                self._tree.add(query)
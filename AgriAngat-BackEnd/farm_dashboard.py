@@ -0,0 +1,218 @@
+"""
+Farm dashboard aggregation.
+
+One request fans out to every source a farm screen needs (weather, soil,
+NDVI) at once, and their results are mapped onto the dashboard sections:
+weather, forecast, soil, crops and ndvi. Each section has its own deadline;
+a section that misses it is reported as "timeout" while everything else is
+returned, or streamed as NDJSON lines, as soon as it is ready.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from ndvi_stats import summarize_ndvi
+from ph_cities import CITY_CENTERS
+from soil_profile import DEPTH_INDEX, PROPERTY_INDEX, SOIL_DEPTHS, SOIL_PROPERTIES, SOIL_STATS, SoilProfile
+from weather_payload import SAMPLE_CITY_SOIL, build_soil_payload
+
+DASHBOARD_SECTIONS = ("weather", "forecast", "soil", "crops", "ndvi")
+
+# Source behind each section; sections sharing a source share one fetch
+SECTION_SOURCES = {
+    "weather": "weather",
+    "forecast": "weather",
+    "soil": "soil",
+    "crops": "soil",
+    "ndvi": "ndvi",
+}
+
+# Seconds each section may take before it is reported as a timeout
+DEFAULT_SECTION_DEADLINES = {
+    "weather": float(os.getenv("DASHBOARD_WEATHER_DEADLINE", "4")),
+    "forecast": float(os.getenv("DASHBOARD_WEATHER_DEADLINE", "4")),
+    "soil": float(os.getenv("DASHBOARD_SOIL_DEADLINE", "2")),
+    "crops": float(os.getenv("DASHBOARD_SOIL_DEADLINE", "2")),
+    "ndvi": float(os.getenv("DASHBOARD_NDVI_DEADLINE", "8")),
+}
+MAX_SECTION_DEADLINE = 30.0
+
+
+class SectionUnavailable(Exception):
+    """A source that cannot serve this dashboard at all (as opposed to failing)"""
+
+
+def section_deadlines(override: Optional[float] = None) -> Dict[str, float]:
+    """Per-section deadlines, or one client-supplied deadline for every section"""
+    if override is None:
+        return dict(DEFAULT_SECTION_DEADLINES)
+    override = min(max(float(override), 0.0), MAX_SECTION_DEADLINE)
+    return {section: override for section in DASHBOARD_SECTIONS}
+
+
+def _soil_number(text: Optional[str]) -> float:
+    """'18.5 g/kg' / '35%' -> 18.5 / 35.0, NaN when missing"""
+    if not text:
+        return np.nan
+    return float(text.replace("%", "").split()[0])
+
+
+def profile_from_soil_info(soil_info: Dict) -> SoilProfile:
+    """Topsoil SoilProfile from a soilData dict (pH, organic carbon, clay, sand)"""
+    values = np.full((len(SOIL_PROPERTIES), len(SOIL_DEPTHS), len(SOIL_STATS)), np.nan)
+    d = DEPTH_INDEX["0-5cm"]
+    clay = _soil_number(soil_info.get("Clay Content"))
+    sand = _soil_number(soil_info.get("Sand Content"))
+    values[PROPERTY_INDEX["phh2o"], d, 0] = _soil_number(soil_info.get("pH Level"))
+    values[PROPERTY_INDEX["soc"], d, 0] = _soil_number(soil_info.get("Organic Carbon"))
+    values[PROPERTY_INDEX["clay"], d, 0] = clay
+    values[PROPERTY_INDEX["sand"], d, 0] = sand
+    values[PROPERTY_INDEX["silt"], d, 0] = 100 - clay - sand
+    return SoilProfile(values)
+
+
+def fetch_soil_source(city_name: str, dataset=None) -> Dict:
+    """Soil summary plus crop suggestions for a city; local data only
+
+    Cities without a dataset row or sample data are unavailable rather than
+    given the generic fallback soil, so no crop advice is built on made-up values.
+    """
+    city_key = city_name.strip().lower()
+    row = dataset.index_of(city_key) if dataset is not None else None
+    if row is None and city_key not in SAMPLE_CITY_SOIL:
+        raise SectionUnavailable("No soil data for this city yet; add it with soil_dataset.py")
+
+    soil = {key: value for key, value in build_soil_payload(city_key, dataset).items() if key != "success"}
+    if row is not None:
+        profile = dataset.profile(row)
+        soil["source"] = "soilgrids"
+    else:
+        profile = profile_from_soil_info(soil["soilData"])
+        soil["source"] = "sample"
+        if city_key in CITY_CENTERS:
+            lat, lon = CITY_CENTERS[city_key]
+            soil["coordinates"] = {"latitude": lat, "longitude": lon}
+
+    return {
+        "soil": soil,
+        "crops": {
+            "suggestedCrops": profile.suggest_crops(),
+            "interpretation": profile.interpret()
+        }
+    }
+
+
+def fetch_ndvi_source(city_name: str) -> Dict:
+    """NDVI health summary for a city from Sentinel Hub"""
+    coords = CITY_CENTERS.get(city_name.strip().lower())
+    if coords is None:
+        raise SectionUnavailable("NDVI analysis is only available for known cities")
+    from ndvi_analysis import city_bbox, request_ndvi, sh_config, sh_configured
+    try:
+        # sentinelhub is optional for the servers; without it the section is just unavailable
+        config = sh_config()
+    except ImportError:
+        raise SectionUnavailable("NDVI analysis is not installed on this server")
+    if not sh_configured(config):
+        raise SectionUnavailable("Sentinel Hub credentials are not configured")
+    return summarize_ndvi(request_ndvi(city_bbox(*coords), config)).to_dict()
+
+
+def extract_section(section: str, source_result):
+    """The part of a source's result that belongs to one section"""
+    if section == "weather":
+        return {key: value for key, value in source_result.items() if key != "forecast"}
+    if section == "forecast":
+        return source_result.get("forecast", [])
+    if section in ("soil", "crops"):
+        return source_result[section]
+    return source_result
+
+
+def section_event(section: str, status: str, data=None, error: Optional[str] = None) -> Dict:
+    """One section outcome: ok, timeout, error or unavailable"""
+    event = {"section": section, "status": status}
+    if data is not None:
+        event["data"] = data
+    if error is not None:
+        event["error"] = error
+    return event
+
+
+def _finished_event(section: str, future) -> Dict:
+    """Event for a completed concurrent.futures.Future or asyncio.Task"""
+    if future.cancelled():
+        return section_event(section, "error", error="Cancelled")
+    error = future.exception()
+    if isinstance(error, SectionUnavailable):
+        return section_event(section, "unavailable", error=str(error))
+    if error is not None:
+        return section_event(section, "error", error=str(error))
+    try:
+        return section_event(section, "ok", extract_section(section, future.result()))
+    except Exception as e:
+        return section_event(section, "error", error=str(e))
+
+
+def _expired_events(pending: Dict, deadlines: Dict[str, float], started: float) -> Iterator[Dict]:
+    elapsed = time.monotonic() - started
+    for section in [s for s in pending if elapsed >= deadlines[s]]:
+        del pending[section]
+        yield section_event(section, "timeout", error=f"No answer within {deadlines[section]:g}s")
+
+
+def _next_wait(pending: Dict, deadlines: Dict[str, float], started: float) -> float:
+    return max(0.0, min(started + deadlines[s] for s in pending) - time.monotonic())
+
+
+def iter_section_events(sources: Dict, deadlines: Dict[str, float], started: float) -> Iterator[Dict]:
+    """Section events in completion order from {source: concurrent.futures.Future}"""
+    pending = {section: sources[SECTION_SOURCES[section]] for section in DASHBOARD_SECTIONS}
+    while pending:
+        for section in [s for s in pending if pending[s].done()]:
+            yield _finished_event(section, pending.pop(section))
+        yield from _expired_events(pending, deadlines, started)
+        if pending:
+            wait(set(pending.values()), timeout=_next_wait(pending, deadlines, started), return_when=FIRST_COMPLETED)
+
+
+async def aiter_section_events(sources: Dict, deadlines: Dict[str, float], started: float):
+    """Section events in completion order from {source: asyncio.Task}"""
+    pending = {section: sources[SECTION_SOURCES[section]] for section in DASHBOARD_SECTIONS}
+    while pending:
+        for section in [s for s in pending if pending[s].done()]:
+            yield _finished_event(section, pending.pop(section))
+        for event in _expired_events(pending, deadlines, started):
+            yield event
+        if pending:
+            await asyncio.wait(set(pending.values()), timeout=_next_wait(pending, deadlines, started),
+                               return_when=asyncio.FIRST_COMPLETED)
+
+
+def build_dashboard_payload(city_name: str, events, started: float) -> Dict:
+    """Full /api/dashboard response body from the collected section events"""
+    sections = {}
+    for event in events:
+        sections[event["section"]] = {key: value for key, value in event.items() if key != "section"}
+    return {
+        "success": True,
+        "city": city_name.title(),
+        "complete": all(sections[s]["status"] != "timeout" for s in sections),
+        "sections": {section: sections[section] for section in DASHBOARD_SECTIONS if section in sections},
+        "elapsedMs": round((time.monotonic() - started) * 1000)
+    }
+
+
+def dashboard_done_event(city_name: str, events, started: float) -> Dict:
+    """Closing NDJSON line of a streamed dashboard"""
+    return {
+        "done": True,
+        "city": city_name.title(),
+        "complete": all(event["status"] != "timeout" for event in events),
+        "elapsedMs": round((time.monotonic() - started) * 1000)
+    }
@@ -0,0 +1,227 @@
+"""
+Local registry of farms: geometries and attributes in SQLite with an R-tree.
+
+Each farm is one row (id, center, optional GeoJSON polygon, JSON
+attributes) plus its bounding box in an SQLite R-tree, so bbox queries are
+an index search rather than a scan. Radius queries narrow with the R-tree
+to the circle's degree box, then keep the farms whose center lies within
+the haversine radius. Nearest queries run radius searches with a growing
+radius until k farms are found.
+
+cluster_farms groups farms by grid cell so that satellite, soil and
+weather jobs can make one upstream request per cluster instead of one per
+farm. FarmRegistry.parcels and .points turn query results into the inputs
+of ndvi_analysis.analyze_parcels and soil_batch.analyze_points.
+
+The R-tree stores float32 bounds rounded outward (up to ~2 m here), so
+bbox queries may include farms that only touch the box edge.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ndvi_zonal import GROUP_CELL_DEG, Parcel, geometry_rings
+from spatial_index import haversine_km
+
+DEFAULT_REGISTRY_PATH = os.getenv(
+    "FARM_REGISTRY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "farm_registry.sqlite3")
+)
+
+KM_PER_DEGREE = 111.32
+NEAREST_START_KM = 5.0
+NEAREST_MAX_KM = 2000.0     # spans the whole archipelago
+
+_SELECT = """
+    SELECT f.farm_id, f.lat, f.lon, f.geometry, f.attributes, r.min_lon, r.min_lat, r.max_lon, r.max_lat
+    FROM farm_rtree r JOIN farms f ON f.id = r.id
+"""
+
+
+def _farm(row: tuple) -> Dict:
+    farm_id, lat, lon, geometry, attributes, min_lon, min_lat, max_lon, max_lat = row
+    return {
+        "id": farm_id,
+        "lat": lat,
+        "lon": lon,
+        "bounds": (min_lon, min_lat, max_lon, max_lat),
+        "geometry": json.loads(geometry) if geometry else None,
+        "attributes": json.loads(attributes),
+    }
+
+
+def _bounds(lat: float, lon: float, geometry: Optional[Dict]) -> Tuple[float, float, float, float]:
+    if not geometry or geometry.get("type") == "Point":
+        return (lon, lat, lon, lat)
+    return Parcel("", geometry_rings(geometry)).bounds
+
+
+class FarmRegistry:
+    """SQLite farm registry with an R-tree over farm bounding boxes"""
+
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS farms (
+                    id INTEGER PRIMARY KEY,
+                    farm_id TEXT NOT NULL UNIQUE,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    geometry TEXT,
+                    attributes TEXT NOT NULL,
+                    updated_at INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS farm_rtree
+                USING rtree(id, min_lon, max_lon, min_lat, max_lat)
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, reused across calls"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM farms").fetchone()[0]
+
+    def add_farms(self, farms: Iterable[Dict]) -> int:
+        """Insert or update farms given as {"id", "lat", "lon", "geometry"?, "attributes"?}; one transaction"""
+        now = int(time.time())
+        count = 0
+        with self._connect() as conn:
+            for farm in farms:
+                geometry = farm.get("geometry")
+                (row_id,) = conn.execute(
+                    "INSERT INTO farms (farm_id, lat, lon, geometry, attributes, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(farm_id) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, "
+                    "geometry = excluded.geometry, attributes = excluded.attributes, updated_at = excluded.updated_at "
+                    "RETURNING id",
+                    (str(farm["id"]), float(farm["lat"]), float(farm["lon"]),
+                     json.dumps(geometry) if geometry else None, json.dumps(farm.get("attributes") or {}), now)
+                ).fetchone()
+                min_lon, min_lat, max_lon, max_lat = _bounds(farm["lat"], farm["lon"], geometry)
+                conn.execute("INSERT OR REPLACE INTO farm_rtree VALUES (?, ?, ?, ?, ?)",
+                             (row_id, min_lon, max_lon, min_lat, max_lat))
+                count += 1
+        return count
+
+    def add_farm(self, farm_id: str, lat: float, lon: float, geometry: Optional[Dict] = None, **attributes) -> None:
+        self.add_farms([{"id": farm_id, "lat": lat, "lon": lon, "geometry": geometry, "attributes": attributes}])
+
+    def import_geojson(self, geojson: Dict) -> int:
+        """Register every Point, Polygon or MultiPolygon feature; properties become attributes"""
+        features = geojson["features"] if geojson.get("type") == "FeatureCollection" else [geojson]
+        farms = []
+        for i, feature in enumerate(features):
+            properties = dict(feature.get("properties") or {})
+            geometry = feature["geometry"]
+            farm_id = properties.pop("id", None) or feature.get("id") or properties.get("name") or f"farm_{i + 1}"
+            if geometry["type"] == "Point":
+                lon, lat = geometry["coordinates"][:2]
+            else:
+                lat, lon = Parcel("", geometry_rings(geometry)).center
+            farms.append({"id": farm_id, "lat": lat, "lon": lon, "geometry": geometry, "attributes": properties})
+        return self.add_farms(farms)
+
+    def remove(self, farm_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("DELETE FROM farms WHERE farm_id = ? RETURNING id", (farm_id,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM farm_rtree WHERE id = ?", row)
+        return row is not None
+
+    def get(self, farm_id: str) -> Optional[Dict]:
+        row = self._connect().execute(_SELECT + " WHERE f.farm_id = ?", (farm_id,)).fetchone()
+        return _farm(row) if row else None
+
+    def all(self) -> List[Dict]:
+        return [_farm(row) for row in self._connect().execute(_SELECT + " ORDER BY f.id")]
+
+    def in_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> List[Dict]:
+        """Farms whose bounding box intersects the bbox"""
+        rows = self._connect().execute(
+            _SELECT + " WHERE r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?",
+            (min_lon, max_lon, min_lat, max_lat)
+        ).fetchall()
+        return [_farm(row) for row in rows]
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> List[Dict]:
+        """Farms whose center is within radius_km, closest first, each with distanceKm"""
+        d_lat = radius_km / KM_PER_DEGREE
+        widest = math.cos(math.radians(min(abs(lat) + d_lat, 89.9)))  # degree box must hold the whole circle
+        d_lon = min(radius_km / (KM_PER_DEGREE * widest), 180.0)
+        farms = self.in_bbox(lon - d_lon, lat - d_lat, lon + d_lon, lat + d_lat)
+        if not farms:
+            return []
+        distances = haversine_km(lat, lon, [f["lat"] for f in farms], [f["lon"] for f in farms])
+        order = np.argsort(distances, kind="stable")
+        return [dict(farms[i], distanceKm=round(float(distances[i]), 3))
+                for i in order if distances[i] <= radius_km]
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Dict]:
+        """k farms with the closest centers, closest first, each with distanceKm"""
+        k = min(k, len(self))
+        radius = NEAREST_START_KM
+        while k > 0:
+            farms = self.within_radius(lat, lon, radius)
+            if len(farms) >= k or radius >= NEAREST_MAX_KM:
+                return farms[:k]
+            radius = min(radius * 4, NEAREST_MAX_KM)
+        return []
+
+    @staticmethod
+    def parcels(farms: Sequence[Dict]) -> List[Parcel]:
+        """Parcels for ndvi_analysis.analyze_parcels from the farms that have polygons"""
+        return [Parcel(farm["id"], geometry_rings(farm["geometry"])) for farm in farms
+                if farm["geometry"] and farm["geometry"]["type"] != "Point"]
+
+    @staticmethod
+    def points(farms: Sequence[Dict]) -> Dict[str, Tuple[float, float]]:
+        """{farm id: (lat, lon)} for soil_batch.analyze_points and weather lookups"""
+        return {farm["id"]: (farm["lat"], farm["lon"]) for farm in farms}
+
+
+def cluster_farms(farms: Sequence[Dict], cell_deg: float = GROUP_CELL_DEG) -> List[Dict]:
+    """Farms whose centers share a grid cell, with the covering bbox and its center; one upstream request each"""
+    cells: Dict[Tuple[int, int], List[int]] = {}
+    for i, farm in enumerate(farms):
+        cells.setdefault((math.floor(farm["lat"] / cell_deg), math.floor(farm["lon"] / cell_deg)), []).append(i)
+
+    clusters = []
+    for members in cells.values():
+        bounds = np.array([farms[i]["bounds"] for i in members])
+        bbox = (float(bounds[:, 0].min()), float(bounds[:, 1].min()),
+                float(bounds[:, 2].max()), float(bounds[:, 3].max()))
+        clusters.append({
+            "bbox": bbox,
+            "center": ((bbox[1] + bbox[3]) / 2, (bbox[0] + bbox[2]) / 2),
+            "farms": [farms[i]["id"] for i in members],
+        })
+    return clusters
+
+
+_default_registry: Optional[FarmRegistry] = None
+
+
+def get_default_registry() -> FarmRegistry:
+    """Return the process-wide farm registry at DEFAULT_REGISTRY_PATH"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = FarmRegistry()
+    return _default_registry
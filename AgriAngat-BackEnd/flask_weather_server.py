@@ -2,12 +2,31 @@
 """
 Flask Weather API Server using OpenWeatherMap API
 """
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
+import json
 import os
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from city_index import CityCatalogue, normalize_name
+from city_resolver import CityResolver
+from farm_dashboard import (build_dashboard_payload, dashboard_done_event, fetch_ndvi_source, fetch_soil_source,
+                            iter_section_events, section_deadlines)
 from ph_cities import CITY_CENTERS
+from request_coalescing import CoalescingCache
+from response_cache import CachedResponse, ResponseCache
+from soil_dataset import load_soil_dataset
+from spatial_index import GeoIndex
+from upstream_guard import get_guard, upstream_health
+from weather_history import WeatherHistory, build_history_payload
+from weather_payload import (build_cities_payload as shape_cities_payload, build_forecast, build_nearest_cities,
+                             build_soil_payload as shape_soil_payload, build_weather_data,
+                             build_weather_batch_result, build_weather_response, parse_city_lookup,
+                             parse_coordinates, parse_history_days, parse_nearest_k, parse_weather_batch, soil_cache_key,
+                             weather_batch_key)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React Native
@@ -19,64 +38,75 @@ load_dotenv()
 OWM_API_KEY = os.getenv('OWM_API_KEY')
 OWM_BASE_URL = "http://api.openweathermap.org/data/2.5"
 
-def get_agricultural_assessment(temp, humidity, wind_speed, rain_chance, condition):
-    """Generate agricultural weather assessment based on weather conditions"""
-    tips = []
-    
-    # Temperature assessment
-    if temp < 20:
-        tips.append({
-            "title": "Cool Temperature Alert",
-            "description": f"Temperature is {temp}°C. Consider protecting sensitive crops from cold. Good for cool-season vegetables like lettuce, cabbage, and peas."
-        })
-    elif 20 <= temp <= 30:
-        tips.append({
-            "title": "Optimal Growing Conditions",
-            "description": f"Temperature is {temp}°C - ideal for most tropical crops. Perfect for rice, corn, and most vegetables. Monitor soil moisture regularly."
-        })
-    else:
-        tips.append({
-            "title": "High Temperature Warning",
-            "description": f"Temperature is {temp}°C. Ensure adequate irrigation and shade for crops. Heat-stress resistant varieties recommended."
-        })
-    
-    # Humidity assessment
-    if humidity > 80:
-        tips.append({
-            "title": "High Humidity Alert",
-            "description": f"Humidity is {humidity}%. Watch for fungal diseases. Ensure good air circulation and consider fungicide application if needed."
-        })
-    elif humidity < 40:
-        tips.append({
-            "title": "Low Humidity Notice",
-            "description": f"Humidity is {humidity}%. Increase irrigation frequency. Consider mulching to retain soil moisture."
-        })
-    else:
-        tips.append({
-            "title": "Good Humidity Levels",
-            "description": f"Humidity is {humidity}% - favorable for most crops. Maintain current watering schedule."
-        })
+# Upstream calls time out instead of holding a worker forever
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', '10'))
+
+# Weather for a place is fetched at most once per refresh interval, however many users ask.
+# Entries are kept past expiry as last-known data, so the cache is bounded by count instead.
+WEATHER_REFRESH_SECONDS = float(os.getenv('WEATHER_REFRESH_SECONDS', '600'))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '5000'))
+_weather_cache = CoalescingCache(WEATHER_REFRESH_SECONDS, max_entries=WEATHER_CACHE_MAX_ENTRIES)
+_upstream_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="owm")
+
+# Shared (cross-process) rate limit and circuit breaker for OpenWeatherMap
+OWM_GUARD = get_guard("openweathermap")
+
+# Batch items run on their own pool; each one still fans out to _upstream_pool
+WEATHER_BATCH_MAX_ITEMS = int(os.getenv('WEATHER_BATCH_MAX_ITEMS', '50'))
+CITY_LOOKUP_MAX_POINTS = int(os.getenv('CITY_LOOKUP_MAX_POINTS', '1000'))
+_batch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="weather-batch")
+
+# Dashboard NDVI can hold a worker until Sentinel Hub answers, long after its section timed out,
+# so it gets its own small pool and one fetch per city at a time instead of starving batch weather
+NDVI_DASHBOARD_WORKERS = int(os.getenv('NDVI_DASHBOARD_WORKERS', '2'))
+_ndvi_pool = ThreadPoolExecutor(max_workers=NDVI_DASHBOARD_WORKERS, thread_name_prefix="dashboard-ndvi")
+_ndvi_in_flight = {}
+_ndvi_lock = threading.Lock()
+
+# Serialized, gzip-compressed response bodies served with ETag / Cache-Control
+SOIL_CACHE_SECONDS = float(os.getenv('SOIL_CACHE_SECONDS', '86400'))
+CITIES_CACHE_SECONDS = float(os.getenv('CITIES_CACHE_SECONDS', '86400'))
+_weather_responses = ResponseCache(WEATHER_REFRESH_SECONDS, lambda payload: app.json.dumps(payload),
+                                   max_entries=WEATHER_CACHE_MAX_ENTRIES)
+_soil_responses = ResponseCache(SOIL_CACHE_SECONDS, lambda payload: app.json.dumps(payload))
+_cities_responses = ResponseCache(CITIES_CACHE_SECONDS, lambda payload: app.json.dumps(payload))
+
+# City list and search index, built once
+CITY_CATALOGUE = CityCatalogue(CITY_CENTERS)
+
+# Offline name resolution with a permanent geocoding cache
+CITY_RESOLVER = CityResolver(CITY_CENTERS, CITY_CATALOGUE)
+
+# Nearest-city lookups from GPS fixes
+CITY_INDEX = GeoIndex(list(CITY_CENTERS.values()), labels=list(CITY_CENTERS))
+
+# Every fetched observation and forecast is kept for trends and rainfall totals
+WEATHER_HISTORY = WeatherHistory()
+
+# Prebuilt soil dataset (python soil_dataset.py), memory-mapped once at startup
+SOIL_DATASET = load_soil_dataset()
+
+def cached_json_response(cache, key, build_payload, max_age=None):
+    """Serve a cached JSON body, answering If-None-Match with 304 and gzip-capable clients with gzip"""
+    return json_entry_response(cache.get(key, build_payload, max_age))
+
+def json_entry_response(entry):
+    """Serve a serialized JSON body with its ETag, Cache-Control and gzip handling"""
+    headers = {
+        "ETag": entry.etag,
+        # An entry built with no lifetime (e.g. stale fallback data) must not be kept by clients or proxies
+        "Cache-Control": f"public, max-age={entry.remaining_age()}" if entry.max_age > 0 else "no-store",
+        "Vary": "Accept-Encoding"
+    }
     
-    # Wind assessment
-    if wind_speed > 15:
-        tips.append({
-            "title": "Strong Wind Warning",
-            "description": f"Wind speed is {wind_speed} km/h. Secure young plants and provide windbreaks for tall crops like corn and banana."
-        })
+    if entry.matches(request.headers.get("If-None-Match")):
+        return Response(status=304, headers=headers)
     
-    # Rain assessment
-    if rain_chance > 70:
-        tips.append({
-            "title": "High Rain Probability",
-            "description": f"{rain_chance}% chance of rain. Delay pesticide application. Ensure proper drainage to prevent waterlogging."
-        })
-    elif rain_chance < 20:
-        tips.append({
-            "title": "Low Rain Probability",
-            "description": f"Only {rain_chance}% chance of rain. Plan irrigation schedule. Check soil moisture levels regularly."
-        })
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzip_body, mimetype="application/json", headers=headers)
     
-    return tips
+    return Response(entry.body, mimetype="application/json", headers=headers)
 
 def get_city_coordinates(city_name):
     """Get coordinates for a city from ph_cities.py"""
@@ -92,229 +122,334 @@ def health_check():
     return jsonify({ 
         "status": "ok", 
         "service": "AgriAngat Weather API (Flask)",
+        "upstreams": upstream_health(),
         "timestamp": datetime.now().isoformat() 
     })
 
+def resolve_city(city_name):
+    """(name, lat, lon) for a city: ph_cities.py and certain offline matches, then OpenWeatherMap geocoding,
+    then the closest known name. The name is the matched one ("quezon" -> "quezon city"), so a near
+    miss is never passed off as the input and every alias of a place gets the same label."""
+    lat, lon = get_city_coordinates(city_name)
+    if lat is not None and lon is not None:
+        return city_name.lower(), lat, lon
+    
+    # Accents, unique prefixes and earlier geocoding answers never leave the box
+    resolved = CITY_RESOLVER.resolve(city_name)
+    if resolved is not None:
+        return resolved
+    
+    try:
+        return (normalize_name(city_name), *geocode_city(city_name))
+    except Exception as e:
+        closest = CITY_RESOLVER.closest(city_name)
+        if closest is None:
+            raise
+        print(f"⚠️ '{city_name}' not geocoded ({str(e)}), using closest known city '{closest[0]}'")
+        return closest
+
+def geocode_city(city_name):
+    """Coordinates from OpenWeatherMap's city search; answers and misses are cached permanently"""
+    if CITY_RESOLVER.is_known_miss(city_name):
+        raise Exception(f"City '{city_name}' not found")
+    
+    geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name},PH&limit=1&appid={OWM_API_KEY}"
+    geo_response = OWM_GUARD.get(geocoding_url, timeout=UPSTREAM_TIMEOUT)
+    if geo_response.status_code == 200:
+        geo_data = geo_response.json()
+        if geo_data:
+            lat, lon = geo_data[0]['lat'], geo_data[0]['lon']
+            CITY_RESOLVER.remember(city_name, lat, lon)
+            return lat, lon
+        CITY_RESOLVER.remember(city_name, None, None)
+        raise Exception(f"City '{city_name}' not found")
+    raise Exception("Geocoding service unavailable")
+
+def _record_history(location_key, current_json, forecast_json):
+    """Append fetched responses to the weather history; never fails the request"""
+    try:
+        WEATHER_HISTORY.record_current(location_key, current_json)
+        if forecast_json is not None:
+            WEATHER_HISTORY.record_forecast(location_key, forecast_json)
+    except Exception as e:
+        print(f"⚠️ Weather history not recorded for {location_key}: {str(e)}")
+
+def _fetch_weather_at(city_name, lat, lon, location_key):
+    """Fetch current weather and forecast for a coordinate in parallel"""
+    if not OWM_API_KEY:
+        raise Exception("OpenWeatherMap API key not found")
+    
+    current_url = f"{OWM_BASE_URL}/weather?lat={lat}&lon={lon}&appid={OWM_API_KEY}&units=metric"
+    forecast_url = f"{OWM_BASE_URL}/forecast?lat={lat}&lon={lon}&appid={OWM_API_KEY}&units=metric"
+    current_future = _upstream_pool.submit(OWM_GUARD.get, current_url, timeout=UPSTREAM_TIMEOUT)
+    forecast_future = _upstream_pool.submit(OWM_GUARD.get, forecast_url, timeout=UPSTREAM_TIMEOUT)
+    
+    current_response = current_future.result()
+    if current_response.status_code != 200:
+        raise Exception(f"Weather API error: {current_response.status_code}")
+    
+    # A failed forecast only empties the forecast section
+    forecast_data = []
+    forecast_json = None
+    try:
+        forecast_response = forecast_future.result()
+        if forecast_response.status_code == 200:
+            forecast_json = forecast_response.json()
+            forecast_data = build_forecast(forecast_json)
+    except requests.RequestException as e:
+        print(f"⚠️ Forecast unavailable for {city_name}: {str(e)}")
+    
+    current_json = current_response.json()
+    _record_history(location_key, current_json, forecast_json)
+    return build_weather_data(city_name, lat, lon, current_json, forecast_data)
+
+def _with_last_known(key, fetch):
+    """Fresh weather for key, or the last good payload (flagged stale) while the upstream is failing"""
+    try:
+        return _weather_cache.get(key, fetch)
+    except Exception as e:
+        last_known = _weather_cache.peek(key)
+        if last_known is None:
+            raise
+        print(f"⚠️ Serving last-known weather for {key}: {str(e)}")
+        return {**last_known, "stale": True}
+
+def weather_key(lat, lon):
+    """Weather cache key: rounded coordinates (~100 m), so every name and GPS fix for a place shares one entry"""
+    return weather_batch_key(("coords", (lat, lon)))
+
+def get_weather_for(name, lat, lon):
+    """Weather payload for a resolved city, labelled with its name; history is recorded under the name"""
+    weather = _with_last_known(weather_key(lat, lon), lambda: _fetch_weather_at(name, lat, lon, name))
+    return {**weather, "location": name.title()}
+
+def get_weather_data(city_name):
+    """Weather payload for a city; concurrent requests share one upstream fetch per refresh interval"""
+    return get_weather_for(*resolve_city(city_name))
+
+def get_weather_at(lat, lon):
+    """Weather payload for a coordinate, labelled with the nearest city; nearby points share one fetch"""
+    key = weather_key(lat, lon)
+    city_name = nearest_cities(lat, lon)[0]["city"]
+    return _with_last_known(key, lambda: _fetch_weather_at(city_name, lat, lon, key))
+
+def history_key(city_name):
+    """Name the weather history of a city is recorded under, without a geocoding call"""
+    resolved = CITY_RESOLVER.resolve(city_name)
+    return resolved[0] if resolved is not None else city_name.lower()
+
 @app.route('/api/weather/<city_name>', methods=['GET'])
 def get_weather_api(city_name):
     """API endpoint to get weather data for React Native using OpenWeatherMap"""
     try:
         print(f"🌤️ Weather API request for: {city_name}")
+        name, lat, lon = resolve_city(city_name)
+        served = {}
         
-        if not OWM_API_KEY:
-            raise Exception("OpenWeatherMap API key not found")
-        
-        # Get coordinates for the city
-        lat, lon = get_city_coordinates(city_name)
-        if lat is None or lon is None:
-            # Fallback: use OpenWeatherMap's city search
-            geocoding_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name},PH&limit=1&appid={OWM_API_KEY}"
-            geo_response = requests.get(geocoding_url)
-            if geo_response.status_code == 200:
-                geo_data = geo_response.json()
-                if geo_data:
-                    lat, lon = geo_data[0]['lat'], geo_data[0]['lon']
-                else:
-                    raise Exception(f"City '{city_name}' not found")
-            else:
-                raise Exception("Geocoding service unavailable")
-        
-        # Get current weather
-        current_url = f"{OWM_BASE_URL}/weather?lat={lat}&lon={lon}&appid={OWM_API_KEY}&units=metric"
-        current_response = requests.get(current_url)
+        def build():
+            payload = build_weather_response(name, get_weather_for(name, lat, lon))
+            served["stale"] = payload["weatherData"].get("stale", False)
+            return payload
         
-        if current_response.status_code != 200:
-            raise Exception(f"Weather API error: {current_response.status_code}")
-        
-        current_data = current_response.json()
+        # The body expires with the weather data behind it, not a full interval later.
+        # Last-known data served while OpenWeatherMap is down gets no lifetime at all.
+        return cached_json_response(_weather_responses, name, build,
+                                    lambda: 0 if served.get("stale") else _weather_cache.remaining(weather_key(lat, lon)))
+
+    except Exception as e:
+        print(f"❌ Weather API Exception: {str(e)}")
+        return jsonify({"success": False, "error": f"Weather service error: {str(e)}"}), 500
+
+@app.route('/api/weather/<city_name>/history', methods=['GET'])
+def get_weather_history_api(city_name):
+    """API endpoint for recorded daily weather (rain, temperature extremes) over the last ?days= days"""
+    try:
+        days = parse_history_days(request.args.get('days', 7))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    try:
+        print(f"📈 Weather history request for: {city_name} ({days} days)")
+        return jsonify(build_history_payload(WEATHER_HISTORY, history_key(city_name), days))
         
-        # Get 5-day forecast
-        forecast_url = f"{OWM_BASE_URL}/forecast?lat={lat}&lon={lon}&appid={OWM_API_KEY}&units=metric"
-        forecast_response = requests.get(forecast_url)
+    except Exception as e:
+        print(f"❌ Weather History Exception: {str(e)}")
+        return jsonify({"success": False, "error": f"Weather history error: {str(e)}"}), 500
+
+def fetch_weather_batch(items):
+    """Weather for every batch item; duplicates share one fetch and failures stay per item"""
+    futures = {}
+    for item in items:
+        key = weather_batch_key(item)
+        if key is None or key in futures:
+            continue
+        kind, value = item
+        if kind == "city":
+            futures[key] = _batch_pool.submit(get_weather_data, value)
+        else:
+            futures[key] = _batch_pool.submit(get_weather_at, *value)
+    
+    results = []
+    for item in items:
+        future = futures.get(weather_batch_key(item))
+        if future is None:
+            results.append(build_weather_batch_result(item))
+            continue
+        try:
+            results.append(build_weather_batch_result(item, future.result()))
+        except Exception as e:
+            results.append(build_weather_batch_result(item, error=f"Weather service error: {str(e)}"))
+    return results
+
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch_api():
+    """API endpoint to get weather for several cities and/or coordinates in one round trip"""
+    try:
+        items = parse_weather_batch(request.get_json(force=True, silent=True), WEATHER_BATCH_MAX_ITEMS)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    try:
+        print(f"🌤️ Batch weather request for {len(items)} locations")
+        results = fetch_weather_batch(items)
+        failed = sum(1 for result in results if not result["success"])
         
-        forecast_data = []
-        if forecast_response.status_code == 200:
-            forecast_json = forecast_response.json()
-            # Get next 3 days (skip today, take tomorrow and next 2 days)
-            daily_forecasts = {}
-            for item in forecast_json['list'][:24]:  # Next 24 entries (3 hours each = 72 hours)
-                date = datetime.fromtimestamp(item['dt']).strftime('%Y-%m-%d')
-                if date not in daily_forecasts:
-                    daily_forecasts[date] = {
-                        'temp_min': item['main']['temp_min'],
-                        'temp_max': item['main']['temp_max'],
-                        'condition': item['weather'][0]['description'].title(),
-                        'icon': 'rain' if 'rain' in item['weather'][0]['main'].lower() else 'sun'
-                    }
-                else:
-                    daily_forecasts[date]['temp_min'] = min(daily_forecasts[date]['temp_min'], item['main']['temp_min'])
-                    daily_forecasts[date]['temp_max'] = max(daily_forecasts[date]['temp_max'], item['main']['temp_max'])
-            
-            # Convert to forecast format (include today, next 2 days)
-            dates = sorted(daily_forecasts.keys())[:3]  # Include today, get next 3 days total
-            for i, date in enumerate(dates):
-                if i < 3:  # Limit to 3 days
-                    day_data = daily_forecasts[date]
-                    forecast_data.append({
-                        "day": f"Day {i+1}",
-                        "condition": day_data['condition'],
-                        "tempRange": f"{int(day_data['temp_min'])}°C - {int(day_data['temp_max'])}°C",
-                        "icon": day_data['icon']
-                    })
+        print(f"✅ Returning batch weather: {len(results) - failed} ok, {failed} failed")
+        return jsonify({"success": True, "results": results, "count": len(results), "failed": failed})
         
-        # Extract weather information
-        temperature = round(current_data['main']['temp'])
-        humidity = current_data['main']['humidity']
-        wind_speed = round(current_data['wind']['speed'] * 3.6)  # Convert m/s to km/h
-        condition = current_data['weather'][0]['description'].title()
+    except Exception as e:
+        print(f"❌ Batch Weather API Exception: {str(e)}")
+        return jsonify({"success": False, "error": f"Weather service error: {str(e)}"}), 500
+
+def submit_ndvi_source(city_name):
+    """The NDVI fetch for a city on the NDVI pool; dashboards loading the same city share the running one"""
+    key = city_name.strip().lower()
+    with _ndvi_lock:
+        future = _ndvi_in_flight.get(key)
+        if future is None:
+            future = _ndvi_pool.submit(fetch_ndvi_source, city_name)
+            _ndvi_in_flight[key] = future
+            future.add_done_callback(lambda done: _ndvi_in_flight.pop(key, None))
+    return future
+
+def start_dashboard_sources(city_name):
+    """Start the weather, soil and NDVI fetches for a farm dashboard concurrently"""
+    return {
+        "weather": _batch_pool.submit(get_weather_data, city_name),
+        "soil": _batch_pool.submit(fetch_soil_source, city_name, SOIL_DATASET),
+        "ndvi": submit_ndvi_source(city_name),
+    }
+
+@app.route('/api/dashboard/<city_name>', methods=['GET'])
+def get_dashboard_api(city_name):
+    """API endpoint for a whole farm screen in one round trip; ?stream=1 for NDJSON, ?deadline= seconds"""
+    try:
+        deadline = request.args.get('deadline')
+        deadlines = section_deadlines(float(deadline) if deadline is not None else None)
+        stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
         
-        # Calculate rain chance from cloudiness and weather condition
-        rain_chance = 0
-        if 'rain' in current_data:
-            rain_chance = 80
-        elif current_data['clouds']['all'] > 80:
-            rain_chance = 60
-        elif current_data['clouds']['all'] > 50:
-            rain_chance = 30
-        else:
-            rain_chance = 10
+        print(f"📋 Dashboard request for: {city_name}")
+        started = time.monotonic()
+        sources = start_dashboard_sources(city_name)
         
-        # Generate agricultural assessment
-        agricultural_tips = get_agricultural_assessment(temperature, humidity, wind_speed, rain_chance, condition)
+        if stream:
+            def generate():
+                events = []
+                for event in iter_section_events(sources, deadlines, started):
+                    events.append(event)
+                    yield json.dumps(event) + "\n"
+                yield json.dumps(dashboard_done_event(city_name, events, started)) + "\n"
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
         
-        weather_response = {
-            "success": True,
-            "weatherData": {
-                "location": city_name.title(),
-                "description": condition,
-                "temperature": temperature,
-                "humidity": humidity,
-                "windSpeed": wind_speed,
-                "rainChance": rain_chance,
-                "coordinates": {
-                    "lat": lat,
-                    "lon": lon
-                },
-                "forecast": forecast_data,
-                "tips": agricultural_tips
-            }
-        }
+        dashboard = build_dashboard_payload(city_name, iter_section_events(sources, deadlines, started), started)
+        print(f"✅ Returning dashboard for {city_name} in {dashboard['elapsedMs']} ms")
+        return jsonify(dashboard)
         
-        print(f"✅ Returning real weather data for {city_name}: {temperature}°C, {condition}")
-        return jsonify(weather_response)
-
     except Exception as e:
-        print(f"❌ Weather API Exception: {str(e)}")
-        return jsonify({"success": False, "error": f"Weather service error: {str(e)}"}), 500
+        print(f"❌ Dashboard API Exception: {str(e)}")
+        return jsonify({"success": False, "error": f"Dashboard service error: {str(e)}"}), 500
+
+def build_soil_payload(city_name):
+    """Full /api/soil response body for a city - prebuilt SoilGrids dataset, mock fallback"""
+    return shape_soil_payload(city_name, SOIL_DATASET)
 
 @app.route('/api/soil/<city_name>', methods=['GET'])
 def get_soil_api(city_name):
-    """API endpoint to get soil data for React Native - MOCK DATA"""
+    """API endpoint to get soil data for React Native - prebuilt SoilGrids dataset, mock fallback"""
     try:
         print(f"🌱 Soil API request for: {city_name}")
-        
-        # City-specific soil data
-        city_soil_data = {
-            'manila': {
-                "pH Level": "6.2", "Organic Carbon": "18.5 g/kg", 
-                "Clay Content": "35%", "Sand Content": "25%"
-            },
-            'cebu city': {
-                "pH Level": "6.8", "Organic Carbon": "22.1 g/kg", 
-                "Clay Content": "28%", "Sand Content": "32%"
-            },
-            'davao city': {
-                "pH Level": "6.5", "Organic Carbon": "24.8 g/kg", 
-                "Clay Content": "30%", "Sand Content": "28%"
-            },
-            'baguio': {
-                "pH Level": "5.9", "Organic Carbon": "31.2 g/kg", 
-                "Clay Content": "42%", "Sand Content": "18%"
-            },
-            'iloilo city': {
-                "pH Level": "6.4", "Organic Carbon": "20.3 g/kg", 
-                "Clay Content": "33%", "Sand Content": "26%"
-            }
-        }
-        
-        # Get city-specific soil data or default
-        city_key = city_name.lower()
-        soil_info = city_soil_data.get(city_key, {
-            "pH Level": "6.3", "Organic Carbon": "19.5 g/kg", 
-            "Clay Content": "32%", "Sand Content": "27%"
-        })
-        
-        # Mock soil data
-        mock_soil_data = {
-            "success": True,
-            "city": city_name.title(),
-            "coordinates": {"latitude": 14.5995, "longitude": 120.9842},
-            "soilData": soil_info
-        }
-        
-        print(f"✅ Returning soil data for {city_name}: pH {soil_info['pH Level']}")
-        return jsonify(mock_soil_data)
+        key = soil_cache_key(city_name, SOIL_DATASET)
+        if key is None:
+            # Any unknown name gets the same generic soil; caching it per name would grow without bound
+            body = app.json.dumps(build_soil_payload(city_name)).encode("utf-8")
+            return json_entry_response(CachedResponse(body, SOIL_CACHE_SECONDS))
+        return cached_json_response(_soil_responses, key, lambda: build_soil_payload(city_name))
         
     except Exception as e:
         print(f"❌ Soil API Exception: {str(e)}")
         return jsonify({"success": False, "error": f"Soil service error: {str(e)}"}), 500
 
+def build_cities_payload():
+    """Full /api/cities response body"""
+    return shape_cities_payload(CITY_CATALOGUE)
+
+# Serialize the full city list once at startup
+_cities_responses.get("all", build_cities_payload)
+
 @app.route('/api/cities', methods=['GET'])
 def get_cities_api():
-    """API endpoint to get list of available Philippine cities"""
+    """API endpoint to get list of available Philippine cities, or ?q=&limit=&offset= prefix search"""
     try:
-        print("🏙️ Cities API request")
-        
-        # Convert CITY_CENTERS to API format
-        cities_list = []
-        for city_name, coords in CITY_CENTERS.items():
-            cities_list.append({
-                "name": city_name.title(),
-                "key": city_name.lower().replace(" ", "_"),
-                "coordinates": {
-                    "latitude": coords[0],
-                    "longitude": coords[1]
-                }
-            })
+        query = request.args.get('q')
+        if query is None:
+            print("🏙️ Cities API request")
+            return cached_json_response(_cities_responses, "all", build_cities_payload)
         
-        # Sort cities alphabetically
-        cities_list.sort(key=lambda x: x["name"])
-        
-        cities_response = {
-            "success": True,
-            "cities": cities_list,
-            "count": len(cities_list)
-        }
-        
-        print(f"✅ Returning {len(cities_list)} Philippine cities")
-        return jsonify(cities_response)
+        # Autocomplete mode: prefix search with pagination
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        offset = max(int(request.args.get('offset', 0)), 0)
+        return jsonify({"success": True, "query": query, **CITY_CATALOGUE.search_page(query, limit, offset)})
         
     except Exception as e:
         print(f"❌ Cities API Exception: {str(e)}")
         return jsonify({"success": False, "error": f"Cities service error: {str(e)}"}), 500
 
-@app.route('/api/city-from-coords', methods=['GET'])
+def nearest_cities_batch(lats, lons, k=1):
+    """Nearest CITY_CENTERS entries for each coordinate, closest first, with distances in km"""
+    return build_nearest_cities(CITY_INDEX, CITY_CENTERS, lats, lons, k)
+
+def nearest_cities(lat, lon, k=1):
+    """Nearest CITY_CENTERS entries to a coordinate, closest first, with distances in km"""
+    return nearest_cities_batch([lat], [lon], k)[0]
+
+@app.route('/api/city-from-coords', methods=['GET', 'POST'])
 def get_city_from_coords():
-    """API endpoint to get nearest city from coordinates - MOCK DATA"""
+    """API endpoint to get the nearest city (or ?k= nearest cities) from coordinates; POST a points list for batches"""
     try:
-        lat = float(request.args.get('lat', 14.5995))
-        lon = float(request.args.get('lon', 120.9842))
+        if request.method == 'POST':
+            lats, lons, k = parse_city_lookup(request.get_json(force=True, silent=True), CITY_LOOKUP_MAX_POINTS)
+        else:
+            lat, lon = parse_coordinates(request.args.get('lat', 14.5995), request.args.get('lon', 120.9842))
+            k = parse_nearest_k(request.args.get('k', 1))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    try:
+        if request.method == 'POST':
+            print(f"📍 Batch city lookup for {len(lats)} coordinates")
+            
+            results = nearest_cities_batch(lats, lons, k)
+            return jsonify({"success": True, "results": results, "count": len(results)})
         
         print(f"📍 City lookup for coordinates: {lat}, {lon}")
         
-        # Mock response - always return Manila for simplicity
-        mock_response = {
-            "success": True,
-            "city": "Manila",
-            "distance": 0.1,
-            "coordinates": {
-                "latitude": 14.5995,
-                "longitude": 120.9842
-            }
-        }
+        nearest = nearest_cities(lat, lon, k)
+        city_response = {"success": True, **nearest[0]}
+        if k > 1:
+            city_response["nearest"] = nearest
         
-        print("✅ Returning city lookup data")
-        return jsonify(mock_response)
+        print(f"✅ Nearest city: {nearest[0]['city']} ({nearest[0]['distance']} km)")
+        return jsonify(city_response)
             
     except Exception as e:
         print(f"❌ City Lookup Exception: {str(e)}")
@@ -328,8 +463,12 @@ def index():
         "version": "2.0.0",
         "endpoints": [
             "GET /api/weather/<city_name>",
+            "GET /api/weather/<city_name>/history?days=",
+            "POST /api/weather/batch",
+            "GET /api/dashboard/<city_name>?stream=&deadline=",
             "GET /api/soil/<city_name>", 
-            "GET /api/cities",
+            "GET /api/cities?q=&limit=&offset=",
+            "GET|POST /api/city-from-coords",
             "GET /health"
         ],
         "data_source": "OpenWeatherMap API + Philippine Cities Database",
@@ -377,8 +516,11 @@ def print_server_info():
     print("🌤️  Starting AgriAngat Weather API Server - REAL DATA VERSION...")
     print("📡 Available endpoints:")
     print("  GET /api/weather/<city_name> (OpenWeatherMap API)")
+    print("  GET /api/weather/<city_name>/history (recorded rainfall and temperatures)")
+    print("  POST /api/weather/batch (several cities/coordinates)")
+    print("  GET /api/dashboard/<city_name> (weather, soil, crops, NDVI in one call)")
     print("  GET /api/soil/<city_name> (Agricultural Data)")
-    print("  GET /api/cities (Philippine Cities)")
+    print("  GET /api/cities?q= (Philippine Cities, prefix search)")
     print("  GET /health")
     print("\n🌐 Server accessible on:")
     
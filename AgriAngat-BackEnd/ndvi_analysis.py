@@ -0,0 +1,445 @@
+"""
+NDVI analysis for cities and bounding boxes.
+
+The library behind 3_senhub.py. It requests one Sentinel-2 NDVI raster per
+bbox, then summarizes it locally and saves a tiled folium map.
+analyze_locations runs many locations at once on a bounded thread pool,
+and write_stats_table writes the results for all of them to one CSV.
+monitor_parcels also scores each parcel against its monthly NDVI baseline.
+Sentinel Hub credentials come from the environment (.env), never input().
+sentinelhub is imported only by the functions that call Sentinel Hub, so the
+servers and tests can use the rest of this module without it.
+"""
+
+import csv
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ndvi_baseline import ParcelBaseline
+from ndvi_cache import NDVICache, get_default_cache, raster_key
+from ndvi_composite import EVALSCRIPT_BANDS_SCL, build_composite
+from ndvi_stats import COVERAGE_CLASSES, COVERAGE_LABELS, NDVIStats, summarize_ndvi
+from ndvi_tiles import save_ndvi_tile_map
+from ndvi_timeseries import DEFAULT_STEP_DAYS, NDVITrend, analyze_ndvi_series, collect_ndvi_series, season_intervals
+from ndvi_zonal import Parcel, group_parcels, rasterize_parcels, zonal_ndvi_stats
+from ph_cities import CITY_CENTERS
+
+if TYPE_CHECKING:
+    from sentinelhub import SHConfig
+
+load_dotenv()
+
+# (min_lon, min_lat, max_lon, max_lat) in WGS84
+BBoxCoords = Tuple[float, float, float, float]
+
+DEFAULT_HALF_SIZE = 0.01      # degrees around a city center
+DEFAULT_RESOLUTION = 10       # meters per pixel
+DEFAULT_WINDOW_DAYS = 30      # least-cloudy mosaic over this many days
+DATA_COLLECTION = "SENTINEL2_L2A"  # sentinelhub.DataCollection member; also names cached rasters
+NDVI_MAX_WORKERS = int(os.getenv("NDVI_MAX_WORKERS", "4"))
+
+# "max" or "median": mask clouds locally and composite per-date scenes instead of leastCC
+NDVI_COMPOSITE = os.getenv("NDVI_COMPOSITE") or None
+NDVI_COMPOSITE_WORKERS = int(os.getenv("NDVI_COMPOSITE_WORKERS", "2"))
+MAX_SCENE_CLOUD_COVER = float(os.getenv("NDVI_MAX_SCENE_CLOUD_COVER", "90"))
+
+# Raw NDVI values (not colored); invalid pixels come back as NaN
+EVALSCRIPT_NDVI = """
+//VERSION=3
+function setup() {
+  return {
+    input: ["B04", "B08", "dataMask"],
+    output: {
+      bands: 1,
+      sampleType: "FLOAT32"
+    }
+  };
+}
+
+function evaluatePixel(sample) {
+  // Calculate NDVI
+  let ndvi = (sample.B08 - sample.B04) / (sample.B08 + sample.B04);
+
+  // Handle invalid pixels
+  if (sample.dataMask == 0 || sample.B08 + sample.B04 == 0) {
+    return [NaN];
+  }
+
+  return [ndvi];
+}
+"""
+
+# Column order of the batch statistics table
+STATS_COLUMNS = (
+    ["name", "min_lon", "min_lat", "max_lon", "max_lat", "width", "height",
+     "total_pixels", "valid_pixels", "data_coverage_pct",
+     "mean", "std", "min", "p10", "p25", "median", "p75", "p90", "max"]
+    + [f"{name}_pct" for name in COVERAGE_CLASSES]
+    + ["excellent_pct", "health_status", "map", "error"]
+)
+
+# Column order of the time-series (trend) table
+SERIES_COLUMNS = [
+    "name", "min_lon", "min_lat", "max_lon", "max_lat", "season_start", "season_end", "dates",
+    "pixelsWithTrend", "meanSlopePer30Days", "greeningPct", "degradingPct", "peakDate", "peakNdviMedian", "error"
+]
+
+# Column order of the per-parcel (zonal) table
+PARCEL_COLUMNS = (
+    ["id", "group", "pixels", "validPixels", "dataCoveragePct", "mean", "std", "min", "median", "max"]
+    + [f"{name}Pct" for name in COVERAGE_CLASSES]
+    + ["healthStatus", "error"]
+)
+
+# Extra per-parcel columns in monitoring mode
+BASELINE_COLUMNS = ["baselineCount", "baselineMean", "baselineStd", "zScore", "anomaly"]
+
+
+def sh_config() -> "SHConfig":
+    """Sentinel Hub config from the same CONFIG.* variables KaagriBot reads"""
+    from sentinelhub import SHConfig
+    config = SHConfig()
+    config.sh_client_id = os.getenv("CONFIG.SH_CLIENT_ID", config.sh_client_id)
+    config.sh_client_secret = os.getenv("CONFIG.SH_CLIENT_SECRET", config.sh_client_secret)
+    config.instance_id = os.getenv("CONFIG.INSTANCE_ID", config.instance_id)
+    return config
+
+
+def sh_configured(config: Optional["SHConfig"] = None) -> bool:
+    config = config or sh_config()
+    return bool(config.sh_client_id and config.sh_client_secret)
+
+
+def city_bbox(lat: float, lon: float, half_size: float = DEFAULT_HALF_SIZE) -> BBoxCoords:
+    """Square bbox of ±half_size degrees around a point"""
+    return (lon - half_size, lat - half_size, lon + half_size, lat + half_size)
+
+
+def parse_bbox(text: str) -> BBoxCoords:
+    """'min_lon,min_lat,max_lon,max_lat' -> BBoxCoords"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in text.split(","))
+    except ValueError:
+        raise ValueError(f"Bounding box '{text}' must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ValueError(f"Bounding box '{text}' is out of range or inverted")
+    return (min_lon, min_lat, max_lon, max_lat)
+
+
+def city_locations(cities: Sequence[str], half_size: float = DEFAULT_HALF_SIZE) -> Dict[str, BBoxCoords]:
+    """{city: bbox} for known Philippine cities; raises ValueError naming any unknown ones"""
+    unknown = [city for city in cities if city.strip().lower() not in CITY_CENTERS]
+    if unknown:
+        raise ValueError(f"Unknown cities: {', '.join(unknown)}")
+    return {city.strip().lower(): city_bbox(*CITY_CENTERS[city.strip().lower()], half_size) for city in cities}
+
+
+def _cached_raster(product: str, bbox_coords: BBoxCoords, resolution: int, time_interval: Tuple[str, str],
+                   fetch, cache: Optional[NDVICache], use_cache: bool) -> np.ndarray:
+    cache = (cache or get_default_cache()) if use_cache else None
+    if cache is None:
+        return fetch()
+    return cache.get_or_fetch(raster_key(product, bbox_coords, resolution, *time_interval), fetch)
+
+
+def acquisition_dates(bbox_coords: BBoxCoords, start_date: str, end_date: str,
+                      config: Optional["SHConfig"] = None,
+                      max_cloud_cover: float = MAX_SCENE_CLOUD_COVER) -> List[str]:
+    """Distinct Sentinel-2 L2A acquisition dates over a bbox, skipping scenes that are almost all cloud"""
+    from sentinelhub import CRS, BBox, DataCollection, SentinelHubCatalog
+    catalog = SentinelHubCatalog(config=config or sh_config())
+    results = catalog.search(
+        getattr(DataCollection, DATA_COLLECTION),
+        bbox=BBox(bbox=list(bbox_coords), crs=CRS.WGS84),
+        time=(start_date, end_date),
+        filter=f"eo:cloud_cover < {max_cloud_cover:g}",
+        fields={"include": ["properties.datetime"], "exclude": []}
+    )
+    return sorted({item["properties"]["datetime"][:10] for item in results})
+
+
+def request_bands(bbox_coords: BBoxCoords, date: str, config: Optional["SHConfig"] = None,
+                  resolution: int = DEFAULT_RESOLUTION, cache: Optional[NDVICache] = None,
+                  use_cache: bool = True) -> np.ndarray:
+    """(y, x, 3) UINT16 B04, B08 and scene classification of one acquisition date"""
+    from sentinelhub import CRS, BBox, DataCollection, MimeType, SentinelHubRequest, bbox_to_dimensions
+    bbox = BBox(bbox=list(bbox_coords), crs=CRS.WGS84)
+
+    def fetch():
+        request = SentinelHubRequest(
+            evalscript=EVALSCRIPT_BANDS_SCL,
+            input_data=[
+                SentinelHubRequest.input_data(
+                    data_collection=getattr(DataCollection, DATA_COLLECTION),
+                    time_interval=(date, date),
+                    mosaicking_order='mostRecent'
+                )
+            ],
+            responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+            bbox=bbox,
+            size=bbox_to_dimensions(bbox, resolution=resolution),
+            config=config or sh_config()
+        )
+        return request.get_data()[0]
+
+    return _cached_raster(f"{DATA_COLLECTION}_B04_B08_SCL", bbox_coords, resolution, (date, date),
+                          fetch, cache, use_cache)
+
+
+def request_ndvi(bbox_coords: BBoxCoords, config: Optional["SHConfig"] = None,
+                 end_date: Optional[datetime] = None, window_days: int = DEFAULT_WINDOW_DAYS,
+                 resolution: int = DEFAULT_RESOLUTION, cache: Optional[NDVICache] = None,
+                 use_cache: bool = True, composite: Optional[str] = NDVI_COMPOSITE) -> np.ndarray:
+    """Sentinel-2 L2A NDVI raster (float32, NaN = no data) for a bbox
+
+    By default this is Sentinel Hub's least-cloudy mosaic. With composite
+    ("max" or "median") every acquisition date in the window is cloud-masked
+    with its scene classification and composited locally instead.
+    Rasters are cached on disk per bbox, resolution and imagery window (whole
+    days), so a repeat request the same day is a read-only memory map.
+    """
+    from sentinelhub import CRS, BBox, DataCollection, MimeType, SentinelHubRequest, bbox_to_dimensions
+    end_date = end_date or datetime.now()
+    start_date = end_date - timedelta(days=window_days)
+    time_interval = (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    bbox = BBox(bbox=list(bbox_coords), crs=CRS.WGS84)
+    config = config or sh_config()
+
+    def fetch():
+        request = SentinelHubRequest(
+            evalscript=EVALSCRIPT_NDVI,
+            input_data=[
+                SentinelHubRequest.input_data(
+                    data_collection=getattr(DataCollection, DATA_COLLECTION),
+                    time_interval=time_interval,
+                    mosaicking_order='leastCC'
+                )
+            ],
+            responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+            bbox=bbox,
+            size=bbox_to_dimensions(bbox, resolution=resolution),
+            config=config
+        )
+        return request.get_data()[0]
+
+    if not composite:
+        return _cached_raster(DATA_COLLECTION, bbox_coords, resolution, time_interval, fetch, cache, use_cache)
+
+    work_cache = (cache or get_default_cache()) if use_cache else None
+
+    def fetch_composite():
+        dates = acquisition_dates(bbox_coords, *time_interval, config)
+        ndvi, _ = build_composite(
+            dates, lambda date: request_bands(bbox_coords, date, config, resolution, cache, use_cache),
+            composite, NDVI_COMPOSITE_WORKERS, work_dir=work_cache.directory if work_cache else None
+        )
+        return ndvi
+
+    return _cached_raster(f"{DATA_COLLECTION}_{composite.upper()}_COMPOSITE", bbox_coords, resolution,
+                          time_interval, fetch_composite, cache, use_cache)
+
+
+def request_ndvi_series(bbox_coords: BBoxCoords, season_start: datetime, season_end: datetime,
+                        step_days: int = DEFAULT_STEP_DAYS, config: Optional["SHConfig"] = None,
+                        resolution: int = DEFAULT_RESOLUTION, max_workers: int = NDVI_MAX_WORKERS,
+                        path: Optional[str] = None, use_cache: bool = True,
+                        composite: Optional[str] = NDVI_COMPOSITE):
+    """(dates, (time, y, x) stack) with one NDVI raster (leastCC or composite) per step_days interval"""
+    config = config or sh_config()
+
+    def fetch(start: datetime, end: datetime) -> np.ndarray:
+        return request_ndvi(bbox_coords, config, end_date=end, window_days=(end - start).days,
+                            resolution=resolution, use_cache=use_cache, composite=composite)
+
+    return collect_ndvi_series(season_intervals(season_start, season_end, step_days), fetch, max_workers, path)
+
+
+def analyze_ndvi_trend(bbox_coords: BBoxCoords, season_start: datetime, season_end: datetime,
+                       step_days: int = DEFAULT_STEP_DAYS, anomaly_path: Optional[str] = None,
+                       work_dir: Optional[str] = None, **options) -> NDVITrend:
+    """Per-pixel greening/degrading trend, seasonal peak and anomalies for a bbox over a season
+
+    The stack is a temporary memory map in work_dir (default: the NDVI cache
+    directory). Per-pixel anomaly z-scores are written to anomaly_path when
+    given; otherwise only the per-date anomaly counts are kept.
+    """
+    if not work_dir:
+        cache = get_default_cache()
+        work_dir = cache.directory if cache else tempfile.gettempdir()
+    os.makedirs(work_dir, exist_ok=True)
+    # Not .npy, so the cache directory's LRU eviction never picks up a stack being built
+    fd, path = tempfile.mkstemp(suffix=".stack", dir=work_dir)
+    os.close(fd)
+    try:
+        dates, stack = request_ndvi_series(bbox_coords, season_start, season_end, step_days, path=path, **options)
+        trend = analyze_ndvi_series(stack, dates, anomaly_path=anomaly_path, keep_anomalies=False)
+        del stack  # release the map before its file is removed
+        return trend
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def save_ndvi_map(ndvi: np.ndarray, bbox_coords: BBoxCoords, path: str) -> str:
+    """Folium map loading the colored NDVI as XYZ tiles from <name>_tiles/; returns the path written"""
+    return save_ndvi_tile_map(ndvi, bbox_coords, path)
+
+
+def print_ndvi_report(stats: NDVIStats):
+    """Text summary of the most important NDVI values"""
+    print("\n" + "="*50)
+    print("📈 MOST IMPORTANT NDVI VALUES (TEXT SUMMARY)")
+    print("="*50)
+
+    if not stats.has_data:
+        print("❌ No valid NDVI data found in the selected area.")
+        return
+
+    # Basic statistics
+    print(f"🎯 OVERALL HEALTH SCORE: {stats.mean:.3f}")
+    print(f"   Mean NDVI: {stats.mean:.3f}")
+    print(f"   Median NDVI: {stats.median:.3f}")
+    print(f"   Standard Deviation: {stats.std:.3f}")
+    print(f"   Range: {stats.minimum:.3f} to {stats.maximum:.3f}")
+
+    print("\n📊 KEY PERCENTILES:")
+    print(f"   90th percentile (healthiest areas): {stats.percentile(90):.3f}")
+    print(f"   75th percentile: {stats.percentile(75):.3f}")
+    print(f"   25th percentile: {stats.percentile(25):.3f}")
+    print(f"   10th percentile (least healthy): {stats.percentile(10):.3f}")
+
+    # Vegetation coverage analysis
+    print("\n🌱 VEGETATION COVERAGE BREAKDOWN:")
+    for name in COVERAGE_CLASSES:
+        print(f"   {COVERAGE_LABELS[name]}: {stats.coverage_pct(name):.1f}% ({stats.coverage_counts[name]:,} pixels)")
+
+    # Health interpretation
+    print("\n🏥 VEGETATION HEALTH INTERPRETATION:")
+    print(f"   Overall Status: {stats.health_status}")
+
+    # Hotspot analysis (areas of concern and excellence)
+    if stats.low_vegetation_concern:  # More than 20% low NDVI
+        print(f"   ⚠️  CONCERN: {stats.coverage_pct('water_bare'):.1f}% of area has very low vegetation")
+
+    if stats.high_vegetation_excellence:  # More than 10% very high NDVI
+        print(f"   ✨ EXCELLENCE: {stats.excellent_pct:.1f}% of area has excellent vegetation")
+
+    print("\n🔢 TECHNICAL DETAILS:")
+    print(f"   Total valid pixels: {stats.valid_pixels:,}")
+    print(f"   Invalid/masked pixels: {stats.invalid_pixels:,}")
+    print(f"   Data coverage: {stats.data_coverage_pct:.1f}%")
+
+
+def map_file_name(name: str) -> str:
+    """'<name>.html' safe to join onto the map directory; separators and dots never survive"""
+    return (re.sub(r"[^\w-]+", "_", name).strip("_") or "location") + ".html"
+
+
+def analyze_location(name: str, bbox_coords: BBoxCoords, config: Optional["SHConfig"] = None,
+                     map_dir: Optional[str] = None, **request_options) -> Dict:
+    """One row of the statistics table for a location; failures are recorded in 'error'"""
+    row = dict(zip(("name", "min_lon", "min_lat", "max_lon", "max_lat"), (name, *bbox_coords)))
+    try:
+        ndvi = request_ndvi(bbox_coords, config, **request_options)
+        row["height"], row["width"] = ndvi.shape[:2]
+        row.update(summarize_ndvi(ndvi).to_dict())
+        if map_dir:
+            row["map"] = save_ndvi_map(ndvi, bbox_coords, os.path.join(map_dir, map_file_name(name)))
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def analyze_location_series(name: str, bbox_coords: BBoxCoords, config: Optional["SHConfig"] = None,
+                            map_dir: Optional[str] = None, season_days: int = 90,
+                            step_days: int = DEFAULT_STEP_DAYS, end_date: Optional[datetime] = None,
+                            **request_options) -> Dict:
+    """One row of the trend table for a location over the last season_days; failures go in 'error'"""
+    season_end = end_date or datetime.now()
+    season_start = season_end - timedelta(days=season_days)
+    row = dict(zip(("name", "min_lon", "min_lat", "max_lon", "max_lat"), (name, *bbox_coords)))
+    row.update(season_start=season_start.strftime('%Y-%m-%d'), season_end=season_end.strftime('%Y-%m-%d'))
+    try:
+        # Dates of one location are fetched one after another; the location pool bounds concurrency
+        trend = analyze_ndvi_trend(bbox_coords, season_start, season_end, step_days,
+                                   config=config, max_workers=1, **request_options)
+        row.update({key: value for key, value in trend.summary().items() if key != "perDate"})
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def analyze_locations(locations: Dict[str, BBoxCoords], config: Optional["SHConfig"] = None,
+                      map_dir: Optional[str] = None, max_workers: int = NDVI_MAX_WORKERS,
+                      analyzer: Callable[..., Dict] = analyze_location, **request_options) -> List[Dict]:
+    """Rows for every location, in input order, with at most max_workers requests in flight
+
+    analyzer is analyze_location (snapshot statistics) or analyze_location_series (trends).
+    """
+    config = config or sh_config()
+    if map_dir:
+        os.makedirs(map_dir, exist_ok=True)
+
+    def analyze(item):
+        return analyzer(item[0], item[1], config, map_dir, **request_options)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(locations) or 1))) as pool:
+        return list(pool.map(analyze, locations.items()))
+
+
+def analyze_parcels(parcels: Sequence[Parcel], config: Optional["SHConfig"] = None,
+                    max_workers: int = NDVI_MAX_WORKERS, **request_options) -> List[Dict]:
+    """Per-parcel NDVI statistics, in input order, with one raster request per group of nearby parcels"""
+    config = config or sh_config()
+    groups = group_parcels(parcels)
+
+    def analyze_group(group):
+        bbox_coords, members = group
+        try:
+            ndvi = request_ndvi(bbox_coords, config, **request_options)
+            labels = rasterize_parcels([parcels[i] for i in members], bbox_coords, ndvi.shape[:2])
+            return zonal_ndvi_stats(ndvi, labels, [parcels[i].id for i in members])
+        except Exception as e:
+            return [{"id": parcels[i].id, "error": str(e)} for i in members]
+
+    rows: List[Optional[Dict]] = [None] * len(parcels)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups) or 1))) as pool:
+        for g, ((_, members), results) in enumerate(zip(groups, pool.map(analyze_group, groups))):
+            for i, result in zip(members, results):
+                rows[i] = dict(result, group=g)
+    return rows
+
+
+def monitor_parcels(parcels: Sequence[Parcel], baseline: ParcelBaseline, config: Optional["SHConfig"] = None,
+                    end_date: Optional[datetime] = None, max_workers: int = NDVI_MAX_WORKERS,
+                    **request_options) -> List[Dict]:
+    """analyze_parcels, plus each parcel's z-score against its baseline for the window's month
+
+    The new means are folded into the baseline afterwards, once per imagery window:
+    a second run for the same window scores the parcels without counting them again.
+    """
+    end_date = end_date or datetime.now()
+    rows = analyze_parcels(parcels, config, max_workers, end_date=end_date, **request_options)
+    start_date = end_date - timedelta(days=request_options.get("window_days", DEFAULT_WINDOW_DAYS))
+    window = f"{start_date:%Y-%m-%d}/{end_date:%Y-%m-%d}"  # whole days, like the raster cache
+    scores = baseline.observe(end_date.month, {row["id"]: row.get("mean") for row in rows if not row.get("error")},
+                              window=window)
+    return [dict(row, **scores.get(row["id"], {})) for row in rows]
+
+
+def write_stats_table(rows: List[Dict], path: str, columns: Sequence[str] = STATS_COLUMNS) -> str:
+    """One CSV with a row per location (STATS_COLUMNS; SERIES_COLUMNS or PARCEL_COLUMNS for the other modes)"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
@@ -0,0 +1,252 @@
+"""
+Monthly NDVI baselines and anomaly scoring for loan monitoring.
+
+A baseline keeps only count, mean and M2 (the sum of squared deviations)
+per calendar month and updates them with Welford's algorithm as each new
+raster or parcel summary arrives. Raw history is never stored or
+reloaded. observe() first scores the new values against the baseline as
+it stood, as z = (value - mean) / std, and then folds them in, so "2σ below
+its usual level for this month" is simply z <= -2.
+
+- ParcelBaseline: one row per (parcel, month) in SQLite; thousands of
+  parcels are read, updated and written back in one vectorized batch.
+  Each row remembers the imagery window it last folded in, so re-running
+  a monitoring job for the same window scores it without counting it twice.
+- PixelBaseline: a (12, 3, y, x) float32 memory map per raster grid,
+  scored and updated block by block so only a few rows are in memory.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ndvi_cache import raster_key
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.getenv(
+    "NDVI_BASELINE_PATH", os.path.join(_BACKEND_DIR, ".cache", "ndvi_baseline.sqlite3")
+)
+DEFAULT_PIXEL_BASELINE_DIR = os.getenv(
+    "NDVI_PIXEL_BASELINE_DIR", os.path.join(_BACKEND_DIR, ".cache", "ndvi_baseline")
+)
+
+ANOMALY_Z = 2.0
+MIN_BASELINE_COUNT = 3      # observations of a month before it is scored
+MIN_NDVI_STD = 0.02         # floor for sensor and mosaic noise; keeps very steady fields from flagging
+MAX_CHUNK_BYTES = 32 * 1024 * 1024
+_SQL_BATCH = 500            # parcel ids per IN (...) query
+
+COUNT, MEAN, M2 = range(3)
+
+
+def welford_update(count: np.ndarray, mean: np.ndarray, m2: np.ndarray,
+                   values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fold one new value per element into (count, mean, M2); NaN values leave the element unchanged"""
+    valid = ~np.isnan(values)
+    new_count = count + valid
+    delta = np.where(valid, values - mean, 0.0)
+    new_mean = mean + np.where(valid, delta / np.maximum(new_count, 1), 0.0)
+    new_m2 = m2 + np.where(valid, delta * (values - new_mean), 0.0)
+    return new_count, new_mean, new_m2
+
+
+def baseline_std(count: np.ndarray, m2: np.ndarray) -> np.ndarray:
+    """Sample standard deviation, floored at MIN_NDVI_STD; NaN with fewer than two observations"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(np.where(count >= 2, m2 / (count - 1), np.nan))
+    return np.where(np.isnan(std), np.nan, np.maximum(std, MIN_NDVI_STD))
+
+
+def z_scores(values: np.ndarray, count: np.ndarray, mean: np.ndarray, m2: np.ndarray,
+             min_count: int = MIN_BASELINE_COUNT) -> np.ndarray:
+    """(value - mean) / std against a baseline; NaN where the value or the baseline is missing"""
+    std = baseline_std(count, m2)
+    with np.errstate(invalid="ignore"):
+        return np.where((count >= min_count) & ~np.isnan(values), (values - mean) / std, np.nan)
+
+
+class ParcelBaseline:
+    """Per-parcel monthly NDVI mean/variance in SQLite"""
+
+    def __init__(self, path: str = DEFAULT_BASELINE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS parcel_baseline (
+                    parcel_id TEXT NOT NULL,
+                    month INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    mean REAL NOT NULL,
+                    m2 REAL NOT NULL,
+                    last_window TEXT,
+                    PRIMARY KEY (parcel_id, month)
+                ) WITHOUT ROWID
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(parcel_baseline)")]
+            if "last_window" not in columns:
+                conn.execute("ALTER TABLE parcel_baseline ADD COLUMN last_window TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, reused across calls"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn, month: int, ids: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List]:
+        position = {parcel_id: i for i, parcel_id in enumerate(ids)}
+        count, mean, m2 = np.zeros(len(ids)), np.zeros(len(ids)), np.zeros(len(ids))
+        windows: List[Optional[str]] = [None] * len(ids)
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            rows = conn.execute(
+                f"SELECT parcel_id, count, mean, m2, last_window FROM parcel_baseline "
+                f"WHERE month = ? AND parcel_id IN ({','.join('?' * len(batch))})",
+                (month, *batch)
+            ).fetchall()
+            for parcel_id, c, mu, s, window in rows:
+                i = position[parcel_id]
+                count[i], mean[i], m2[i], windows[i] = c, mu, s, window
+        return count, mean, m2, windows
+
+    @staticmethod
+    def _scored(ids, values, count, mean, m2, threshold: float) -> Dict[str, Dict]:
+        z = z_scores(values, count, mean, m2)
+        std = baseline_std(count, m2)
+        return {
+            parcel_id: {
+                "baselineCount": int(count[i]),
+                "baselineMean": round(float(mean[i]), 4) if count[i] else None,
+                "baselineStd": None if np.isnan(std[i]) else round(float(std[i]), 4),
+                "zScore": None if np.isnan(z[i]) else round(float(z[i]), 2),
+                "anomaly": bool(z[i] <= -threshold) if not np.isnan(z[i]) else False,
+            }
+            for i, parcel_id in enumerate(ids)
+        }
+
+    def score(self, month: int, values: Mapping[str, Optional[float]], threshold: float = ANOMALY_Z) -> Dict[str, Dict]:
+        """z-scores of parcel NDVI values against their baseline for a month (1-12), without updating"""
+        ids = list(values)
+        vals = np.array([np.nan if values[i] is None else values[i] for i in ids], dtype=np.float64)
+        count, mean, m2, _ = self._load(self._connect(), month, ids)
+        return self._scored(ids, vals, count, mean, m2, threshold)
+
+    def observe(self, month: int, values: Mapping[str, Optional[float]], threshold: float = ANOMALY_Z,
+                window: Optional[str] = None) -> Dict[str, Dict]:
+        """Score parcel NDVI values against the baseline, then fold them into it; one transaction
+
+        window names the imagery the values came from (e.g. its date range).
+        A parcel whose last folded-in window is the same one is scored but not
+        folded in again, so repeated runs cannot bias the mean or shrink the variance.
+        """
+        ids = list(values)
+        vals = np.array([np.nan if values[i] is None else values[i] for i in ids], dtype=np.float64)
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")  # read-modify-write must not interleave with another writer
+            count, mean, m2, windows = self._load(conn, month, ids)
+            result = self._scored(ids, vals, count, mean, m2, threshold)
+            if window is not None:
+                vals[[i for i, seen in enumerate(windows) if seen == window]] = np.nan
+            count, mean, m2 = welford_update(count, mean, m2, vals)
+            observed = ~np.isnan(vals)
+            conn.executemany(
+                "INSERT OR REPLACE INTO parcel_baseline VALUES (?, ?, ?, ?, ?, ?)",
+                [(ids[i], month, int(count[i]), float(mean[i]), float(m2[i]), window)
+                 for i in np.flatnonzero(observed)]
+            )
+        return result
+
+    def get(self, parcel_id: str, month: int) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT count, mean, m2 FROM parcel_baseline WHERE parcel_id = ? AND month = ?", (parcel_id, month)
+        ).fetchone()
+        if row is None:
+            return None
+        std = baseline_std(np.array([row[0]]), np.array([row[2]]))[0]
+        return {"count": row[0], "mean": row[1], "std": None if np.isnan(std) else float(std)}
+
+
+def pixel_baseline_path(bbox_coords: Sequence[float], resolution: float,
+                        directory: str = DEFAULT_PIXEL_BASELINE_DIR) -> str:
+    """Baseline file for one raster grid (bbox + resolution)"""
+    return os.path.join(directory, raster_key("PIXEL_BASELINE", bbox_coords, resolution, "", "") + ".npy")
+
+
+class PixelBaseline:
+    """Per-pixel monthly NDVI count/mean/M2 for one raster grid, as a (12, 3, y, x) float32 memory map
+
+    One writer per grid at a time (the monitoring job); readers may map it concurrently.
+    """
+
+    def __init__(self, path: str, shape: Optional[Tuple[int, int]] = None):
+        self.path = path
+        if os.path.exists(path):
+            self.data = np.load(path, mmap_mode="r+")
+            if shape is not None and self.data.shape[2:] != tuple(shape):
+                raise ValueError(f"Baseline at {path} is {self.data.shape[2:]}, raster is {tuple(shape)}")
+        elif shape is None:
+            raise FileNotFoundError(f"No pixel baseline at {path}")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.data = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(12, 3) + tuple(shape))
+            self.data[:] = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.data.shape[2:]
+
+    def _rows(self, max_chunk_bytes: int) -> int:
+        return max(1, max_chunk_bytes // (self.shape[1] * 8 * 8))
+
+    def _blocks(self, raster: np.ndarray, chunk_rows: Optional[int]):
+        raster = np.asarray(raster)
+        if raster.shape != self.shape:
+            raise ValueError(f"Raster is {raster.shape}, baseline grid is {self.shape}")
+        rows = chunk_rows or self._rows(MAX_CHUNK_BYTES)
+        for r0 in range(0, self.shape[0], rows):
+            yield r0, min(r0 + rows, self.shape[0]), raster[r0:r0 + rows].astype(np.float64)
+
+    def score(self, month: int, raster: np.ndarray, min_count: int = MIN_BASELINE_COUNT,
+              chunk_rows: Optional[int] = None) -> np.ndarray:
+        """(y, x) float32 z-scores of a raster against this month's baseline, without updating"""
+        z = np.full(self.shape, np.nan, dtype=np.float32)
+        for r0, r1, values in self._blocks(raster, chunk_rows):
+            count, mean, m2 = np.asarray(self.data[month - 1, :, r0:r1], dtype=np.float64)
+            z[r0:r1] = z_scores(values, count, mean, m2, min_count)
+        return z
+
+    def observe(self, month: int, raster: np.ndarray, min_count: int = MIN_BASELINE_COUNT,
+                chunk_rows: Optional[int] = None) -> np.ndarray:
+        """Score a raster against this month's baseline, then fold it in, one block of rows at a time"""
+        z = np.full(self.shape, np.nan, dtype=np.float32)
+        with self._lock:
+            for r0, r1, values in self._blocks(raster, chunk_rows):
+                stats = self.data[month - 1, :, r0:r1]
+                count, mean, m2 = np.asarray(stats, dtype=np.float64)
+                z[r0:r1] = z_scores(values, count, mean, m2, min_count)
+                stats[:] = np.stack(welford_update(count, mean, m2, values))
+            self.data.flush()
+        return z
+
+    def mean(self, month: int) -> np.ndarray:
+        count, mean = self.data[month - 1, COUNT], self.data[month - 1, MEAN]
+        return np.where(count > 0, mean, np.nan)
+
+    def std(self, month: int) -> np.ndarray:
+        return baseline_std(self.data[month - 1, COUNT].astype(np.float64), self.data[month - 1, M2].astype(np.float64))
+
+
+def anomaly_share(z: np.ndarray, threshold: float = ANOMALY_Z) -> Optional[float]:
+    """Percent of scored pixels at or below -threshold σ, None when nothing could be scored"""
+    scored = ~np.isnan(z)
+    n = int(scored.sum())
+    return round(float((z[scored] <= -threshold).sum()) / n * 100, 2) if n else None
@@ -0,0 +1,137 @@
+"""
+On-disk cache of NDVI rasters.
+
+Each raster is one .npy file named by a hash of everything that defines
+it: data collection, bbox (rounded to ~1 m), resolution, and the dates of
+the imagery window. Hits are memory-mapped read-only, so a repeat analysis
+or map re-render reads straight from disk without calling Sentinel Hub.
+
+The directory is bounded by NDVI_CACHE_MAX_MB. A hit touches the file's
+mtime, and when the budget is exceeded the least recently used rasters are
+deleted first. Because recency lives in the filesystem, the Flask server,
+the batch CLI and KaagriBot can all share one cache directory.
+"""
+
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_NDVI_CACHE_DIR = os.getenv(
+    "NDVI_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ndvi")
+)
+NDVI_CACHE_MAX_BYTES = int(float(os.getenv("NDVI_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+# Decimal places kept from bbox coordinates; 5 places is ~1 m at the equator
+BBOX_KEY_DECIMALS = 5
+
+
+def raster_key(collection: str, bbox_coords: Sequence[float], resolution: float,
+               start_date: str, end_date: str) -> str:
+    """Cache key for one NDVI raster request"""
+    bbox_text = ",".join(f"{round(c, BBOX_KEY_DECIMALS):.{BBOX_KEY_DECIMALS}f}" for c in bbox_coords)
+    ident = f"{collection.lower()}|{bbox_text}|{resolution:g}|{start_date}|{end_date}"
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+class NDVICache:
+    """Size-bounded, least-recently-used directory of memory-mapped .npy rasters"""
+
+    def __init__(self, directory: str = DEFAULT_NDVI_CACHE_DIR, max_bytes: int = NDVI_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Read-only memory map of a cached raster, or None"""
+        path = self.path(key)
+        try:
+            raster = np.load(path, mmap_mode="r")
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return raster
+
+    def put(self, key: str, raster: np.ndarray) -> np.ndarray:
+        """Store a raster and return its memory-mapped copy"""
+        path = self.path(key)
+        # pid + thread in the temp name: concurrent writers never share a file, os.replace is atomic
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(raster))
+        os.replace(tmp_path, path)
+        # Map before evicting, and never evict the raster just written: a raster larger
+        # than the whole budget stays until the next put makes it the oldest entry
+        stored = np.load(path, mmap_mode="r")
+        self.evict(keep=key)
+        return stored
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], np.ndarray]) -> np.ndarray:
+        """Cached raster, calling fetch() at most once per key across threads on a miss"""
+        raster = self.get(key)
+        if raster is not None:
+            return raster
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            raster = self.get(key)
+            if raster is None:
+                raster = self.put(key, fetch())
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return raster
+
+    def _entries(self) -> List[os.DirEntry]:
+        return [entry for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith(".npy")]
+
+    def size_bytes(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete least recently used rasters other than keep until under max_bytes; returns bytes freed"""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        freed = 0
+        for entry in entries:
+            if total - freed <= self.max_bytes:
+                break
+            if entry.name == f"{keep}.npy":
+                continue
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)  # open memory maps keep their data until released
+                freed += size
+            except OSError:
+                continue  # removed by another process, or still mapped on Windows
+        return freed
+
+    def clear(self):
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+_default_cache: Optional[NDVICache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[NDVICache]:
+    """Process-wide cache at DEFAULT_NDVI_CACHE_DIR; None when NDVI_CACHE_MAX_MB is 0"""
+    global _default_cache
+    if NDVI_CACHE_MAX_BYTES <= 0:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = NDVICache()
+        return _default_cache
@@ -0,0 +1,46 @@
+"""
+Local NDVI colorization.
+
+Reproduces the 11-class NDVI color ramp that used to be rendered by a
+second Sentinel Hub request, so one FLOAT32 NDVI request per analysis is
+enough: the overlay is a lookup into a palette by np.digitize class.
+"""
+
+import numpy as np
+
+# Class boundaries: class i covers NDVI_THRESHOLDS[i-1] <= ndvi < NDVI_THRESHOLDS[i]
+NDVI_THRESHOLDS = np.array([-0.2, -0.1, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8])
+
+# (label, RGB in 0-1) per class, from the original evalscript
+NDVI_CLASSES = (
+    ("Deep water", (0.0, 0.0, 0.4)),
+    ("Shallow water", (0.0, 0.4, 0.8)),
+    ("Wet soil/sand", (0.7, 0.8, 1.0)),
+    ("Bare soil/rock", (0.8, 0.7, 0.5)),
+    ("Very sparse vegetation", (0.9, 0.8, 0.6)),
+    ("Sparse vegetation", (0.9, 0.9, 0.3)),
+    ("Moderate vegetation", (0.6, 0.9, 0.2)),
+    ("Good vegetation", (0.3, 0.8, 0.2)),
+    ("Dense vegetation", (0.1, 0.7, 0.1)),
+    ("Very dense vegetation", (0.0, 0.6, 0.0)),
+    ("Extremely dense vegetation", (0.0, 0.4, 0.0)),
+)
+
+# RGBA lookup table; the extra last row is the transparent color for no-data pixels
+NDVI_PALETTE = np.array(
+    [[*np.round(np.array(rgb) * 255), 255] for _, rgb in NDVI_CLASSES] + [[0, 0, 0, 0]],
+    dtype=np.uint8
+)
+NO_DATA_CLASS = len(NDVI_CLASSES)
+
+
+def classify_ndvi(ndvi: np.ndarray) -> np.ndarray:
+    """Color class index per pixel (0-10), NO_DATA_CLASS where NDVI is NaN"""
+    ndvi = np.asarray(ndvi)
+    classes = np.digitize(ndvi, NDVI_THRESHOLDS)
+    return np.where(np.isnan(ndvi), NO_DATA_CLASS, classes)
+
+
+def colorize_ndvi(ndvi: np.ndarray) -> np.ndarray:
+    """(..., 4) uint8 RGBA overlay for an NDVI array; NaN pixels are transparent"""
+    return NDVI_PALETTE[classify_ndvi(ndvi)]
@@ -0,0 +1,136 @@
+"""
+Local cloud masking and multi-date NDVI compositing.
+
+This is an alternative to Sentinel Hub's leastCC mosaic, which still lets
+cloudy pixels through in the rainy season. For every acquisition date in
+the window we pull B04, B08 and the Sentinel-2 L2A scene classification
+layer (SCL). Pixels classified as cloud, cirrus, cloud shadow, snow,
+saturated or no-data become NaN, and each date's masked NDVI goes into a
+(time, y, x) stack, memory-mapped on disk when a path is given. The stack
+is then reduced in row blocks to a max-NDVI or median composite.
+"""
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Sentinel-2 L2A scene classification values that do not show the ground
+SCL_NO_DATA = 0
+SCL_SATURATED = 1
+SCL_CLOUD_SHADOW = 3
+SCL_CLOUD_MEDIUM = 8
+SCL_CLOUD_HIGH = 9
+SCL_THIN_CIRRUS = 10
+SCL_SNOW = 11
+MASKED_SCL_CLASSES = (SCL_NO_DATA, SCL_SATURATED, SCL_CLOUD_SHADOW, SCL_CLOUD_MEDIUM,
+                      SCL_CLOUD_HIGH, SCL_THIN_CIRRUS, SCL_SNOW)
+
+# Lookup table: CLEAR_SCL[scl] is True for usable pixels
+CLEAR_SCL = np.ones(256, dtype=bool)
+CLEAR_SCL[list(MASKED_SCL_CLASSES)] = False
+
+COMPOSITE_METHODS = ("max", "median")
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+# B04, B08 (reflectance x 10000) and SCL in one UINT16 request per date
+EVALSCRIPT_BANDS_SCL = """
+//VERSION=3
+function setup() {
+  return {
+    input: ["B04", "B08", "SCL"],
+    output: {
+      bands: 3,
+      sampleType: "UINT16"
+    }
+  };
+}
+
+function evaluatePixel(sample) {
+  return [sample.B04 * 10000, sample.B08 * 10000, sample.SCL];
+}
+"""
+
+
+def clear_mask(scl: np.ndarray) -> np.ndarray:
+    """True where the scene classification shows the ground (no cloud, shadow, snow or no-data)"""
+    return CLEAR_SCL[np.asarray(scl).astype(np.uint8, copy=False)]
+
+
+def masked_ndvi(bands: np.ndarray) -> np.ndarray:
+    """float32 NDVI from a (y, x, 3) B04/B08/SCL array, NaN where the pixel is not clear"""
+    red = bands[..., 0].astype(np.float32)
+    nir = bands[..., 1].astype(np.float32)
+    total = nir + red
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ndvi = (nir - red) / total
+    ndvi[~clear_mask(bands[..., 2]) | (total == 0)] = np.nan
+    return ndvi
+
+
+def collect_masked_stack(dates: Sequence[str], fetch_bands: Callable[[str], np.ndarray],
+                         max_workers: int = 4, path: Optional[str] = None) -> np.ndarray:
+    """(time, y, x) float32 stack of cloud-masked NDVI, one layer per acquisition date
+
+    Dates are fetched concurrently and masked as they arrive, so only the
+    stack (a memory map with path) and a few in-flight band arrays are held.
+    """
+    if not dates:
+        raise ValueError("No acquisition dates to composite")
+    stack = None
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(dates)))) as pool:
+        for i, bands in enumerate(pool.map(fetch_bands, dates)):
+            ndvi = masked_ndvi(np.asarray(bands))
+            if stack is None:
+                shape = (len(dates),) + ndvi.shape
+                stack = (np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+                         if path else np.empty(shape, dtype=np.float32))
+            elif ndvi.shape != stack.shape[1:]:
+                raise ValueError(f"Bands for {dates[i]} are {ndvi.shape}, expected {stack.shape[1:]}")
+            stack[i] = ndvi
+    return stack
+
+
+def composite_stack(stack: np.ndarray, method: str = "max", max_chunk_bytes: int = MAX_CHUNK_BYTES,
+                    chunk_rows: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(composite NDVI, clear observations per pixel) from a masked stack, reduced in row blocks"""
+    if method not in COMPOSITE_METHODS:
+        raise ValueError(f"Unknown composite method '{method}', expected one of {COMPOSITE_METHODS}")
+    t_count, height, width = stack.shape
+    rows = chunk_rows or max(1, max_chunk_bytes // max(1, t_count * width * 4 * 2))
+    composite = np.full((height, width), np.nan, dtype=np.float32)
+    clear = np.zeros((height, width), dtype=np.int32)
+
+    for r0 in range(0, height, rows):
+        block = np.asarray(stack[:, r0:r0 + rows])
+        observed = ~np.isnan(block)
+        clear[r0:r0 + rows] = observed.sum(axis=0)
+        if method == "max":
+            composite[r0:r0 + rows] = np.fmax.reduce(block, axis=0)  # fmax skips NaN
+        else:
+            # Pixels cloudy on every date would make nanmedian warn: fill them, then put NaN back
+            any_clear = observed.any(axis=0)
+            median = np.nanmedian(np.where(any_clear, block, 0), axis=0)
+            composite[r0:r0 + rows] = np.where(any_clear, median, np.nan)
+    return composite, clear
+
+
+def build_composite(dates: Sequence[str], fetch_bands: Callable[[str], np.ndarray], method: str = "max",
+                    max_workers: int = 4, work_dir: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Cloud-free NDVI composite over the given dates; the stack is a temporary memory map in work_dir"""
+    if not work_dir:
+        return composite_stack(collect_masked_stack(dates, fetch_bands, max_workers), method)
+
+    os.makedirs(work_dir, exist_ok=True)
+    # Not .npy, so a cache directory's LRU eviction never picks up a stack being built
+    fd, path = tempfile.mkstemp(suffix=".stack", dir=work_dir)
+    os.close(fd)
+    try:
+        return composite_stack(collect_masked_stack(dates, fetch_bands, max_workers, path), method)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
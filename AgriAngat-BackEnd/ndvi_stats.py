@@ -0,0 +1,174 @@
+"""
+Single-pass NDVI statistics.
+
+summarize_ndvi sorts the raster once (NaN, i.e. no data, sorts to the end)
+and answers everything from that sorted copy: min, max and every
+percentile are index lookups, and the coverage-class and "excellent"
+pixel counts are binary searches for the class thresholds. Mean and
+standard deviation come from one sum and one dot product. The old code
+made a separate pass (several of them sorting) per statistic and built a
+boolean mask per class.
+
+NumPy's float32/float64 sort is vectorized and, measured on a 3000x3000
+raster, faster than a multi-kth np.partition, which is why a single sort
+replaces both the quantile partition and a digitize/bincount pass.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+# Coverage classes: ndvi < 0.1, 0.1-0.3, 0.3-0.5, >= 0.5
+COVERAGE_CLASSES = ("water_bare", "sparse", "moderate", "dense")
+COVERAGE_LABELS = {
+    "water_bare": "Water/Bare soil (< 0.1)",
+    "sparse": "Sparse vegetation (0.1-0.3)",
+    "moderate": "Moderate vegetation (0.3-0.5)",
+    "dense": "Dense vegetation (≥ 0.5)",
+}
+COVERAGE_THRESHOLDS = (0.1, 0.3, 0.5)
+
+# Above this NDVI a pixel counts as excellent vegetation (strictly greater)
+EXCELLENT_NDVI = 0.6
+
+# q0 and q1 give min and max from the same lookup
+QUANTILES = (0.0, 0.10, 0.25, 0.50, 0.75, 0.90, 1.0)
+
+HEALTH_LEVELS = (
+    (0.5, "EXCELLENT - Dense, healthy vegetation"),
+    (0.3, "GOOD - Moderate to dense vegetation"),
+    (0.1, "FAIR - Sparse vegetation, may need attention"),
+)
+POOR_HEALTH = "POOR - Very little vegetation, mostly bare soil/water"
+
+
+def health_status(mean_ndvi: float) -> str:
+    """Overall vegetation health label for a mean NDVI"""
+    for threshold, label in HEALTH_LEVELS:
+        if mean_ndvi > threshold:
+            return label
+    return POOR_HEALTH
+
+
+class NDVIStats:
+    """Summary statistics of one NDVI raster"""
+
+    def __init__(self, total_pixels: int, valid_pixels: int,
+                 mean: Optional[float] = None, std: Optional[float] = None,
+                 quantiles: Optional[Dict[float, float]] = None,
+                 coverage_counts: Optional[Dict[str, int]] = None,
+                 excellent_pixels: int = 0):
+        self.total_pixels = total_pixels
+        self.valid_pixels = valid_pixels
+        self.invalid_pixels = total_pixels - valid_pixels
+        self.mean = mean
+        self.std = std
+        self.quantiles = quantiles or {}
+        self.coverage_counts = coverage_counts or {name: 0 for name in COVERAGE_CLASSES}
+        self.excellent_pixels = excellent_pixels
+
+    @property
+    def has_data(self) -> bool:
+        return self.valid_pixels > 0
+
+    @property
+    def data_coverage_pct(self) -> float:
+        return self.valid_pixels / self.total_pixels * 100 if self.total_pixels else 0.0
+
+    @property
+    def minimum(self) -> Optional[float]:
+        return self.quantiles.get(0.0)
+
+    @property
+    def maximum(self) -> Optional[float]:
+        return self.quantiles.get(1.0)
+
+    @property
+    def median(self) -> Optional[float]:
+        return self.quantiles.get(0.5)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentile (10, 25, 50, 75, 90) of the valid NDVI values"""
+        return self.quantiles.get(round(p / 100, 2))
+
+    def coverage_pct(self, name: str) -> float:
+        return self.coverage_counts[name] / self.valid_pixels * 100 if self.valid_pixels else 0.0
+
+    @property
+    def excellent_pct(self) -> float:
+        return self.excellent_pixels / self.valid_pixels * 100 if self.valid_pixels else 0.0
+
+    @property
+    def health_status(self) -> Optional[str]:
+        return health_status(self.mean) if self.has_data else None
+
+    @property
+    def low_vegetation_concern(self) -> bool:
+        """More than 20% of the area below NDVI 0.1"""
+        return self.has_data and self.coverage_counts["water_bare"] > self.valid_pixels * 0.2
+
+    @property
+    def high_vegetation_excellence(self) -> bool:
+        """More than 10% of the area above NDVI 0.6"""
+        return self.has_data and self.excellent_pixels > self.valid_pixels * 0.1
+
+    def to_dict(self) -> Dict:
+        """Flat, JSON-friendly form for tables and API responses"""
+        result = {
+            "total_pixels": self.total_pixels,
+            "valid_pixels": self.valid_pixels,
+            "data_coverage_pct": round(self.data_coverage_pct, 2),
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.minimum,
+            "p10": self.percentile(10),
+            "p25": self.percentile(25),
+            "median": self.median,
+            "p75": self.percentile(75),
+            "p90": self.percentile(90),
+            "max": self.maximum,
+            "health_status": self.health_status,
+        }
+        for name in COVERAGE_CLASSES:
+            result[f"{name}_pct"] = round(self.coverage_pct(name), 2)
+        result["excellent_pct"] = round(self.excellent_pct, 2)
+        return result
+
+
+def summarize_ndvi(ndvi: np.ndarray) -> NDVIStats:
+    """All NDVI summary statistics of a raster (NaN = no data) from one sort"""
+    values = np.asarray(ndvi)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    ordered = np.sort(values, axis=None)
+    total = ordered.size
+    n = int(np.searchsorted(ordered, np.nan))  # NaNs sort last
+    if n == 0:
+        return NDVIStats(total, 0)
+    valid = ordered[:n]
+
+    wide = valid.astype(np.float64, copy=False)
+    mean = float(wide.sum() / n)
+    std = float(np.sqrt(max(np.dot(wide, wide) / n - mean * mean, 0.0)))
+
+    # Linear-interpolated quantiles (np.quantile's default) by index lookup
+    position = np.array(QUANTILES) * (n - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, n - 1)
+    quantile_values = wide[low] + (wide[high] - wide[low]) * (position - low)
+
+    # Class counts by binary search, comparing in the raster's own precision
+    thresholds = np.array(COVERAGE_THRESHOLDS, dtype=valid.dtype)
+    below = np.searchsorted(valid, thresholds, side="left")
+    counts = np.diff(np.concatenate([[0], below, [n]]))
+    excellent = n - int(np.searchsorted(valid, valid.dtype.type(EXCELLENT_NDVI), side="right"))
+
+    return NDVIStats(
+        total_pixels=total,
+        valid_pixels=n,
+        mean=mean,
+        std=std,
+        quantiles={q: float(v) for q, v in zip(QUANTILES, quantile_values)},
+        coverage_counts=dict(zip(COVERAGE_CLASSES, (int(c) for c in counts))),
+        excellent_pixels=excellent
+    )
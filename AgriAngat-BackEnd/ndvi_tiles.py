@@ -0,0 +1,165 @@
+"""
+Tiled NDVI maps.
+
+build_tile_pyramid cuts an NDVI raster into standard 256 px Web-Mercator
+XYZ tiles (<dir>/<z>/<x>/<y>.png) for every zoom from an overview level to
+the raster's native resolution. save_ndvi_tile_map writes a small folium
+page whose TileLayer fetches only the tiles in view, instead of embedding
+the whole colored raster in the HTML.
+
+The raster is classified once with the ndvi_colors ramp, and every tile is
+a nearest-neighbour lookup into that class array. Rows and columns map
+independently, so a tile is a single fancy-index. Tiles are 8-bit palette
+PNGs written with zlib only: one byte per pixel plus the 12-entry palette,
+transparent outside the data. Fully transparent tiles are not written.
+"""
+
+import json
+import math
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ndvi_colors import NDVI_PALETTE, NO_DATA_CLASS, classify_ndvi
+
+TILE_SIZE = 256
+MAX_ZOOM = 18
+OVERVIEW_LEVELS = 6           # zoom levels kept below the native one
+EARTH_CIRCUMFERENCE_M = 40075016.686
+PNG_COMPRESSION = 6
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_palette_png(indices: np.ndarray, palette: np.ndarray = NDVI_PALETTE) -> bytes:
+    """8-bit indexed PNG bytes for a (height, width) uint8 index array and an (n, 4) RGBA palette"""
+    height, width = indices.shape
+    rows = np.zeros((height, width + 1), dtype=np.uint8)  # filter byte 0 (none) before each row
+    rows[:, 1:] = indices
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return (_PNG_SIGNATURE
+            + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"PLTE", palette[:, :3].astype(np.uint8).tobytes())
+            + _png_chunk(b"tRNS", palette[:, 3].astype(np.uint8).tobytes())
+            + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), PNG_COMPRESSION))
+            + _png_chunk(b"IEND", b""))
+
+
+def lonlat_to_tile(lon, lat, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Fractional XYZ tile coordinates of WGS84 points"""
+    n = 2 ** zoom
+    lat_rad = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * n
+    y = (1.0 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / math.pi) / 2.0 * n
+    return x, y
+
+
+def _tile_pixel_lons(tx: int, zoom: int) -> np.ndarray:
+    """Longitudes of the pixel centers across one tile column"""
+    pixels = tx * TILE_SIZE + np.arange(TILE_SIZE) + 0.5
+    return pixels / (TILE_SIZE * 2 ** zoom) * 360.0 - 180.0
+
+
+def _tile_pixel_lats(ty: int, zoom: int) -> np.ndarray:
+    """Latitudes of the pixel centers down one tile row"""
+    pixels = ty * TILE_SIZE + np.arange(TILE_SIZE) + 0.5
+    return np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * pixels / (TILE_SIZE * 2 ** zoom)))))
+
+
+def native_zoom(bbox_coords: Sequence[float], shape: Tuple[int, int]) -> int:
+    """Smallest zoom whose tile pixels are at least as fine as the raster's"""
+    min_lon, min_lat, max_lon, max_lat = bbox_coords
+    lat = math.radians((min_lat + max_lat) / 2)
+    raster_m = (max_lon - min_lon) / shape[1] * EARTH_CIRCUMFERENCE_M / 360 * math.cos(lat)
+    zoom = math.ceil(math.log2(EARTH_CIRCUMFERENCE_M * math.cos(lat) / TILE_SIZE / raster_m))
+    return int(min(max(zoom, 0), MAX_ZOOM))
+
+
+def build_tile_pyramid(ndvi: np.ndarray, bbox_coords: Sequence[float], tiles_dir: str,
+                       min_zoom: Optional[int] = None, max_zoom: Optional[int] = None,
+                       max_workers: int = 4) -> Dict:
+    """Write XYZ PNG tiles of the colored NDVI raster; returns the pyramid metadata (also tiles.json)"""
+    classes = classify_ndvi(ndvi).astype(np.uint8)
+    height, width = classes.shape
+    min_lon, min_lat, max_lon, max_lat = bbox_coords
+    max_zoom = native_zoom(bbox_coords, classes.shape) if max_zoom is None else max_zoom
+    min_zoom = max(max_zoom - OVERVIEW_LEVELS, 0) if min_zoom is None else min_zoom
+
+    def write_tile(zoom: int, tx: int, ty: int) -> int:
+        cols = np.floor((_tile_pixel_lons(tx, zoom) - min_lon) / (max_lon - min_lon) * width).astype(np.int64)
+        rows = np.floor((max_lat - _tile_pixel_lats(ty, zoom)) / (max_lat - min_lat) * height).astype(np.int64)
+        col_ok, row_ok = (cols >= 0) & (cols < width), (rows >= 0) & (rows < height)
+        if not (col_ok.any() and row_ok.any()):
+            return 0
+        tile = classes[np.clip(rows, 0, height - 1)[:, None], np.clip(cols, 0, width - 1)[None, :]]
+        tile[~(row_ok[:, None] & col_ok[None, :])] = NO_DATA_CLASS
+        if (tile == NO_DATA_CLASS).all():
+            return 0
+        data = encode_palette_png(tile)
+        directory = os.path.join(tiles_dir, str(zoom), str(tx))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{ty}.png"), "wb") as f:
+            f.write(data)
+        return len(data)
+
+    jobs = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        x0, y0 = lonlat_to_tile(min_lon, max_lat, zoom)
+        x1, y1 = lonlat_to_tile(max_lon, min_lat, zoom)
+        last = 2 ** zoom - 1
+        for tx in range(int(x0), min(int(x1), last) + 1):
+            for ty in range(int(y0), min(int(y1), last) + 1):
+                jobs.append((zoom, tx, ty))
+
+    os.makedirs(tiles_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        sizes = list(pool.map(lambda job: write_tile(*job), jobs))
+
+    meta = {
+        "bounds": [min_lon, min_lat, max_lon, max_lat],
+        "minZoom": min_zoom,
+        "maxZoom": max_zoom,
+        "tiles": sum(1 for size in sizes if size),
+        "bytes": sum(sizes),
+    }
+    with open(os.path.join(tiles_dir, "tiles.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def save_ndvi_tile_map(ndvi: np.ndarray, bbox_coords: Sequence[float], path: str,
+                       tiles_dir: Optional[str] = None, opacity: float = 0.7) -> str:
+    """Folium page at path with the NDVI tiles (default <name>_tiles/ beside it) as a TileLayer"""
+    import folium  # only the map page needs folium; the tiles do not
+
+    tiles_dir = tiles_dir or os.path.splitext(path)[0] + "_tiles"
+    meta = build_tile_pyramid(ndvi, bbox_coords, tiles_dir)
+    min_lon, min_lat, max_lon, max_lat = bbox_coords
+
+    m = folium.Map(location=[(min_lat + max_lat) / 2, (min_lon + max_lon) / 2],
+                   zoom_start=max(meta["maxZoom"] - 2, meta["minZoom"]))
+    tiles_url = os.path.relpath(tiles_dir, os.path.dirname(os.path.abspath(path))).replace(os.sep, "/")
+    folium.TileLayer(
+        tiles=tiles_url + "/{z}/{x}/{y}.png",
+        attr="NDVI: Copernicus Sentinel-2 via Sentinel Hub",
+        name="NDVI",
+        overlay=True,
+        opacity=opacity,
+        min_zoom=meta["minZoom"],
+        max_native_zoom=meta["maxZoom"],
+        max_zoom=MAX_ZOOM,
+        bounds=[[min_lat, min_lon], [max_lat, max_lon]]
+    ).add_to(m)
+    m.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+
+    folium.LayerControl().add_to(m)
+    m.save(path)
+    return path
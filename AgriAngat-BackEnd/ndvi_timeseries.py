@@ -0,0 +1,218 @@
+"""
+Multi-temporal NDVI: per-pixel trends, seasonal peaks and anomalies.
+
+A season is split into consecutive intervals. Each interval contributes one
+NDVI raster (its least-cloudy mosaic), and the rasters are stacked into a
+(time, y, x) array, memory-mapped when a path is given. analyze_ndvi_series
+then walks the stack in blocks of rows, so memory stays bounded for large
+areas, and computes per pixel, ignoring cloudy (NaN) dates:
+
+- the least-squares NDVI trend (slope per day),
+- the seasonal peak value and the date it occurs,
+- anomaly z-scores: each date's departure from the pixel's own trend line,
+  in units of the residual standard deviation.
+
+The z-scores form another (time, y, x) raster. It is kept only on request
+(memory-mapped at anomaly_path, or in memory); the per-date anomaly counts
+behind summary() are always computed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_STEP_DAYS = 10
+MIN_OBSERVATIONS = 3             # valid dates needed for a trend
+ANOMALY_Z = 2.0                  # |z| above this is an anomaly
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Slopes are reported per 30 days; beyond ±this a pixel is greening/degrading
+TREND_PERIOD_DAYS = 30
+TREND_THRESHOLD = 0.02
+
+# float64 working arrays per stack element while a block is processed
+_WORK_ARRAYS = 6
+
+
+def season_intervals(start: datetime, end: datetime, step_days: int = DEFAULT_STEP_DAYS) -> List[Tuple[datetime, datetime]]:
+    """Consecutive [start, end) windows of step_days covering the season; the last may be shorter"""
+    if end <= start:
+        raise ValueError("Season end must be after its start")
+    if step_days <= 0:
+        raise ValueError("step_days must be positive")
+    intervals = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + timedelta(days=step_days), end)
+        intervals.append((window_start, window_end))
+        window_start = window_end
+    return intervals
+
+
+def collect_ndvi_series(intervals: Sequence[Tuple[datetime, datetime]],
+                        fetch: Callable[[datetime, datetime], np.ndarray],
+                        max_workers: int = 4,
+                        path: Optional[str] = None) -> Tuple[List[datetime], np.ndarray]:
+    """(interval midpoints, (time, y, x) float32 stack) from fetch(start, end) per interval
+
+    Intervals are fetched concurrently and written into the stack as they
+    arrive in order. With path, the stack is a .npy memory map on disk.
+    """
+    if not intervals:
+        raise ValueError("No intervals to collect")
+    dates = [start + (end - start) / 2 for start, end in intervals]
+    stack = None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(intervals)))) as pool:
+        for i, raster in enumerate(pool.map(lambda interval: fetch(*interval), intervals)):
+            raster = np.asarray(raster)
+            if stack is None:
+                shape = (len(intervals),) + raster.shape
+                stack = (np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+                         if path else np.empty(shape, dtype=np.float32))
+            elif raster.shape != stack.shape[1:]:
+                raise ValueError(f"Raster for {dates[i]:%Y-%m-%d} is {raster.shape}, expected {stack.shape[1:]}")
+            stack[i] = raster
+
+    if path:
+        stack.flush()
+    return dates, stack
+
+
+def _chunk_rows(stack_shape: Tuple[int, int, int], max_chunk_bytes: int) -> int:
+    t, _, x = stack_shape
+    return max(1, max_chunk_bytes // max(1, t * x * 8 * _WORK_ARRAYS))
+
+
+class NDVITrend:
+    """Per-pixel trend, peak and anomaly rasters of one NDVI time series"""
+
+    def __init__(self, dates: List[datetime], slope: np.ndarray, intercept: np.ndarray,
+                 peak_value: np.ndarray, peak_index: np.ndarray, observations: np.ndarray,
+                 anomaly_z: Optional[np.ndarray], low_anomalies: np.ndarray, high_anomalies: np.ndarray,
+                 valid_per_date: np.ndarray, z_threshold: float):
+        self.dates = dates
+        self.slope = slope                # NDVI per day, NaN with too few observations
+        self.intercept = intercept        # NDVI at dates[0]
+        self.peak_value = peak_value
+        self.peak_index = peak_index      # index into dates, -1 when never observed
+        self.observations = observations  # valid (cloud-free) dates per pixel
+        self.anomaly_z = anomaly_z        # (time, y, x) departures from trend, None when not kept
+        self.low_anomalies = low_anomalies
+        self.high_anomalies = high_anomalies
+        self.valid_per_date = valid_per_date
+        self.z_threshold = z_threshold
+
+    def slope_per_period(self, days: int = TREND_PERIOD_DAYS) -> np.ndarray:
+        return self.slope * days
+
+    def peak_date(self, y: int, x: int) -> Optional[datetime]:
+        index = int(self.peak_index[y, x])
+        return self.dates[index] if index >= 0 else None
+
+    def summary(self, threshold: float = TREND_THRESHOLD) -> Dict:
+        """Field-level view: share of greening/degrading pixels, typical peak, anomalies per date"""
+        monthly = self.slope_per_period()
+        trended = ~np.isnan(monthly)
+        n = int(trended.sum())
+        peaks = self.peak_index[self.peak_index >= 0]
+        peak_date = self.dates[int(np.bincount(peaks).argmax())] if peaks.size else None
+
+        per_date = []
+        for i, date in enumerate(self.dates):
+            valid = int(self.valid_per_date[i])
+            per_date.append({
+                "date": date.strftime("%Y-%m-%d"),
+                "validPixels": valid,
+                "lowAnomalyPct": round(self.low_anomalies[i] / valid * 100, 2) if valid else None,
+                "highAnomalyPct": round(self.high_anomalies[i] / valid * 100, 2) if valid else None,
+            })
+
+        return {
+            "dates": len(self.dates),
+            "pixelsWithTrend": n,
+            "meanSlopePer30Days": round(float(monthly[trended].mean()), 4) if n else None,
+            "greeningPct": round(float((monthly[trended] > threshold).sum()) / n * 100, 2) if n else None,
+            "degradingPct": round(float((monthly[trended] < -threshold).sum()) / n * 100, 2) if n else None,
+            "peakDate": peak_date.strftime("%Y-%m-%d") if peak_date else None,
+            "peakNdviMedian": round(float(np.nanmedian(self.peak_value)), 4) if peaks.size else None,
+            "anomalyZ": self.z_threshold,
+            "perDate": per_date,
+        }
+
+
+def analyze_ndvi_series(stack: np.ndarray, dates: Sequence[datetime],
+                        z_threshold: float = ANOMALY_Z,
+                        min_observations: int = MIN_OBSERVATIONS,
+                        max_chunk_bytes: int = MAX_CHUNK_BYTES,
+                        chunk_rows: Optional[int] = None,
+                        anomaly_path: Optional[str] = None,
+                        keep_anomalies: bool = True) -> NDVITrend:
+    """Trend, peak and anomaly rasters for a (time, y, x) stack, processed in blocks of rows
+
+    With keep_anomalies false only the per-date anomaly counts are kept, so
+    nothing stack-sized is allocated besides the block being processed.
+    """
+    if stack.ndim != 3 or stack.shape[0] != len(dates):
+        raise ValueError(f"Expected a (time, y, x) stack with {len(dates)} dates, got {stack.shape}")
+    t_count, height, width = stack.shape
+    days = np.array([(d - dates[0]).total_seconds() / 86400 for d in dates])[:, None, None]
+
+    slope = np.full((height, width), np.nan, dtype=np.float32)
+    intercept = np.full((height, width), np.nan, dtype=np.float32)
+    peak_value = np.full((height, width), np.nan, dtype=np.float32)
+    peak_index = np.full((height, width), -1, dtype=np.int32)
+    observations = np.zeros((height, width), dtype=np.int32)
+    anomaly_z = None
+    if anomaly_path:
+        anomaly_z = np.lib.format.open_memmap(anomaly_path, mode="w+", dtype=np.float32, shape=stack.shape)
+    elif keep_anomalies:
+        anomaly_z = np.empty(stack.shape, dtype=np.float32)
+    low = np.zeros(t_count, dtype=np.int64)
+    high = np.zeros(t_count, dtype=np.int64)
+    valid_per_date = np.zeros(t_count, dtype=np.int64)
+
+    rows = chunk_rows or _chunk_rows(stack.shape, max_chunk_bytes)
+    for r0 in range(0, height, rows):
+        r1 = min(r0 + rows, height)
+        block = np.asarray(stack[:, r0:r1], dtype=np.float64)
+        valid = ~np.isnan(block)
+        y = np.where(valid, block, 0.0)
+        t = np.where(valid, days, 0.0)
+
+        # Least squares over each pixel's valid dates
+        n = valid.sum(axis=0)
+        st, sy = t.sum(axis=0), y.sum(axis=0)
+        denom = n * (t * t).sum(axis=0) - st * st
+        fitted = (n >= min_observations) & (denom > 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            b = np.where(fitted, (n * (t * y).sum(axis=0) - st * sy) / denom, np.nan)
+            a = np.where(fitted, (sy - b * st) / n, np.nan)
+
+            # Anomalies: residual from the trend over the residual standard deviation
+            residual = np.where(valid, block - (a + b * days), 0.0)
+            spread = np.sqrt((residual * residual).sum(axis=0) / (n - 2))
+            z = np.where(valid & fitted & (spread > 0), residual / spread, np.nan)
+
+        # Seasonal peak
+        index = np.where(valid, block, -np.inf).argmax(axis=0)
+        seen = n > 0
+        peak = np.take_along_axis(block, index[None], axis=0)[0]
+
+        slope[r0:r1] = b
+        intercept[r0:r1] = a
+        peak_value[r0:r1] = np.where(seen, peak, np.nan)
+        peak_index[r0:r1] = np.where(seen, index, -1)
+        observations[r0:r1] = n
+        if anomaly_z is not None:
+            anomaly_z[:, r0:r1] = z
+        low += (z < -z_threshold).sum(axis=(1, 2))
+        high += (z > z_threshold).sum(axis=(1, 2))
+        valid_per_date += valid.sum(axis=(1, 2))
+
+    if anomaly_path:
+        anomaly_z.flush()
+    return NDVITrend(list(dates), slope, intercept, peak_value, peak_index, observations,
+                     anomaly_z, low, high, valid_per_date, z_threshold)
@@ -0,0 +1,155 @@
+"""
+Single-flight request coalescing with a short refresh interval.
+
+Concurrent callers asking for the same key share one in-flight computation,
+and its result is reused until the refresh interval passes. Under a burst
+of identical requests the upstream is called once per key per interval.
+
+ttl_of lets a cache give each result its own lifetime. A cache built from
+another cache's data uses it to expire together with that data instead of a
+full interval after it; remaining() reports how long a key stays fresh.
+
+Finished results outlive their interval so peek() can still serve them as
+last-known data, which is why expiry does not delete them. max_entries
+bounds the cache instead: past it, the least recently used keys go first.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def _store(results: OrderedDict, key: Hashable, entry: Tuple[float, Any], max_entries: Optional[int]) -> None:
+    """Insert as most recently used, dropping the least recently used keys past max_entries"""
+    results[key] = entry
+    results.move_to_end(key)
+    while max_entries is not None and len(results) > max_entries:
+        results.popitem(last=False)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CoalescingCache:
+    """Thread-safe single-flight cache with a time-to-live per key"""
+
+    def __init__(self, ttl_seconds: float, ttl_of: Optional[Callable[[Any], float]] = None,
+                 max_entries: Optional[int] = None):
+        self.ttl = ttl_seconds
+        self.ttl_of = ttl_of
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (expires at, value), least recently used first
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, _Call] = {}
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the fresh cached value for key, or compute it once for all concurrent callers"""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and time.monotonic() < cached[0]:
+                self._results.move_to_end(key)
+                return cached[1]
+
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+            with self._lock:
+                _store(self._results, key, (self._expires_at(call.result), call.result), self.max_entries)
+        except BaseException as e:
+            # Failures are shared with waiters but never cached
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+        return call.result
+
+    def _expires_at(self, value: Any) -> float:
+        return time.monotonic() + (self.ttl_of(value) if self.ttl_of else self.ttl)
+
+    def remaining(self, key: Hashable) -> float:
+        """Seconds until the cached value for key is due for a refresh; 0 when stale or absent"""
+        with self._lock:
+            cached = self._results.get(key)
+        return max(0.0, cached[0] - time.monotonic()) if cached is not None else 0.0
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Last computed value for key regardless of age, or None"""
+        with self._lock:
+            cached = self._results.get(key)
+        return cached[1] if cached is not None else None
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._results.pop(key, None)
+
+
+class AsyncCoalescingCache:
+    """Single-flight cache with a time-to-live per key for one asyncio event loop"""
+
+    def __init__(self, ttl_seconds: float, ttl_of: Optional[Callable[[Any], float]] = None,
+                 max_entries: Optional[int] = None):
+        self.ttl = ttl_seconds
+        self.ttl_of = ttl_of
+        self.max_entries = max_entries
+        # key -> (expires at, value), least recently used first
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the fresh cached value for key, or await one computation shared by all concurrent callers"""
+        cached = self._results.get(key)
+        if cached is not None and time.monotonic() < cached[0]:
+            self._results.move_to_end(key)
+            return cached[1]
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            # shield: a waiter giving up must not cancel the shared fetch
+            return await asyncio.shield(pending)
+
+        task = asyncio.ensure_future(compute())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        del self._in_flight[key]
+        # Failures are shared with waiters but never cached
+        if not task.cancelled() and task.exception() is None:
+            value = task.result()
+            expires_at = time.monotonic() + (self.ttl_of(value) if self.ttl_of else self.ttl)
+            _store(self._results, key, (expires_at, value), self.max_entries)
+
+    def remaining(self, key: Hashable) -> float:
+        """Seconds until the cached value for key is due for a refresh; 0 when stale or absent"""
+        cached = self._results.get(key)
+        return max(0.0, cached[0] - time.monotonic()) if cached is not None else 0.0
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Last computed value for key regardless of age, or None"""
+        cached = self._results.get(key)
+        return cached[1] if cached is not None else None
+
+    def invalidate(self, key: Hashable) -> None:
+        self._results.pop(key, None)
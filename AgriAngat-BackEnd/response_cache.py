@@ -0,0 +1,67 @@
+"""
+HTTP response cache for JSON endpoints.
+
+Bodies are serialized and gzip-compressed once per key and refresh
+interval, then served with ETag and Cache-Control headers so clients can
+revalidate with If-None-Match and receive 304 Not Modified.
+
+A body built from data that has its own refresh interval (weather) takes
+the data's remaining lifetime as its max-age, so the response never
+outlives the data it was built from.
+"""
+
+import gzip
+import hashlib
+import time
+from typing import Any, Callable, Hashable, Optional
+
+from request_coalescing import CoalescingCache
+
+
+class CachedResponse:
+    """A serialized JSON body with its gzip form and validator"""
+
+    def __init__(self, body: bytes, max_age: float):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.created = time.time()
+        self.max_age = max_age
+
+    def remaining_age(self) -> int:
+        """Seconds until this body is due for a refresh, for Cache-Control max-age"""
+        return max(0, int(self.max_age - (time.time() - self.created)))
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names this body (weak validators included)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return self.etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+class ResponseCache:
+    """Per-key CachedResponse store with single-flight rebuilds"""
+
+    def __init__(self, ttl_seconds: float, serialize: Callable[[Any], str], max_entries: Optional[int] = None):
+        self.ttl = ttl_seconds
+        self.serialize = serialize
+        self._entries = CoalescingCache(ttl_seconds, ttl_of=lambda entry: entry.max_age, max_entries=max_entries)
+
+    def get(self, key: Hashable, build_payload: Callable[[], Any],
+            max_age: Optional[Callable[[], float]] = None) -> CachedResponse:
+        """Cached response for key, building and serializing the payload only when stale
+
+        max_age, called after the payload is built, gives the entry's lifetime
+        (e.g. the remaining age of the data behind it); default: the cache TTL.
+        """
+        def build() -> CachedResponse:
+            body = self.serialize(build_payload()).encode("utf-8")
+            return CachedResponse(body, min(self.ttl, max_age()) if max_age else self.ttl)
+
+        return self._entries.get(key, build)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.invalidate(key)
@@ -0,0 +1,178 @@
+"""
+Prebuilt, memory-mapped soil dataset for known locations.
+
+The build step fetches SoilGrids once for every city in CITY_CENTERS (plus
+an optional farm list) and packs the 12 agricultural properties x 6 depths
+x 5 statistics into a single float32 array. Servers memory-map that array
+at startup so a soil lookup is an index into it, with no JSON parsing.
+
+Usage:
+    python soil_dataset.py [--farms farms.csv] [--output .cache/soil_dataset]
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import requests
+
+from ph_cities import CITY_CENTERS
+from soil_profile import (
+    CONVERSION_FACTORS, DEPTH_INDEX, PROPERTY_INDEX, SOIL_DEPTHS, SOIL_PROPERTIES, SOIL_STATS, STAT_INDEX,
+    SoilProfile, pack_soil_data
+)
+from soil_store import SoilStore, get_default_store, snap_to_cell
+from upstream_guard import is_failure_status
+
+DEFAULT_DATASET_PATH = os.getenv(
+    "SOIL_DATASET_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "soil_dataset")
+)
+
+
+def load_farm_csv(path: str) -> Dict[str, Tuple[float, float]]:
+    """Read a farm list CSV with name/id and lat/latitude and lon/longitude columns"""
+    farms = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            row = {k.strip().lower(): v for k, v in row.items() if k}
+            name = row.get("name") or row.get("id") or f"farm_{i + 1}"
+            lat = float(row.get("lat") or row["latitude"])
+            lon = float(row.get("lon") or row["longitude"])
+            farms[name.strip().lower()] = (lat, lon)
+    return farms
+
+
+def build_soil_dataset(locations: Dict[str, Tuple[float, float]],
+                       output: str = DEFAULT_DATASET_PATH,
+                       store: Optional[SoilStore] = None) -> Dict:
+    """Fetch soil data for every location and write <output>.npy plus its <output>.json index
+
+    A location SoilGrids itself rejects is recorded in "failed" and skipped.
+    Throttling, outages and open circuits stop the build instead, because
+    every remaining location would fail too; a rerun resumes from the store.
+    """
+    store = store or get_default_store()
+    rows = []
+    index = []
+    failed = {}
+
+    for key, (lat, lon) in locations.items():
+        # Wait for SoilGrids rate-limit tokens
+        try:
+            soil_data = store.fetch(lat, lon, properties=SOIL_PROPERTIES, depths=SOIL_DEPTHS, values=SOIL_STATS,
+                                    max_wait=math.inf, fallback=False)
+        except requests.HTTPError as e:
+            if e.response is None or is_failure_status(e.response.status_code):
+                raise
+            failed[key] = f"SoilGrids rejected this location: {e}"
+            continue
+        rows.append(pack_soil_data(soil_data))
+        index.append({"key": key, "lat": lat, "lon": lon})
+
+    data = np.stack(rows) if rows else np.empty(
+        (0, len(SOIL_PROPERTIES), len(SOIL_DEPTHS), len(SOIL_STATS)), dtype=np.float32
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    # Write to temporary files first so running servers never map a half-written array
+    with open(output + ".npy.tmp", "wb") as f:
+        np.save(f, data)
+    with open(output + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump({
+            "properties": SOIL_PROPERTIES,
+            "depths": SOIL_DEPTHS,
+            "stats": SOIL_STATS,
+            "locations": index
+        }, f, ensure_ascii=False)
+    os.replace(output + ".npy.tmp", output + ".npy")
+    os.replace(output + ".json.tmp", output + ".json")
+
+    return {"written": len(index), "failed": failed, "path": output + ".npy"}
+
+
+class SoilDataset:
+    """Read-only, memory-mapped view over a built soil dataset"""
+
+    def __init__(self, path: str = DEFAULT_DATASET_PATH):
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if tuple(meta["properties"]) != SOIL_PROPERTIES or tuple(meta["depths"]) != SOIL_DEPTHS \
+                or tuple(meta["stats"]) != SOIL_STATS:
+            raise ValueError(f"Soil dataset layout at {path} does not match this version")
+
+        self.data = np.load(path + ".npy", mmap_mode="r")
+        self.locations = meta["locations"]
+        self._by_key = {loc["key"]: i for i, loc in enumerate(self.locations)}
+        self._by_cell = {}
+        for i, loc in enumerate(self.locations):
+            self._by_cell.setdefault(snap_to_cell(loc["lat"], loc["lon"]), i)
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __contains__(self, key: str) -> bool:
+        return key.lower() in self._by_key
+
+    def index_of(self, key: str) -> Optional[int]:
+        """Row index for a city or farm name"""
+        return self._by_key.get(key.lower())
+
+    def index_of_coords(self, lat: float, lon: float) -> Optional[int]:
+        """Row index for the soil grid cell containing (lat, lon)"""
+        return self._by_cell.get(snap_to_cell(lat, lon))
+
+    def raw(self, index: int) -> np.ndarray:
+        """(property, depth, stat) array in SoilGrids mapped units"""
+        return self.data[index]
+
+    def values(self, index: int) -> np.ndarray:
+        """(property, depth, stat) array converted to target units"""
+        return self.profile(index).values
+
+    def profile(self, index) -> SoilProfile:
+        """SoilProfile for one row, or a batch profile for a sequence of rows"""
+        return SoilProfile.from_raw(self.data[index])
+
+    def value(self, index: int, prop: str, depth: str = "0-5cm", stat: str = "mean") -> Optional[float]:
+        """A single converted value, or None when SoilGrids has no data"""
+        raw = self.data[index, PROPERTY_INDEX[prop], DEPTH_INDEX[depth], STAT_INDEX[stat]]
+        return None if np.isnan(raw) else float(raw / CONVERSION_FACTORS[PROPERTY_INDEX[prop]])
+
+
+def load_soil_dataset(path: str = DEFAULT_DATASET_PATH) -> Optional[SoilDataset]:
+    """Memory-map the soil dataset if it has been built, otherwise return None"""
+    if not (os.path.exists(path + ".npy") and os.path.exists(path + ".json")):
+        return None
+    return SoilDataset(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped soil dataset")
+    parser.add_argument("--farms", help="CSV of extra farm locations (name, lat, lon)")
+    parser.add_argument("--output", default=DEFAULT_DATASET_PATH, help="Output path without extension")
+    args = parser.parse_args()
+
+    locations = {name: tuple(coords) for name, coords in CITY_CENTERS.items()}
+    if args.farms:
+        locations.update(load_farm_csv(args.farms))
+
+    print(f"🌱 Building soil dataset for {len(locations)} locations (SoilGrids fair use: ~5 new cells per minute)...")
+    try:
+        result = build_soil_dataset(locations, args.output)
+    except requests.RequestException as e:
+        print(f"❌ SoilGrids request failed: {e}")
+        print("   Locations fetched so far are kept in the soil store; rerun to resume.")
+        raise SystemExit(1)
+
+    for key, error in result["failed"].items():
+        print(f"❌ {key.title()}: {error}")
+    print(f"✅ Wrote {result['written']} locations to {result['path']}")
+
+
+if __name__ == "__main__":
+    main()
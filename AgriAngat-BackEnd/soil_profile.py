@@ -0,0 +1,255 @@
+"""
+Columnar soil profiles.
+
+A SoilProfile holds SoilGrids values as a (..., property, depth, statistic)
+float array in target units, with NaN where SoilGrids has no data. Leading
+dimensions are optional, so the same interpretation and crop-suggestion
+predicates run on one location or on a stacked batch of thousands.
+"""
+
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+# Agriculturally important soil properties, in array order
+AG_PROPERTIES = {
+    'phh2o': {'name': 'Soil pH (H2O)', 'unit': 'pH units', 'conversion': 10},
+    'ocd': {'name': 'Organic Carbon Density', 'unit': 'hg/m³', 'conversion': 10},
+    'nitrogen': {'name': 'Total Nitrogen', 'unit': 'g/kg', 'conversion': 100},
+    'soc': {'name': 'Soil Organic Carbon', 'unit': 'g/kg', 'conversion': 10},
+    'cec': {'name': 'Cation Exchange Capacity', 'unit': 'cmol(c)/kg', 'conversion': 10},
+    'bdod': {'name': 'Bulk Density', 'unit': 'kg/dm³', 'conversion': 100},
+    'clay': {'name': 'Clay Content', 'unit': '%', 'conversion': 10},
+    'sand': {'name': 'Sand Content', 'unit': '%', 'conversion': 10},
+    'silt': {'name': 'Silt Content', 'unit': '%', 'conversion': 10},
+    'wv0010': {'name': 'Water Content at 10kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10},
+    'wv0033': {'name': 'Water Content at 33kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10},
+    'wv1500': {'name': 'Water Content at 1500kPa', 'unit': '10⁻² cm³/cm³', 'conversion': 10}
+}
+
+SOIL_PROPERTIES = tuple(AG_PROPERTIES)
+SOIL_DEPTHS = ("0-5cm", "5-15cm", "15-30cm", "30-60cm", "60-100cm", "100-200cm")
+SOIL_STATS = ("mean", "Q0.05", "Q0.5", "Q0.95", "uncertainty")
+
+# SoilGrids mapped units -> target units, aligned with SOIL_PROPERTIES
+CONVERSION_FACTORS = np.array([p['conversion'] for p in AG_PROPERTIES.values()], dtype=np.float64)
+
+PROPERTY_INDEX = {name: i for i, name in enumerate(SOIL_PROPERTIES)}
+DEPTH_INDEX = {label: i for i, label in enumerate(SOIL_DEPTHS)}
+STAT_INDEX = {stat: i for i, stat in enumerate(SOIL_STATS)}
+
+# Interpretation messages per aspect, indexed by the class codes from SoilProfile.classify
+INTERPRETATION_MESSAGES = {
+    "pH": (
+        "Acidic - may need liming for most crops",
+        "Good pH range for most crops",
+        "Alkaline - may limit nutrient uptake"
+    ),
+    "organic_matter": (
+        "Low - add compost/organic fertilizer",
+        "Moderate organic matter levels",
+        "Excellent organic matter content"
+    ),
+    "nitrogen": (
+        "Low - nitrogen fertilization needed",
+        "Adequate nitrogen levels",
+        "High nitrogen content"
+    ),
+    "texture": (
+        "Clay soil - good water retention, ensure drainage",
+        "Loamy soil - ideal for most crops",
+        "Sandy soil - good drainage, needs frequent watering"
+    ),
+    "nutrient_retention": (
+        "Low - frequent fertilization needed",
+        "Moderate nutrient retention",
+        "High - good nutrient holding capacity"
+    )
+}
+
+# Crop groups in suggestion order; each is selected by a predicate in SoilProfile.crop_groups
+CROP_GROUPS = (
+    ("neutral_ph", ["Rice", "Corn", "Tomatoes", "Lettuce", "Cabbage", "Beans"]),
+    ("slightly_acidic_ph", ["Sweet potato", "Cassava", "Pineapple", "Potatoes"]),
+    ("acidic_ph", ["Blueberries", "Cranberries", "Azaleas"]),
+    ("alkaline_ph", ["Asparagus", "Spinach", "Beets", "Broccoli"]),
+    ("clay", ["Rice", "Wheat", "Soybeans", "Sugar cane"]),
+    ("sandy", ["Carrots", "Radish", "Potatoes", "Peanuts", "Watermelon"]),
+    ("loamy", ["Corn", "Beans", "Squash", "Eggplant", "Peppers"]),
+    ("high_organic_matter", ["Leafy greens", "Herbs", "Root vegetables"]),
+)
+
+_SHAPE = (len(SOIL_PROPERTIES), len(SOIL_DEPTHS), len(SOIL_STATS))
+
+
+def pack_soil_data(soil_data: Dict) -> np.ndarray:
+    """Pack a SoilGrids response into a (property, depth, stat) float32 array of mapped units, NaN where missing"""
+    packed = np.full(_SHAPE, np.nan, dtype=np.float32)
+
+    for layer in soil_data.get("properties", {}).get("layers", []):
+        p = PROPERTY_INDEX.get(layer.get("name"))
+        if p is None:
+            continue
+        for depth in layer.get("depths", []):
+            d = DEPTH_INDEX.get(depth.get("label"))
+            values = depth.get("values")
+            if d is None or not values:
+                continue
+            packed[p, d] = [np.nan if values.get(stat) is None else values[stat] for stat in SOIL_STATS]
+
+    return packed
+
+
+def _present_layers(soil_data: Dict) -> np.ndarray:
+    """(property, depth) mask of layers SoilGrids returned, even when their values are null"""
+    present = np.zeros(_SHAPE[:2], dtype=bool)
+    for layer in soil_data.get("properties", {}).get("layers", []):
+        p = PROPERTY_INDEX.get(layer.get("name"))
+        if p is None:
+            continue
+        for depth in layer.get("depths", []):
+            d = DEPTH_INDEX.get(depth.get("label"))
+            if d is not None and "values" in depth:
+                present[p, d] = True
+    return present
+
+
+def _classify3(x: np.ndarray, low: float, high: float) -> np.ndarray:
+    """0 below low, 2 above high, 1 in between, -1 where missing"""
+    codes = np.where(x < low, 0, np.where(x > high, 2, 1))
+    return np.where(np.isnan(x), -1, codes)
+
+
+def _to_float(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+class SoilProfile:
+    """Soil values as a (..., property, depth, stat) array in target units"""
+
+    def __init__(self, values: np.ndarray, present: Optional[np.ndarray] = None):
+        self.values = values
+        # Which (property, depth) layers exist; defaults to any non-missing statistic
+        self.present = present if present is not None else ~np.all(np.isnan(values), axis=-1)
+
+    @classmethod
+    def from_raw(cls, raw: np.ndarray, present: Optional[np.ndarray] = None) -> "SoilProfile":
+        """Convert mapped-unit arrays (single or stacked) with one vectorized divide"""
+        raw = np.asarray(raw, dtype=np.float64)
+        return cls(raw / CONVERSION_FACTORS[:, None, None], present)
+
+    @classmethod
+    def from_soilgrids(cls, soil_data: Dict) -> "SoilProfile":
+        """Build a profile from a SoilGrids properties/query response"""
+        return cls.from_raw(pack_soil_data(soil_data), _present_layers(soil_data))
+
+    @classmethod
+    def stack(cls, profiles: Sequence["SoilProfile"]) -> "SoilProfile":
+        """Stack single-location profiles into one batch profile"""
+        return cls(np.stack([p.values for p in profiles]), np.stack([p.present for p in profiles]))
+
+    @property
+    def batch_shape(self) -> tuple:
+        return self.values.shape[:-3]
+
+    def get(self, prop: str, depth: str = "0-5cm", stat: str = "mean") -> np.ndarray:
+        """Values of one property/depth/statistic across the batch"""
+        return self.values[..., PROPERTY_INDEX[prop], DEPTH_INDEX[depth], STAT_INDEX[stat]]
+
+    def classify(self, depth: str = "0-5cm") -> Dict[str, np.ndarray]:
+        """Class code arrays per interpretation aspect (see INTERPRETATION_MESSAGES), -1 where missing"""
+        clay, sand, silt = (self.get(p, depth) for p in ("clay", "sand", "silt"))
+        texture = np.where(clay > 40, 0, np.where(sand > 60, 2, 1))
+        texture_missing = np.isnan(clay) | np.isnan(sand) | np.isnan(silt)
+
+        return {
+            "pH": _classify3(self.get("phh2o", depth), 5.5, 7.5),
+            "organic_matter": _classify3(self.get("soc", depth), 10, 30),
+            "nitrogen": _classify3(self.get("nitrogen", depth), 1.0, 3.0),
+            "texture": np.where(texture_missing, -1, texture),
+            "nutrient_retention": _classify3(self.get("cec", depth), 10, 25),
+        }
+
+    def crop_groups(self, depth: str = "0-5cm") -> np.ndarray:
+        """(..., group) boolean mask of CROP_GROUPS that apply to each location"""
+        ph = self.get("phh2o", depth)
+        soc = self.get("soc", depth)
+        texture = self.classify(depth)["texture"]
+
+        with np.errstate(invalid="ignore"):
+            masks = [
+                (ph >= 6.0) & (ph <= 7.0),
+                (ph >= 5.5) & (ph < 6.0),
+                ph < 5.5,
+                ph > 7.0,
+                texture == 0,
+                texture == 2,
+                texture == 1,
+                soc > 20,
+            ]
+        return np.stack(masks, axis=-1)
+
+    def interpret(self, depth: str = "0-5cm",
+                  messages: Dict[str, Sequence[str]] = INTERPRETATION_MESSAGES) -> Union[Dict, List[Dict]]:
+        """Agricultural interpretation per location; a dict for one location, a list for a batch"""
+        codes = {aspect: c for aspect, c in self.classify(depth).items() if aspect in messages}
+        flat = {aspect: c.reshape(-1) for aspect, c in codes.items()}
+        size = int(np.prod(self.batch_shape, dtype=int))
+
+        results = []
+        for i in range(size):
+            results.append({
+                aspect: messages[aspect][flat[aspect][i]]
+                for aspect in messages if aspect in flat and flat[aspect][i] >= 0
+            })
+        return results[0] if not self.batch_shape else results
+
+    def suggest_crops(self, depth: str = "0-5cm") -> Union[List[str], List[List[str]]]:
+        """Suggested crops per location, de-duplicated in group order"""
+        groups = self.crop_groups(depth).reshape(-1, len(CROP_GROUPS))
+
+        results = []
+        for row in groups:
+            crops = [crop for g in np.flatnonzero(row) for crop in CROP_GROUPS[g][1]]
+            results.append(list(dict.fromkeys(crops)))
+        return results[0] if not self.batch_shape else results
+
+    def topsoil_dict(self, depth: str = "0-5cm") -> Dict:
+        """Per-property values at one depth for a single location, in the extractor's dict format"""
+        d = DEPTH_INDEX[depth]
+        extracted = {}
+        for prop, p in PROPERTY_INDEX.items():
+            if not self.present[p, d]:
+                continue
+            mean, q05, median, q95, uncertainty = (_to_float(v) for v in self.values[p, d])
+            extracted[prop] = {
+                "name": AG_PROPERTIES[prop]["name"],
+                "unit": AG_PROPERTIES[prop]["unit"],
+                "mean": mean,
+                "median": median,
+                "q05": q05,
+                "q95": q95,
+                "uncertainty": uncertainty
+            }
+        return extracted
+
+    def all_depths_dict(self) -> Dict:
+        """Mean and median at every depth for a single location, in the extractor's dict format"""
+        all_depths = {}
+        for prop, p in PROPERTY_INDEX.items():
+            if not self.present[p].any():
+                continue
+            all_depths[prop] = {
+                "name": AG_PROPERTIES[prop]["name"],
+                "unit": AG_PROPERTIES[prop]["unit"],
+                "depths": {}
+            }
+            for label, d in DEPTH_INDEX.items():
+                if not self.present[p, d]:
+                    continue
+                all_depths[prop]["depths"][label] = {
+                    "mean": _to_float(self.values[p, d, STAT_INDEX["mean"]]),
+                    "median": _to_float(self.values[p, d, STAT_INDEX["Q0.5"]]),
+                    "range": label.replace("cm", " cm")
+                }
+        return all_depths
@@ -0,0 +1,293 @@
+"""
+Grid-snapped persistent store for SoilGrids responses.
+
+SoilGrids is a static ~250 m product, so every coordinate inside the same
+grid cell returns the same values. Lookups are snapped to a cell and the
+parsed layers are kept in a local SQLite file indefinitely.
+
+Queries are narrowed to the properties, depths and statistics the caller
+needs, and only the (property, depth) layers missing from the store are
+requested from SoilGrids.
+"""
+
+import json
+import math
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from upstream_guard import get_guard
+
+SOILGRIDS_URL = "https://rest.isric.org/soilgrids/v2.0/properties/query"
+
+# Standard depth intervals and statistics published by SoilGrids
+SOILGRIDS_DEPTHS = ("0-5cm", "5-15cm", "15-30cm", "30-60cm", "60-100cm", "100-200cm")
+SOILGRIDS_VALUES = ("Q0.05", "Q0.5", "Q0.95", "mean", "uncertainty")
+
+# SoilGrids is published at 250 m. We approximate its grid with a regular
+# WGS84 grid of the same nominal spacing (~0.00225 degrees); at Philippine
+# latitudes the longitude shrink is under 6%, well inside one cell.
+SOILGRIDS_RESOLUTION_M = 250
+METERS_PER_DEGREE = 111_320
+CELL_SIZE_DEG = SOILGRIDS_RESOLUTION_M / METERS_PER_DEGREE
+
+DEFAULT_STORE_PATH = os.getenv(
+    "SOIL_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "soil_store.sqlite3")
+)
+
+
+def snap_to_cell(lat: float, lon: float) -> Tuple[int, int]:
+    """Snap a coordinate to its (row, col) soil grid cell"""
+    return math.floor(lat / CELL_SIZE_DEG), math.floor(lon / CELL_SIZE_DEG)
+
+
+def cell_center(cell: Tuple[int, int]) -> Tuple[float, float]:
+    """Return the (lat, lon) center of a soil grid cell"""
+    row, col = cell
+    return round((row + 0.5) * CELL_SIZE_DEG, 6), round((col + 0.5) * CELL_SIZE_DEG, 6)
+
+
+class SoilStore:
+    """SQLite-backed store of SoilGrids layers keyed by grid cell"""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS soil_layers (
+                    cell_row INTEGER NOT NULL,
+                    cell_col INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    depth TEXT NOT NULL,
+                    unit_json TEXT,
+                    depth_json TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    PRIMARY KEY (cell_row, cell_col, name, depth)
+                )
+            """)
+            # Cells fetched without a property filter, i.e. holding every layer
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS soil_cells (
+                    cell_row INTEGER NOT NULL,
+                    cell_col INTEGER NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    PRIMARY KEY (cell_row, cell_col)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps the store safe to share
+        # between threads and between server processes.
+        return sqlite3.connect(self.path, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        """One write-locked transaction; BEGIN IMMEDIATE serializes read-merge-write across processes"""
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get(self, lat: float, lon: float) -> Optional[Dict]:
+        """Return the stored SoilGrids response for the cell containing (lat, lon)"""
+        return self.get_cell(snap_to_cell(lat, lon))
+
+    def get_cell(self, cell: Tuple[int, int],
+                 properties: Optional[Sequence[str]] = None,
+                 depths: Optional[Sequence[str]] = None,
+                 values: Optional[Sequence[str]] = None) -> Optional[Dict]:
+        """Return the stored SoilGrids response for a cell, optionally narrowed, or None if unseen"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT name, depth, unit_json, depth_json FROM soil_layers "
+                "WHERE cell_row = ? AND cell_col = ? ORDER BY rowid",
+                cell
+            ).fetchall()
+
+        layers: Dict[str, Dict] = {}
+        for name, depth_label, unit_json, depth_json in rows:
+            if properties is not None and name not in properties:
+                continue
+            if depths is not None and depth_label not in depths:
+                continue
+            depth = json.loads(depth_json)
+            if values is not None:
+                depth["values"] = {k: v for k, v in depth.get("values", {}).items() if k in values}
+            layer = layers.setdefault(name, {
+                "name": name,
+                "unit_measure": json.loads(unit_json) if unit_json else {},
+                "depths": []
+            })
+            layer["depths"].append(depth)
+
+        if not layers:
+            return None
+
+        lat, lon = cell_center(cell)
+        return {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"layers": list(layers.values())}
+        }
+
+    def missing_properties(self, cell: Tuple[int, int], properties: Sequence[str],
+                           depths: Sequence[str] = SOILGRIDS_DEPTHS,
+                           values: Sequence[str] = SOILGRIDS_VALUES) -> List[str]:
+        """Properties with at least one requested depth or statistic not yet stored for the cell"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT name, depth, depth_json FROM soil_layers "
+                "WHERE cell_row = ? AND cell_col = ?",
+                cell
+            ).fetchall()
+
+        stored = {
+            (name, depth): json.loads(depth_json).get("values", {})
+            for name, depth, depth_json in rows
+        }
+        return [
+            prop for prop in properties
+            if any(
+                (prop, depth) not in stored or not all(v in stored[(prop, depth)] for v in values)
+                for depth in depths
+            )
+        ]
+
+    def is_complete(self, cell: Tuple[int, int]) -> bool:
+        """Whether the cell was fetched without any filter"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT 1 FROM soil_cells WHERE cell_row = ? AND cell_col = ?", cell
+            ).fetchone() is not None
+
+    def put(self, lat: float, lon: float, soil_data: Dict) -> None:
+        """Store the layers of a SoilGrids response under the cell containing (lat, lon)"""
+        self.put_cell(snap_to_cell(lat, lon), soil_data)
+
+    def put_cell(self, cell: Tuple[int, int], soil_data: Dict, complete: bool = False) -> None:
+        """Store the layers of a SoilGrids response under a cell, merging with statistics already stored"""
+        layers = soil_data.get("properties", {}).get("layers", [])
+        fetched_at = datetime.now().isoformat()
+
+        # The existing statistics are read under the write lock, so two writers
+        # filling the same cell cannot drop each other's layers
+        with self._transaction() as conn:
+            existing = {
+                (name, depth): json.loads(depth_json)
+                for name, depth, depth_json in conn.execute(
+                    "SELECT name, depth, depth_json FROM soil_layers WHERE cell_row = ? AND cell_col = ?",
+                    cell
+                )
+            }
+
+            rows: List[Tuple] = []
+            for layer in layers:
+                unit_json = json.dumps(layer.get("unit_measure", {}))
+                for depth in layer.get("depths", []):
+                    key = (layer.get("name"), depth.get("label"))
+                    if key in existing:
+                        # Keep statistics from earlier narrowed queries
+                        depth = {**depth, "values": {**existing[key].get("values", {}), **depth.get("values", {})}}
+                    rows.append((
+                        cell[0], cell[1], key[0], key[1],
+                        unit_json, json.dumps(depth), fetched_at
+                    ))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO soil_layers "
+                "(cell_row, cell_col, name, depth, unit_json, depth_json, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            if complete and rows:
+                conn.execute(
+                    "INSERT OR REPLACE INTO soil_cells (cell_row, cell_col, fetched_at) VALUES (?, ?, ?)",
+                    (cell[0], cell[1], fetched_at)
+                )
+
+    def fetch(self, lat: float, lon: float,
+              properties: Optional[Sequence[str]] = None,
+              depths: Optional[Sequence[str]] = None,
+              values: Optional[Sequence[str]] = None,
+              timeout: int = 30,
+              max_wait: Optional[float] = None,
+              fallback: bool = True) -> Dict:
+        """Return soil data for the cell containing (lat, lon), querying SoilGrids only for what is missing
+
+        properties, depths and values narrow both the upstream query and the
+        returned layers; None means everything SoilGrids offers.
+        max_wait is how long to wait for a SoilGrids rate-limit token (None:
+        the guard's short default). With fallback=False a throttled or failed
+        request raises instead of returning stored layers or an error dict;
+        batch jobs use max_wait=math.inf and fallback=False.
+        """
+        cell = snap_to_cell(lat, lon)
+
+        if properties is None:
+            to_fetch = None
+            covered = self.is_complete(cell)
+        else:
+            to_fetch = self.missing_properties(
+                cell, properties, depths or SOILGRIDS_DEPTHS, values or SOILGRIDS_VALUES
+            )
+            covered = not to_fetch
+
+        if covered:
+            stored = self.get_cell(cell, properties, depths, values)
+            if stored is not None:
+                return stored
+
+        # Query the cell center so the stored values represent the whole cell
+        cell_lat, cell_lon = cell_center(cell)
+        params = {"lon": cell_lon, "lat": cell_lat}
+        if to_fetch:
+            params["property"] = list(to_fetch)
+        if depths:
+            params["depth"] = list(depths)
+        if values:
+            params["value"] = list(values)
+
+        try:
+            response = get_guard("soilgrids").get(SOILGRIDS_URL, max_wait=max_wait, params=params, timeout=timeout)
+            response.raise_for_status()
+            soil_data = response.json()
+        except requests.RequestException as e:
+            if not fallback:
+                raise
+            # Throttled, failing or circuit open: fall back to whatever layers are stored
+            stored = self.get_cell(cell, properties, depths, values)
+            if stored is not None:
+                return stored
+            return {"error": f"API request failed: {str(e)}"}
+
+        self.put_cell(cell, soil_data, complete=properties is None and not depths and not values)
+        return self.get_cell(cell, properties, depths, values) or soil_data
+
+    def cell_count(self) -> int:
+        """Number of grid cells currently stored"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT cell_row, cell_col FROM soil_layers)"
+            ).fetchone()[0]
+
+
+_default_store: Optional[SoilStore] = None
+
+
+def get_default_store() -> SoilStore:
+    """Return the process-wide soil store at DEFAULT_STORE_PATH"""
+    global _default_store
+    if _default_store is None:
+        _default_store = SoilStore()
+    return _default_store
@@ -0,0 +1,138 @@
+"""
+Spatial index for nearest-location lookups.
+
+Points are stored as 3-D unit vectors in a KD-tree built with NumPy.
+Straight-line (chord) distance between unit vectors is monotonic in
+great-circle distance, so tree pruning is exact and results come back as
+haversine kilometres. Built once at startup, a nearest or k-nearest query
+over tens of thousands of points takes well under a millisecond.
+"""
+
+import heapq
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """(..., 3) unit vectors for latitude/longitude in degrees"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord) -> np.ndarray:
+    """Great-circle kilometres for a chord length between unit vectors"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized great-circle distance in kilometres"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GeoIndex:
+    """Static KD-tree over (lat, lon) points answering nearest and k-nearest queries"""
+
+    def __init__(self, points: Sequence[Sequence[float]], labels: Optional[Sequence] = None, leaf_size: int = 32):
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(coords) == 0:
+            raise ValueError("GeoIndex needs at least one point")
+
+        self.coords = coords
+        self.labels = list(labels) if labels is not None else list(range(len(coords)))
+        xyz = to_unit_vectors(coords[:, 0], coords[:, 1])
+
+        order = np.arange(len(coords))
+        starts, ends, lows, highs, lefts, rights = [], [], [], [], [], []
+
+        def new_node(start, end):
+            box = xyz[order[start:end]]
+            starts.append(start)
+            ends.append(end)
+            lows.append(box.min(axis=0))
+            highs.append(box.max(axis=0))
+            lefts.append(-1)
+            rights.append(-1)
+            return len(starts) - 1
+
+        stack = [new_node(0, len(coords))]
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+            # Split on the widest axis at the median
+            axis = int(np.argmax(highs[node] - lows[node]))
+            mid = (start + end) // 2
+            segment = order[start:end]
+            order[start:end] = segment[np.argpartition(xyz[segment, axis], mid - start)]
+            lefts[node] = new_node(start, mid)
+            rights[node] = new_node(mid, end)
+            stack.extend((lefts[node], rights[node]))
+
+        self._order = order
+        self._xyz = xyz[order]
+        self._start = np.array(starts)
+        self._end = np.array(ends)
+        self._low = np.array(lows)
+        self._high = np.array(highs)
+        self._left = np.array(lefts)
+        self._right = np.array(rights)
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def _box_distance_sq(self, node: int, p: np.ndarray) -> float:
+        gap = np.maximum(np.maximum(self._low[node] - p, 0.0), p - self._high[node])
+        return float(gap @ gap)
+
+    def query(self, lat: float, lon: float, k: int = 1) -> List[Tuple[int, float]]:
+        """k nearest points as (point index, distance_km), closest first"""
+        k = max(1, min(k, len(self)))
+        p = to_unit_vectors(lat, lon)
+
+        best: List[Tuple[float, int]] = []  # max-heap of (-chord_sq, point index)
+        frontier = [(0.0, 0)]
+        while frontier:
+            bound, node = heapq.heappop(frontier)
+            if len(best) == k and bound > -best[0][0]:
+                break
+            if self._left[node] < 0:
+                start, end = self._start[node], self._end[node]
+                diff = self._xyz[start:end] - p
+                dist_sq = np.einsum("ij,ij->i", diff, diff)
+                for offset in np.argsort(dist_sq)[:k]:
+                    d = float(dist_sq[offset])
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, int(self._order[start + offset])))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, int(self._order[start + offset])))
+                    else:
+                        break
+                continue
+            for child in (self._left[node], self._right[node]):
+                heapq.heappush(frontier, (self._box_distance_sq(child, p), int(child)))
+
+        found = sorted((-neg_d, i) for neg_d, i in best)
+        return [(i, float(chord_to_km(np.sqrt(d)))) for d, i in found]
+
+    def nearest(self, lat: float, lon: float) -> Tuple[int, float]:
+        """Nearest point as (point index, distance_km)"""
+        return self.query(lat, lon, 1)[0]
+
+    def query_batch(self, lats: Sequence[float], lons: Sequence[float], k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances_km) arrays of shape (n_queries, k) for many query points"""
+        k = max(1, min(k, len(self)))
+        indices = np.empty((len(lats), k), dtype=np.int64)
+        distances = np.empty((len(lats), k), dtype=np.float64)
+        for row, (lat, lon) in enumerate(zip(lats, lons)):
+            for col, (i, d) in enumerate(self.query(lat, lon, k)):
+                indices[row, col] = i
+                distances[row, col] = d
+        return indices, distances
@@ -0,0 +1,138 @@
+# Parity tests for async_weather_server against flask_weather_server — run with: python -m pytest -q
+
+import asyncio
+import os
+import tempfile
+
+_STATE_DIR = tempfile.mkdtemp(prefix="agriangat-test-")
+for _name, _file in [("WEATHER_HISTORY_PATH", "history.sqlite3"), ("UPSTREAM_GUARD_PATH", "guard.sqlite3"),
+                     ("GEOCODE_CACHE_PATH", "geocode.sqlite3"), ("SOIL_STORE_PATH", "soil.sqlite3"),
+                     ("SOIL_DATASET_PATH", "missing_dataset")]:
+    os.environ.setdefault(_name, os.path.join(_STATE_DIR, _file))
+os.environ.setdefault("OWM_API_KEY", "test-key")
+
+import pytest
+from starlette.testclient import TestClient
+
+import async_weather_server as asgi
+import flask_weather_server as flask_server
+from request_coalescing import AsyncCoalescingCache, CoalescingCache
+from response_cache import ResponseCache
+from weather_payload import build_weather_data
+
+CURRENT = {"main": {"temp": 27.6, "humidity": 85}, "wind": {"speed": 5.0},
+           "weather": [{"description": "light rain"}], "clouds": {"all": 90}, "rain": {"1h": 0.4}}
+
+class Upstream:
+    """Fake OpenWeatherMap shared by both servers; Davao City never answers"""
+
+    def __init__(self):
+        self.down = False
+        self.calls = []
+
+    def answer(self, city_name, lat, lon, location_key):
+        self.calls.append(location_key)
+        if self.down or city_name.lower() == "davao city":
+            raise Exception("Weather API error: 503")
+        return build_weather_data(city_name, lat, lon, CURRENT, [])
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+
+    async def fetch_at(*args):
+        return upstream.answer(*args)
+
+    monkeypatch.setattr(flask_server, "_fetch_weather_at", upstream.answer)
+    monkeypatch.setattr(flask_server, "_weather_cache", CoalescingCache(600))
+    monkeypatch.setattr(flask_server, "_weather_responses",
+                        ResponseCache(600, lambda payload: flask_server.app.json.dumps(payload)))
+    monkeypatch.setattr(asgi, "_fetch_weather_at", fetch_at)
+    monkeypatch.setattr(asgi, "_weather_cache", AsyncCoalescingCache(600))
+    monkeypatch.setattr(asgi, "_weather_responses", AsyncCoalescingCache(600, ttl_of=lambda entry: entry.max_age))
+    return upstream
+
+@pytest.fixture
+def clients(upstream):
+    with TestClient(asgi.app) as asgi_client:
+        yield flask_server.app.test_client(), asgi_client
+
+def both(clients, method, url, **kwargs):
+    """(status, JSON body) from each server for the same request"""
+    flask_client, asgi_client = clients
+    flask_response = flask_client.open(url, method=method, **kwargs)
+    if "data" in kwargs:
+        kwargs["content"] = kwargs.pop("data")
+    asgi_response = asgi_client.request(method, url, **kwargs)
+    return (flask_response.status_code, flask_response.get_json()), (asgi_response.status_code, asgi_response.json())
+
+@pytest.mark.parametrize("method, url, kwargs", [
+    ("GET", "/api/weather/manila", {}),
+    ("GET", "/api/weather/quezon", {}),
+    ("GET", "/api/soil/baguio", {}),
+    ("GET", "/api/soil/atlantis", {}),
+    ("GET", "/api/cities?q=san&limit=3&offset=1", {}),
+    ("GET", "/api/weather/manila/history?days=3", {}),
+    ("GET", "/api/weather/manila/history?days=week", {}),
+    ("GET", "/api/city-from-coords?lat=16.4&lon=120.6&k=3", {}),
+    ("GET", "/api/city-from-coords?lat=north&lon=120.6", {}),
+    ("POST", "/api/city-from-coords", {"json": {"points": [{"lat": 14.6, "lon": 121.0}, {"lat": 7.1, "lon": 125.6}]}}),
+    ("POST", "/api/city-from-coords", {"json": {"points": [{"lat": 14.6}]}}),
+    ("POST", "/api/city-from-coords", {"data": b"not json", "headers": {"Content-Type": "application/json"}}),
+    ("POST", "/api/weather/batch", {"json": {"cities": ["Manila", "Davao City", "", "manila"],
+                                             "coordinates": [{"lat": 10.3, "lon": 123.9}, {"lat": "x"}]}}),
+    ("POST", "/api/weather/batch", {"json": {"cities": ["Manila"] * 51}}),
+])
+def test_servers_answer_alike(clients, method, url, kwargs):
+    (flask_status, flask_body), (asgi_status, asgi_body) = both(clients, method, url, **kwargs)
+    assert flask_status == asgi_status
+    assert flask_body == asgi_body
+
+def test_health_reports_upstreams(clients):
+    (_, flask_body), (_, asgi_body) = both(clients, "GET", "/health")
+    assert set(flask_body["upstreams"]) == set(asgi_body["upstreams"]) == {"openweathermap", "soilgrids"}
+
+def test_last_known_weather_is_served_stale_with_no_store(clients, upstream):
+    _, asgi_client = clients
+    assert asgi_client.get("/api/weather/manila").headers["Cache-Control"].startswith("public, max-age=")
+
+    for cache, key in [(asgi._weather_cache, asgi.weather_key(*asgi.CITY_CENTERS["manila"])),
+                       (asgi._weather_responses, "manila")]:
+        expires_at, value = cache._results[key]
+        cache._results[key] = (expires_at - 600, value)
+    upstream.down = True
+
+    stale = asgi_client.get("/api/weather/manila")
+    assert stale.status_code == 200 and stale.json()["weatherData"]["stale"] is True
+    assert stale.headers["Cache-Control"] == "no-store"
+    # Nothing to fall back on for a city never fetched
+    assert asgi_client.get("/api/weather/cebu").status_code == 500
+
+def test_upstream_requests_go_through_the_guard(monkeypatch):
+    calls = []
+
+    async def guarded(func, url, **kwargs):
+        calls.append(url.rsplit("/", 1)[-1])
+        return await func(url, **kwargs)
+
+    class Response:
+        status_code = 200
+
+        def __init__(self, body):
+            self.body = body
+
+        def json(self):
+            return self.body
+
+    async def get(url, **kwargs):
+        return Response({"list": []} if url.endswith("forecast") else CURRENT)
+
+    monkeypatch.setattr(asgi.OWM_GUARD, "acall", guarded)
+    monkeypatch.setattr(asgi, "http_client", type("Client", (), {"get": staticmethod(get)}))
+    monkeypatch.setattr(asgi, "_record_history", lambda *args: None)
+
+    payload = asyncio.run(asgi._fetch_weather_at("Manila", 14.6, 121.0, "manila"))
+    assert sorted(calls) == ["forecast", "weather"] and payload["temperature"] == 28
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,40 @@
+# Unit tests for city_index.CityCatalogue — run with: python -m pytest -q
+
+import pytest
+from city_index import CityCatalogue, normalize_name
+from ph_cities import CITY_CENTERS
+
+@pytest.fixture(scope="module")
+def catalogue():
+    return CityCatalogue(CITY_CENTERS)
+
+def test_normalize_folds_case_accents_and_spaces():
+    assert normalize_name("  Las  PIÑAS ") == "las pinas"
+    assert normalize_name("Parañaque") == normalize_name("paranaque")
+
+def test_prefix_matches_any_word_in_name_order(catalogue):
+    names = [entry["name"] for entry in catalogue.search("san")]
+    assert names == sorted(names) and "San Juan" in names and "San Jose Del Monte" in names
+    assert "General Santos" in names  # "santos" starts with "san"
+    assert [entry["name"] for entry in catalogue.search("quezon")] == ["Quezon City"]
+    assert "Quezon City" in [entry["name"] for entry in catalogue.search("CITY")]
+    assert catalogue.search("zzz") == []
+    assert len(catalogue.search("  ")) == len(catalogue) == len(CITY_CENTERS)
+
+def test_accent_insensitive_search(catalogue):
+    assert [entry["name"] for entry in catalogue.search("paranaque")] == ["Parañaque"]
+    assert [entry["name"] for entry in catalogue.search("PARAÑ")] == ["Parañaque"]
+    assert [entry["key"] for entry in catalogue.search("las pinas")] == ["las_piñas"]
+
+def test_search_page_limit_and_offset(catalogue):
+    everything = catalogue.search("san")
+    page = catalogue.search_page("san", limit=2, offset=1)
+    assert page["cities"] == everything[1:3]
+    assert (page["count"], page["total"], page["offset"], page["limit"]) == (2, len(everything), 1, 2)
+
+    last = catalogue.search_page("san", limit=5, offset=len(everything) - 1)
+    assert last["count"] == 1 and last["cities"] == everything[-1:]
+    assert catalogue.search_page("san", limit=5, offset=len(everything))["cities"] == []
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,52 @@
+# Unit tests for city_resolver.CityResolver — run with: python -m pytest -q
+
+import pytest
+from city_resolver import BKTree, CityResolver, levenshtein, transposition_distance
+from ph_cities import CITY_CENTERS
+
+@pytest.fixture
+def resolver(tmp_path):
+    return CityResolver(CITY_CENTERS, cache_path=str(tmp_path / "geocode.sqlite3"))
+
+def test_distances_and_bk_tree():
+    assert levenshtein("baguio", "baguoi") == 2 and transposition_distance("baguio", "baguoi") == 1
+    tree = BKTree(["manila", "marikina", "malabon", "makati"])
+    assert tree.search("manilla", 1) == [(1, "manila")]
+    assert [word for _, word in tree.search("makati", 2)] == ["makati"]
+
+def test_exact_prefix_and_accent_folding(resolver):
+    assert resolver.resolve("  MANILA ") == ("manila", *CITY_CENTERS["manila"])
+    assert resolver.resolve("quezon")[0] == "quezon city"
+    assert resolver.resolve("paranaque")[0] == "parañaque"
+    assert resolver.resolve("las pinas")[0] == "las piñas"
+
+def test_typos_are_left_to_the_geocoder_with_a_closest_fallback(resolver):
+    for typo, city in [("manilla", "manila"), ("baguoi", "baguio"), ("paranque", "parañaque")]:
+        assert resolver.resolve(typo) is None
+        assert resolver.closest(typo)[0] == city
+    assert resolver.closest("baguoi")[0] == "baguio"  # swapped letters count as one typo
+
+@pytest.mark.parametrize("town", ["Ilagan", "Candon", "Banaue", "Silang", "Tanay", "Calauan", "Sagada", "Bamban"])
+def test_real_towns_near_a_catalogue_name_are_never_resolved_offline(resolver, town):
+    # Each one is a couple of edits from a different, distant city (Ilagan/Iligan, Banaue/Mandaue, ...)
+    assert resolver.resolve(town) is None
+    resolver.remember(town, 1.0, 2.0)
+    assert resolver.resolve(town) == (town.lower(), 1.0, 2.0)
+
+def test_ambiguous_or_unknown_input_is_left_to_the_geocoder(resolver):
+    for query in ("sa", "san", "ma", "xyzzy", "", "   "):
+        assert resolver.resolve(query) is None
+
+def test_geocode_answers_persist_across_instances(resolver):
+    resolver.remember("Sagada", 17.0833, 120.9)
+    resolver.remember("Atlantis", None, None)
+    assert resolver.resolve("sagada") == ("sagada", 17.0833, 120.9)
+    assert resolver.is_known_miss("ATLANTIS") and not resolver.is_known_miss("Sagada")
+
+    reopened = CityResolver(CITY_CENTERS, cache_path=resolver.cache_path)
+    assert reopened.resolve("Sagada") == ("sagada", 17.0833, 120.9)
+    assert reopened.closest("sagdaa") == ("sagada", 17.0833, 120.9)  # cached names join the fuzzy index
+    assert reopened.is_known_miss("atlantis") and reopened.resolve("atlantis") is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,47 @@
+# Unit tests for farm_dashboard soil sections — run with: python -m pytest -q
+
+import json
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+from farm_dashboard import SectionUnavailable, _finished_event, fetch_soil_source
+from soil_dataset import SoilDataset
+from soil_profile import PROPERTY_INDEX, SOIL_DEPTHS, SOIL_PROPERTIES, SOIL_STATS
+
+@pytest.fixture
+def dataset(tmp_path):
+    """One-row dataset for a farm near Tarlac with acidic topsoil (pH 5.2, mapped units)"""
+    data = np.full((1, len(SOIL_PROPERTIES), len(SOIL_DEPTHS), len(SOIL_STATS)), np.nan, dtype=np.float32)
+    data[0, PROPERTY_INDEX["phh2o"]] = 52
+    path = str(tmp_path / "soil_dataset")
+    np.save(path + ".npy", data)
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump({"properties": SOIL_PROPERTIES, "depths": SOIL_DEPTHS, "stats": SOIL_STATS,
+                   "locations": [{"key": "tarlac farm", "lat": 15.48, "lon": 120.59}]}, f)
+    return SoilDataset(path)
+
+def test_dataset_row_is_served_as_soilgrids(dataset):
+    result = fetch_soil_source("Tarlac Farm", dataset)
+    assert result["soil"]["source"] == "soilgrids"
+    assert result["soil"]["soilData"]["pH Level"] == "5.2"
+    assert result["soil"]["coordinates"] == {"latitude": 15.48, "longitude": 120.59}
+
+def test_sample_city_is_flagged_with_its_own_coordinates(dataset):
+    result = fetch_soil_source("Baguio", dataset)
+    assert result["soil"]["source"] == "sample" and result["soil"]["soilData"]["pH Level"] == "5.9"
+    assert result["soil"]["coordinates"]["latitude"] > 16  # not the Manila placeholder
+    assert result["crops"]["suggestedCrops"]
+
+def test_unknown_city_gets_no_made_up_soil_or_crops(dataset):
+    with pytest.raises(SectionUnavailable):
+        fetch_soil_source("Atlantis", dataset)
+    with pytest.raises(SectionUnavailable):
+        fetch_soil_source("Atlantis")
+
+    future = Future()
+    future.set_exception(SectionUnavailable("No soil data for this city yet"))
+    assert _finished_event("crops", future)["status"] == "unavailable"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,67 @@
+# Unit tests for farm_registry — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from farm_registry import FarmRegistry, cluster_farms
+from spatial_index import haversine_km
+
+def square(lon, lat, size=0.002):
+    return {"type": "Polygon", "coordinates": [[[lon, lat], [lon + size, lat], [lon + size, lat + size],
+                                                [lon, lat + size], [lon, lat]]]}
+
+@pytest.fixture
+def registry(tmp_path):
+    return FarmRegistry(str(tmp_path / "farms.sqlite3"))
+
+@pytest.fixture
+def random_farms(registry):
+    rng = np.random.default_rng(7)
+    lats, lons = rng.uniform(13.5, 15.5, 500), rng.uniform(120.5, 122.0, 500)
+    registry.add_farms({"id": f"f{i}", "lat": lat, "lon": lon, "attributes": {"crop": "rice"}}
+                       for i, (lat, lon) in enumerate(zip(lats, lons)))
+    return lats, lons
+
+def test_geojson_import_and_attributes(registry):
+    count = registry.import_geojson({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"id": "A", "owner": "Cruz"}, "geometry": square(121.0, 14.6)},
+        {"type": "Feature", "properties": {"name": "well"}, "geometry": {"type": "Point", "coordinates": [121.1, 14.7]}},
+    ]})
+    assert count == 2 and len(registry) == 2
+    farm = registry.get("A")
+    assert farm["lat"] == pytest.approx(14.601) and farm["attributes"] == {"owner": "Cruz"}
+    assert farm["bounds"] == pytest.approx((121.0, 14.6, 121.002, 14.602), abs=2e-5)
+    assert [p.id for p in registry.parcels(registry.all())] == ["A"]
+
+    registry.add_farm("A", 14.8, 121.3, square(121.3, 14.8), owner="Reyes")  # update moves the R-tree entry too
+    assert registry.get("A")["attributes"] == {"owner": "Reyes"} and len(registry) == 2
+    assert [f["id"] for f in registry.in_bbox(120.99, 14.59, 121.01, 14.61)] == []
+    assert registry.remove("A") and not registry.remove("A") and registry.get("A") is None
+
+def test_bbox_radius_and_nearest_match_brute_force(registry, random_farms):
+    lats, lons = random_farms
+    inside = {f["id"] for f in registry.in_bbox(121.0, 14.0, 121.5, 14.5)}
+    assert inside == {f"f{i}" for i in np.flatnonzero((lons >= 121.0) & (lons <= 121.5) & (lats >= 14.0) & (lats <= 14.5))}
+
+    distances = haversine_km(14.6, 121.0, lats, lons)
+    near = registry.within_radius(14.6, 121.0, 25)
+    assert [f["id"] for f in near] == [f"f{i}" for i in np.argsort(distances) if distances[i] <= 25]
+    assert [f["distanceKm"] for f in near] == sorted(f["distanceKm"] for f in near)
+
+    nearest = registry.nearest(14.6, 121.0, k=5)
+    assert [f["id"] for f in nearest] == [f"f{i}" for i in np.argsort(distances)[:5]]
+    assert len(registry.nearest(40.0, 0.0, k=3)) == 0  # nothing within the search limit
+
+def test_clusters_share_one_request_per_cell(registry, random_farms):
+    farms = registry.all()
+    clusters = cluster_farms(farms, cell_deg=0.25)
+    assert sorted(i for c in clusters for i in c["farms"]) == sorted(f["id"] for f in farms)
+    by_id = {f["id"]: f for f in farms}
+    for cluster in clusters:
+        min_lon, min_lat, max_lon, max_lat = cluster["bbox"]
+        cells = {(np.floor(by_id[i]["lat"] / 0.25), np.floor(by_id[i]["lon"] / 0.25)) for i in cluster["farms"]}
+        assert len(cells) == 1
+        assert all(min_lat <= by_id[i]["lat"] <= max_lat and min_lon <= by_id[i]["lon"] <= max_lon
+                   for i in cluster["farms"])
+
+if __name__ == "__main__":
+    pytest.main([__file__])
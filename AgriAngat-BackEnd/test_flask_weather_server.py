@@ -0,0 +1,245 @@
+# Unit tests for flask_weather_server routes — run with: python -m pytest -q
+
+import gzip
+import os
+import tempfile
+import threading
+
+_STATE_DIR = tempfile.mkdtemp(prefix="agriangat-test-")
+for _name, _file in [("WEATHER_HISTORY_PATH", "history.sqlite3"), ("UPSTREAM_GUARD_PATH", "guard.sqlite3"),
+                     ("GEOCODE_CACHE_PATH", "geocode.sqlite3"), ("SOIL_STORE_PATH", "soil.sqlite3"),
+                     ("SOIL_DATASET_PATH", "missing_dataset")]:
+    os.environ.setdefault(_name, os.path.join(_STATE_DIR, _file))
+os.environ.setdefault("OWM_API_KEY", "test-key")
+
+import pytest
+import flask_weather_server as server
+from weather_payload import build_weather_data
+
+MANILA = server.weather_key(*server.CITY_CENTERS["manila"])
+CURRENT = {"main": {"temp": 31.2, "humidity": 70}, "wind": {"speed": 3.0},
+           "weather": [{"description": "scattered clouds"}], "clouds": {"all": 40}, "dt": 1760000000}
+
+def age(cache, key, seconds):
+    """Make a CoalescingCache entry look fetched the given seconds earlier"""
+    expires_at, value = cache._results[key]
+    cache._results[key] = (expires_at - seconds, value)
+
+@pytest.fixture
+def client(monkeypatch):
+    fetches = []
+
+    def fake_fetch_at(city_name, lat, lon, location_key):
+        fetches.append(location_key)
+        if client.upstream_down:
+            raise Exception("Weather API error: 503")
+        return build_weather_data(city_name, lat, lon, CURRENT, [])
+
+    monkeypatch.setattr(server, "_fetch_weather_at", fake_fetch_at)
+    monkeypatch.setattr(server, "_weather_cache", server.CoalescingCache(600))
+    monkeypatch.setattr(server, "_weather_responses",
+                        server.ResponseCache(600, lambda payload: server.app.json.dumps(payload)))
+    client = server.app.test_client()
+    client.fetches = fetches
+    client.upstream_down = False
+    return client
+
+def test_weather_etag_304_and_gzip(client):
+    first = client.get("/api/weather/manila")
+    assert first.status_code == 200 and first.get_json()["weatherData"]["temperature"] == 31
+    assert first.headers["Cache-Control"] in ("public, max-age=599", "public, max-age=600")
+
+    revalidated = client.get("/api/weather/manila", headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304 and revalidated.data == b""
+
+    zipped = client.get("/api/weather/manila", headers={"Accept-Encoding": "gzip, br"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.data) == first.data
+    assert client.fetches == ["manila"]
+
+def test_weather_body_expires_with_its_data(client):
+    # The batch endpoint fetched Manila 590 s ago: the body gets the 10 s that are left, not 600
+    server.get_weather_data("manila")
+    age(server._weather_cache, MANILA, 590)
+
+    response = client.get("/api/weather/manila")
+    assert response.headers["Cache-Control"] in ("public, max-age=9", "public, max-age=10")
+    assert client.fetches == ["manila"]
+
+def test_last_known_weather_is_not_cacheable(client):
+    client.get("/api/weather/manila")
+    age(server._weather_cache, MANILA, 600)
+    age(server._weather_responses._entries, "manila", 600)
+    client.upstream_down = True
+
+    stale = client.get("/api/weather/manila")
+    assert stale.status_code == 200 and stale.get_json()["weatherData"]["stale"] is True
+    assert stale.headers["Cache-Control"] == "no-store"
+
+    # Served again from the upstream as soon as it recovers
+    client.upstream_down = False
+    fresh = client.get("/api/weather/manila")
+    assert "stale" not in fresh.get_json()["weatherData"]
+    assert fresh.headers["Cache-Control"].startswith("public, max-age=")
+    assert client.fetches == ["manila"] * 3
+
+def test_names_for_one_place_share_a_fetch_and_a_label(client):
+    for name in ("Quezon City", "quezon", "QUEZON CITY", "Quezon%20City"):
+        assert client.get(f"/api/weather/{name}").get_json()["weatherData"]["location"] == "Quezon City"
+    assert client.fetches == ["quezon city"]
+    assert list(server._weather_cache._results) == [server.weather_key(*server.CITY_CENTERS["quezon city"])]
+    assert list(server._weather_responses._entries._results) == ["quezon city"]
+
+@pytest.mark.parametrize("days", ["week", "", "2.5"])
+def test_history_rejects_non_integer_days(client, days):
+    response = client.get(f"/api/weather/manila/history?days={days}")
+    assert response.status_code == 400 and response.get_json()["error"] == "'days' must be an integer"
+
+def test_history_days_are_clamped(client):
+    assert len(client.get("/api/weather/manila/history?days=365").get_json()["days"]) == 90
+    assert len(client.get("/api/weather/manila/history?days=-1").get_json()["days"]) == 1
+
+def test_city_from_coords_batch(client):
+    response = client.post("/api/city-from-coords", json={
+        "points": [{"lat": 14.5995, "lon": 120.9842}, {"lat": "16.4023", "lon": 120.596}], "k": 2})
+    body = response.get_json()
+    assert response.status_code == 200 and body["count"] == 2
+    assert [len(nearest) for nearest in body["results"]] == [2, 2]
+    assert body["results"][0] == server.nearest_cities(14.5995, 120.9842, 2)
+    assert body["results"][1][0]["city"] == "Baguio"
+
+@pytest.mark.parametrize("body", [
+    b"not json", b"[]", b"{}", b'{"points": {"lat": 14.6}}', b'{"points": [{"lat": 14.6}]}',
+    b'{"points": [{"lat": "north", "lon": 121}]}', b'{"points": [{"lat": 95, "lon": 121}]}',
+    b'{"points": [[14.6, 121]]}', b'{"points": [], "k": "many"}',
+])
+def test_city_from_coords_rejects_malformed_requests(client, body):
+    response = client.post("/api/city-from-coords", data=body, content_type="application/json")
+    assert response.status_code == 400 and response.get_json()["success"] is False
+
+def test_city_from_coords_get_validates_query(client):
+    assert client.get("/api/city-from-coords?lat=16.4023&lon=120.596").get_json()["city"] == "Baguio"
+    assert client.get("/api/city-from-coords?lat=abc&lon=121").status_code == 400
+    assert client.get("/api/city-from-coords?lat=14.6&lon=121&k=x").status_code == 400
+
+def test_weather_batch_mixes_cities_and_coordinates(client):
+    response = client.post("/api/weather/batch", json={
+        "cities": ["Manila", "manila ", "Baguio"],
+        "coordinates": [{"lat": 10.3157, "lon": 123.8854}, {"lat": "10.3159", "lon": "123.8851"}],
+    })
+    body = response.get_json()
+    assert response.status_code == 200 and (body["count"], body["failed"]) == (5, 0)
+    assert [r["query"] for r in body["results"]] == [
+        "Manila", "manila", "Baguio", {"lat": 10.3157, "lon": 123.8854}, {"lat": 10.3159, "lon": 123.8851}]
+    assert [r["weatherData"]["location"] for r in body["results"]] == ["Manila"] * 2 + ["Baguio"] + ["Cebu City"] * 2
+    # Repeated cities and points within ~100 m share one upstream fetch
+    assert sorted(map(str, client.fetches)) == sorted(map(str, ["manila", "baguio", (10.316, 123.885)]))
+
+def test_weather_batch_reports_failures_per_item(client, monkeypatch):
+    fetch_at = server._fetch_weather_at
+
+    def flaky(city_name, lat, lon, location_key):
+        if location_key == "baguio":
+            raise Exception("Weather API error: 503")
+        return fetch_at(city_name, lat, lon, location_key)
+
+    monkeypatch.setattr(server, "_fetch_weather_at", flaky)
+    body = client.post("/api/weather/batch", json={
+        "cities": ["Manila", "Baguio", "", 42],
+        "coordinates": [{"lat": 95, "lon": 121}, [14.6, 121.0], {"lat": 14.6}],
+    }).get_json()
+
+    assert (body["count"], body["failed"]) == (7, 6)
+    assert body["results"][0]["success"] and body["results"][0]["weatherData"]["location"] == "Manila"
+    assert body["results"][1] == {"query": "Baguio", "success": False,
+                                  "error": "Weather service error: Weather API error: 503"}
+    assert [r["error"] for r in body["results"][2:]] == ["Invalid city name"] * 2 + ["Invalid coordinates"] * 3
+
+@pytest.mark.parametrize("body", [
+    {"cities": ["Manila"] * 30, "coordinates": [{"lat": 14.6, "lon": 121.0}] * 21},
+    {}, {"cities": []}, {"cities": "Manila"}, [], "Manila",
+])
+def test_weather_batch_rejects_bad_requests(client, body):
+    response = client.post("/api/weather/batch", json=body)
+    assert response.status_code == 400 and response.get_json()["success"] is False
+    assert client.fetches == []
+
+def test_weather_batch_size_limit_is_inclusive(client):
+    cities = [name for name in server.CITY_CENTERS][:server.WEATHER_BATCH_MAX_ITEMS]
+    assert client.post("/api/weather/batch", json={"cities": cities}).get_json()["count"] == len(cities) == 50
+
+def test_fallback_soil_takes_no_cache_slot(client, monkeypatch):
+    monkeypatch.setattr(server, "_soil_responses",
+                        server.ResponseCache(600, lambda payload: server.app.json.dumps(payload)))
+    for i in range(20):
+        response = client.get(f"/api/soil/nowhere-{i}")
+        assert response.status_code == 200 and response.get_json()["city"] == f"Nowhere-{i}"
+    assert server._soil_responses._entries._results == {}
+
+    first = client.get("/api/soil/Baguio")
+    assert client.get("/api/soil/baguio", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert list(server._soil_responses._entries._results) == ["baguio"]
+
+def test_dashboard_ndvi_runs_on_its_own_pool_once_per_city(client, monkeypatch):
+    release = threading.Event()
+    threads = []
+
+    def slow_ndvi(city_name):
+        threads.append(threading.current_thread().name)
+        release.wait(5)
+        return {"mean": 0.6}
+
+    monkeypatch.setattr(server, "fetch_ndvi_source", slow_ndvi)
+    futures = [server.submit_ndvi_source(name) for name in ["Manila", " manila", "Baguio"] + [f"Town {i}" for i in range(10)]]
+    assert futures[0] is futures[1] and len(set(futures)) == 12
+
+    # Twelve NDVI fetches stuck on Sentinel Hub do not hold up batch weather
+    response = client.post("/api/weather/batch", json={"cities": ["Manila", "Baguio", "Cebu City"]})
+    assert response.get_json()["failed"] == 0 and not any(future.done() for future in futures)
+
+    release.set()
+    assert all(future.result(5) == {"mean": 0.6} for future in futures)
+    assert len(threads) == 12 and all(name.startswith("dashboard-ndvi") for name in threads)
+
+class Geocoder:
+    """Fake OpenWeatherMap city search: knows ILAGAN, answers nothing else, or is down"""
+
+    def __init__(self):
+        self.down = False
+        self.queries = []
+
+    def get(self, url, **kwargs):
+        query = url.split("q=", 1)[1].split(",", 1)[0]
+        self.queries.append(query)
+        if self.down:
+            raise Exception("Upstream openweathermap circuit open")
+        answer = [{"lat": 17.1485, "lon": 121.8892}] if query.lower() == "ilagan" else []
+        return type("Response", (), {"status_code": 200, "json": lambda self: answer})()
+
+@pytest.fixture
+def geocoder(monkeypatch, tmp_path):
+    geocoder = Geocoder()
+    monkeypatch.setattr(server.OWM_GUARD, "get", geocoder.get)
+    monkeypatch.setattr(server, "CITY_RESOLVER", server.CityResolver(
+        server.CITY_CENTERS, server.CITY_CATALOGUE, cache_path=str(tmp_path / "geocode.sqlite3")))
+    return geocoder
+
+def test_towns_missing_from_the_catalogue_are_geocoded_not_fuzzed(client, geocoder):
+    # Ilagan is two edits from Iligan, 1,000 km away
+    weather = client.get("/api/weather/Ilagan").get_json()["weatherData"]
+    assert weather["location"] == "Ilagan" and weather["coordinates"] == {"lat": 17.1485, "lon": 121.8892}
+    assert server.resolve_city("ilagan") == ("ilagan", 17.1485, 121.8892)
+    assert geocoder.queries == ["Ilagan"]  # the answer is cached
+
+def test_closest_city_only_when_the_geocoder_cannot_answer(client, geocoder):
+    weather = client.get("/api/weather/paranque").get_json()["weatherData"]
+    assert weather["location"] == "Parañaque"  # labelled with the city it really is
+    assert weather["coordinates"] == dict(zip(("lat", "lon"), server.CITY_CENTERS["parañaque"]))
+
+    geocoder.down = True
+    assert server.resolve_city("Manilla")[0] == "manila"
+    with pytest.raises(Exception, match="circuit open"):
+        server.resolve_city("Xyzzyville")
+
+if __name__ == "__main__":
+    pytest.main([__file__])
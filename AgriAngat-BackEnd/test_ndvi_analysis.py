@@ -0,0 +1,93 @@
+# Unit tests for ndvi_analysis batch helpers with a stubbed request_ndvi — run with: python -m pytest -q
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+import ndvi_analysis
+from ndvi_analysis import analyze_locations, analyze_parcels, map_file_name, monitor_parcels
+from ndvi_baseline import ParcelBaseline
+from ndvi_zonal import Parcel
+
+CONFIG = object()  # never reaches Sentinel Hub
+
+def square(parcel_id, lon, lat, size=0.002):
+    return Parcel(parcel_id, [np.array([(lon, lat), (lon + size, lat), (lon + size, lat + size),
+                                        (lon, lat + size), (lon, lat)])])
+
+class FakeSentinelHub:
+    """request_ndvi stand-in: NDVI 0.6 everywhere, later calls answer first, one bbox fails"""
+
+    def __init__(self, failing_lon=None):
+        self.failing_lon = failing_lon
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, bbox_coords, config=None, **options):
+        with self._lock:
+            self.calls.append((bbox_coords, options))
+            delay = max(0.0, 0.05 - 0.01 * len(self.calls))
+        time.sleep(delay)
+        if self.failing_lon is not None and bbox_coords[0] <= self.failing_lon <= bbox_coords[2]:
+            raise RuntimeError("Sentinel Hub request failed")
+        return np.full((20, 20), 0.6, dtype=np.float32)
+
+@pytest.fixture
+def sentinel(monkeypatch):
+    fake = FakeSentinelHub(failing_lon=120.597)
+    monkeypatch.setattr(ndvi_analysis, "request_ndvi", fake)
+    return fake
+
+def test_locations_keep_input_order_and_record_errors(sentinel, tmp_path, monkeypatch):
+    saved = []
+    monkeypatch.setattr(ndvi_analysis, "save_ndvi_map", lambda ndvi, bbox, path: saved.append(path) or path)
+    locations = {name: ndvi_analysis.city_bbox(*coords) for name, coords in [
+        ("manila", (14.5995, 120.9842)), ("baguio", (16.4023, 120.5960)),
+        ("../../outside", (10.3157, 123.8854)), ("davao city", (7.1907, 125.4553))]}
+
+    rows = analyze_locations(locations, CONFIG, map_dir=str(tmp_path / "maps"), max_workers=4, resolution=20)
+    assert [row["name"] for row in rows] == list(locations)
+    assert rows[1]["error"] == "Sentinel Hub request failed" and "map" not in rows[1]
+    assert all(row["mean"] == pytest.approx(0.6) and "error" not in row for row in rows[:1] + rows[2:])
+    assert all(options == {"resolution": 20} for _, options in sentinel.calls)
+
+    # Every map lands inside --maps, whatever the location is called
+    maps_dir = os.path.realpath(tmp_path / "maps")
+    assert len(saved) == 3 and all(os.path.dirname(os.path.realpath(path)) == maps_dir for path in saved)
+    assert rows[2]["map"].endswith("outside.html")
+
+def test_map_file_names_stay_in_the_directory():
+    assert map_file_name("Quezon City") == "Quezon_City.html"
+    assert map_file_name("Las Piñas") == "Las_Piñas.html"
+    for name in ("../../etc/cron.d/x", "a/b", "a\\b", "..", "/", ""):
+        file_name = map_file_name(name)
+        assert "/" not in file_name and "\\" not in file_name and not file_name.startswith(".")
+
+def test_parcel_groups_fan_out_to_their_parcels(sentinel):
+    parcels = [square("manila-1", 120.980, 14.600), square("baguio-1", 120.596, 16.402),
+               square("manila-2", 120.990, 14.605), square("manila-3", 120.985, 14.610)]
+
+    rows = analyze_parcels(parcels, CONFIG, max_workers=2)
+    assert len(sentinel.calls) == 2  # one raster per group, not per parcel
+    assert [row["id"] for row in rows] == ["manila-1", "baguio-1", "manila-2", "manila-3"]
+    assert rows[0]["group"] == rows[2]["group"] == rows[3]["group"] != rows[1]["group"]
+    assert rows[1] == {"id": "baguio-1", "error": "Sentinel Hub request failed", "group": rows[1]["group"]}
+    assert all(row["validPixels"] > 0 and row["mean"] == pytest.approx(0.6) for row in rows if row is not rows[1])
+
+def test_monitoring_scores_only_parcels_with_data(sentinel, tmp_path):
+    parcels = [square("manila-1", 120.980, 14.600), square("baguio-1", 120.596, 16.402)]
+    baseline = ParcelBaseline(str(tmp_path / "baseline.sqlite3"))
+    end_dates = [datetime(2026, 10, day) for day in (1, 8, 8, 15)]  # the 8th is monitored twice
+
+    for end_date in end_dates:
+        rows = monitor_parcels(parcels, baseline, CONFIG, end_date=end_date)
+    assert [options["end_date"] for _, options in sentinel.calls[::2]] == end_dates
+    assert rows[0]["baselineCount"] == 2 and rows[0]["baselineMean"] == pytest.approx(0.6)
+    assert baseline.get("manila-1", 10)["count"] == 3
+    assert "baselineCount" not in rows[1] and rows[1]["error"]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
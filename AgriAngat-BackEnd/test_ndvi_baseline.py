@@ -0,0 +1,92 @@
+# Unit tests for ndvi_baseline — run with: python -m pytest -q
+
+import sqlite3
+
+import numpy as np
+import pytest
+from ndvi_baseline import MIN_NDVI_STD, ParcelBaseline, PixelBaseline, anomaly_share, pixel_baseline_path
+
+def test_parcel_baseline_matches_batch_statistics(tmp_path):
+    baseline = ParcelBaseline(str(tmp_path / "baseline.sqlite3"))
+    history = np.random.default_rng(1).normal(0.6, 0.05, (6, 3))
+    for year in history:
+        baseline.observe(7, {"A": year[0], "B": year[1], "C": year[2], "cloudy": None})
+
+    for j, parcel_id in enumerate("ABC"):
+        stored = baseline.get(parcel_id, 7)
+        assert stored["count"] == 6
+        assert stored["mean"] == pytest.approx(history[:, j].mean())
+        assert stored["std"] == pytest.approx(max(history[:, j].std(ddof=1), MIN_NDVI_STD))
+    assert baseline.get("cloudy", 7) is None and baseline.get("A", 8) is None
+
+def test_parcel_drop_is_flagged_before_it_enters_the_baseline(tmp_path):
+    baseline = ParcelBaseline(str(tmp_path / "baseline.sqlite3"))
+    for value in (0.60, 0.64, 0.62, 0.58, 0.61):
+        baseline.observe(3, {"farm": value, "new": None})
+    mean, std = baseline.get("farm", 3)["mean"], baseline.get("farm", 3)["std"]
+
+    scores = baseline.observe(3, {"farm": mean - 2.5 * std, "new": 0.3})
+    assert scores["farm"]["anomaly"] and scores["farm"]["zScore"] == pytest.approx(-2.5, abs=0.01)
+    assert scores["new"] == {"baselineCount": 0, "baselineMean": None, "baselineStd": None,
+                             "zScore": None, "anomaly": False}
+    assert baseline.get("farm", 3)["count"] == 6
+    assert not baseline.score(3, {"farm": mean})["farm"]["anomaly"]
+
+def test_same_window_is_folded_in_once(tmp_path):
+    baseline = ParcelBaseline(str(tmp_path / "baseline.sqlite3"))
+    baseline.observe(5, {"farm": 0.60}, window="2026-04-01/2026-05-01")
+    baseline.observe(5, {"farm": 0.70}, window="2026-04-08/2026-05-08")
+    before = baseline.get("farm", 5)
+
+    rerun = baseline.observe(5, {"farm": 0.70, "new": 0.5}, window="2026-04-08/2026-05-08")
+    assert baseline.get("farm", 5) == before and before["count"] == 2
+    assert rerun["farm"]["baselineCount"] == 2 and baseline.get("new", 5)["count"] == 1
+
+    baseline.observe(5, {"farm": 0.65}, window="2026-04-15/2026-05-15")
+    assert baseline.get("farm", 5)["count"] == 3 and baseline.get("farm", 5)["mean"] == pytest.approx(0.65)
+
+def test_baselines_from_before_windows_were_recorded_still_open(tmp_path):
+    path = str(tmp_path / "baseline.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE parcel_baseline (parcel_id TEXT NOT NULL, month INTEGER NOT NULL, "
+                     "count INTEGER NOT NULL, mean REAL NOT NULL, m2 REAL NOT NULL, "
+                     "PRIMARY KEY (parcel_id, month)) WITHOUT ROWID")
+        conn.execute("INSERT INTO parcel_baseline VALUES ('farm', 5, 1, 0.6, 0.0)")
+    conn.close()
+
+    baseline = ParcelBaseline(path)
+    baseline.observe(5, {"farm": 0.7}, window="2026-04-01/2026-05-01")
+    baseline.observe(5, {"farm": 0.7}, window="2026-04-01/2026-05-01")
+    assert baseline.get("farm", 5)["count"] == 2
+
+def test_pixel_baseline_chunked_updates_and_reopen(tmp_path):
+    rng = np.random.default_rng(3)
+    rasters = rng.normal(0.5, 0.1, (5, 17, 9)).astype(np.float32)
+    rasters[rng.random(rasters.shape) < 0.2] = np.nan
+    path = pixel_baseline_path((120.9, 14.5, 121.0, 14.6), 10, str(tmp_path))
+
+    chunked = PixelBaseline(path, (17, 9))
+    whole = PixelBaseline(str(tmp_path / "whole.npy"), (17, 9))
+    for raster in rasters:
+        chunked.observe(6, raster, chunk_rows=4)
+        whole.observe(6, raster, chunk_rows=17)
+    assert np.allclose(chunked.data, whole.data, equal_nan=True)
+
+    reopened = PixelBaseline(path)
+    with np.errstate(all="ignore"):
+        expected_mean = np.nanmean(rasters, axis=0)
+    assert np.allclose(reopened.mean(6), expected_mean, atol=1e-5, equal_nan=True)
+    assert np.isnan(reopened.mean(7)).all()
+    with pytest.raises(ValueError):
+        PixelBaseline(path, (16, 9))
+
+    # A field cleared in the north half: 4σ drop there, unchanged in the south
+    current = np.nan_to_num(reopened.mean(6), nan=0.5)
+    current[:8] -= 4 * reopened.std(6)[:8]
+    z = reopened.score(6, current)
+    scored = ~np.isnan(z)
+    assert (z[:8][scored[:8]] < -3.9).all() and (np.abs(z[8:][scored[8:]]) < 1e-3).all()
+    assert anomaly_share(z) == pytest.approx(scored[:8].sum() / scored.sum() * 100, abs=0.01)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
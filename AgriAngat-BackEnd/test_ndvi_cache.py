@@ -0,0 +1,59 @@
+# Unit tests for ndvi_cache.NDVICache — run with: python -m pytest -q
+
+import os
+import time
+
+import numpy as np
+import pytest
+from ndvi_cache import NDVICache, raster_key
+
+def test_key_ignores_sub_meter_bbox_jitter():
+    key = raster_key("SENTINEL2_L2A", (121.0, 14.5, 121.02, 14.52), 10, "2026-09-19", "2026-10-19")
+    assert key == raster_key("sentinel2_l2a", (121.000001, 14.5, 121.02, 14.52), 10, "2026-09-19", "2026-10-19")
+    assert key != raster_key("SENTINEL2_L2A", (121.0, 14.5, 121.02, 14.52), 20, "2026-09-19", "2026-10-19")
+    assert key != raster_key("SENTINEL2_L2A", (121.0, 14.5, 121.02, 14.52), 10, "2026-09-20", "2026-10-20")
+
+def test_hit_is_memory_mapped_and_fetch_runs_once(tmp_path):
+    cache = NDVICache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    raster = np.random.default_rng(1).uniform(-1, 1, (30, 40)).astype(np.float32)
+    raster[0, 0] = np.nan
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return raster
+
+    first = cache.get_or_fetch("k", fetch)
+    second = cache.get_or_fetch("k", fetch)
+    assert len(calls) == 1
+    assert isinstance(second, np.memmap) and not second.flags.writeable
+    assert np.array_equal(first, raster, equal_nan=True) and np.array_equal(second, raster, equal_nan=True)
+
+def test_evicts_least_recently_used(tmp_path):
+    raster = np.zeros((100, 100), dtype=np.float32)  # ~40 KB per file
+    cache = NDVICache(str(tmp_path), max_bytes=int(raster.nbytes * 2.5))
+    for i, key in enumerate(("a", "b")):
+        cache.put(key, raster)
+        os.utime(cache.path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.get("a") is not None  # "a" becomes most recently used
+    cache.put("c", raster)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size_bytes() <= cache.max_bytes
+
+def test_raster_larger_than_the_budget_is_returned_and_kept(tmp_path):
+    cache = NDVICache(str(tmp_path), max_bytes=1000)
+    small = np.zeros((10, 10), dtype=np.float32)
+    cache.put("small", small)
+    big = np.ones((100, 100), dtype=np.float32)
+
+    stored = cache.get_or_fetch("big", lambda: big)
+    assert np.array_equal(stored, big)
+    assert cache.get("small") is None and cache.get("big") is not None
+    # The next put evicts it like any other least recently used raster
+    os.utime(cache.path("big"), (time.time() - 100, time.time() - 100))
+    cache.put("next", small)
+    assert cache.get("big") is None and cache.get("next") is not None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,33 @@
+# Unit tests for ndvi_colors.colorize_ndvi — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from ndvi_colors import NDVI_THRESHOLDS, colorize_ndvi
+
+def evalscript_color(ndvi):
+    """The if/else chain of the old Sentinel Hub color evalscript"""
+    if np.isnan(ndvi):
+        return [0, 0, 0, 0]
+    ramp = [(-0.2, (0.0, 0.0, 0.4)), (-0.1, (0.0, 0.4, 0.8)), (0.0, (0.7, 0.8, 1.0)), (0.1, (0.8, 0.7, 0.5)),
+            (0.2, (0.9, 0.8, 0.6)), (0.3, (0.9, 0.9, 0.3)), (0.4, (0.6, 0.9, 0.2)), (0.5, (0.3, 0.8, 0.2)),
+            (0.6, (0.1, 0.7, 0.1)), (0.8, (0.0, 0.6, 0.0))]
+    for threshold, rgb in ramp:
+        if ndvi < threshold:
+            return [round(c * 255) for c in rgb] + [255]
+    return [0, 102, 0, 255]
+
+def test_matches_evalscript_including_boundaries():
+    rng = np.random.default_rng(3)
+    values = np.concatenate([rng.uniform(-1, 1, 5000), NDVI_THRESHOLDS, np.nextafter(NDVI_THRESHOLDS, -2), [np.nan]])
+    image = colorize_ndvi(values.reshape(-1, 1))
+    assert image.shape == (len(values), 1, 4) and image.dtype == np.uint8
+    expected = np.array([evalscript_color(v) for v in values], dtype=np.uint8)
+    assert np.array_equal(image[:, 0], expected)
+
+def test_nan_is_transparent():
+    image = colorize_ndvi(np.array([[np.nan, 0.9]], dtype=np.float32))
+    assert list(image[0, 0]) == [0, 0, 0, 0]
+    assert image[0, 1, 3] == 255
+
+if __name__ == "__main__":
+    pytest.main([__file__])
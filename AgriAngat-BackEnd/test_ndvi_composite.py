@@ -0,0 +1,60 @@
+# Unit tests for ndvi_composite — run with: python -m pytest -q
+
+import os
+
+import numpy as np
+import pytest
+from ndvi_composite import (SCL_CLOUD_HIGH, SCL_CLOUD_SHADOW, build_composite, clear_mask, composite_stack,
+                            masked_ndvi)
+
+SCL_VEGETATION = 4
+
+def scene(ndvi, scl, shape=(6, 5)):
+    """UINT16 B04/B08/SCL bands with a given NDVI everywhere"""
+    red = np.full(shape, 1000, dtype=np.uint16)
+    nir = np.round(1000 * (1 + ndvi) / (1 - ndvi)).astype(np.uint16)
+    return np.stack([red, np.broadcast_to(nir, shape), np.broadcast_to(np.uint16(scl), shape)], axis=-1)
+
+def test_clouds_shadows_and_no_data_are_masked():
+    assert list(clear_mask(np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]))) == \
+        [False, False, True, False, True, True, True, True, False, False, False, False]
+    bands = scene(0.6, SCL_VEGETATION)
+    bands[0, 0, 2] = SCL_CLOUD_HIGH
+    bands[1, 1, :2] = 0
+    ndvi = masked_ndvi(bands)
+    assert np.isnan(ndvi[0, 0]) and np.isnan(ndvi[1, 1])
+    assert ndvi[2, 2] == pytest.approx(0.6, abs=1e-3)
+
+def test_composite_recovers_ground_under_clouds(tmp_path):
+    # Field at NDVI 0.7; a bright cloud reads ~0.05 and is labelled; an unlabelled haze date reads 0.55
+    scenes = {
+        "2026-07-01": scene(0.05, SCL_CLOUD_HIGH),
+        "2026-07-06": scene(0.7, SCL_VEGETATION),
+        "2026-07-11": scene(0.55, SCL_VEGETATION),
+        "2026-07-16": scene(0.1, SCL_CLOUD_SHADOW),
+        "2026-07-21": scene(0.68, SCL_VEGETATION),
+    }
+    scenes["2026-07-06"][0, :, 2] = SCL_CLOUD_HIGH  # row 0 is only seen on the other two clear dates
+    maximum, clear = build_composite(sorted(scenes), scenes.__getitem__, "max", work_dir=str(tmp_path))
+    median, _ = build_composite(sorted(scenes), scenes.__getitem__, "median")
+
+    assert np.allclose(maximum[1:], 0.7, atol=1e-3) and np.allclose(maximum[0], 0.68, atol=1e-3)
+    assert np.allclose(median[1:], 0.68, atol=1e-3)
+    assert (clear[1:] == 3).all() and (clear[0] == 2).all()
+    assert not os.listdir(str(tmp_path))  # temporary stack removed
+
+def test_all_cloudy_pixel_stays_nan_and_chunks_agree():
+    rng = np.random.default_rng(9)
+    stack = rng.uniform(-0.1, 0.9, (7, 23, 11)).astype(np.float32)
+    stack[rng.random(stack.shape) < 0.4] = np.nan
+    stack[:, 3, 4] = np.nan
+    for method in ("max", "median"):
+        whole, count = composite_stack(stack, method, chunk_rows=23)
+        chunked, _ = composite_stack(stack, method, chunk_rows=5)
+        assert np.array_equal(whole, chunked, equal_nan=True)
+        assert np.isnan(whole[3, 4]) and count[3, 4] == 0
+    with pytest.raises(ValueError):
+        composite_stack(stack, "mean")
+
+if __name__ == "__main__":
+    pytest.main([__file__])
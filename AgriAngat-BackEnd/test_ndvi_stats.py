@@ -0,0 +1,35 @@
+# Unit tests for ndvi_stats.summarize_ndvi — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from ndvi_stats import COVERAGE_THRESHOLDS, summarize_ndvi
+
+def test_matches_numpy_reference():
+    rng = np.random.default_rng(5)
+    ndvi = rng.uniform(-0.5, 1.0, (120, 90)).astype(np.float32)
+    ndvi[rng.random(ndvi.shape) < 0.15] = np.nan
+    ndvi[0, :4] = np.array(COVERAGE_THRESHOLDS + (0.6,), dtype=np.float32)  # exact boundaries
+
+    stats = summarize_ndvi(ndvi)
+    valid = ndvi[~np.isnan(ndvi)]
+    assert stats.valid_pixels == valid.size and stats.invalid_pixels == ndvi.size - valid.size
+    assert stats.mean == pytest.approx(float(np.mean(valid, dtype=np.float64)), abs=1e-9)
+    assert stats.std == pytest.approx(float(np.std(valid, dtype=np.float64)), abs=1e-6)
+    for p in (10, 25, 50, 75, 90):
+        assert stats.percentile(p) == pytest.approx(float(np.percentile(valid.astype(np.float64), p)), abs=1e-9)
+    assert stats.minimum == float(valid.min()) and stats.maximum == float(valid.max())
+    assert stats.coverage_counts == {
+        "water_bare": int(np.sum(valid < 0.1)),
+        "sparse": int(np.sum((valid >= 0.1) & (valid < 0.3))),
+        "moderate": int(np.sum((valid >= 0.3) & (valid < 0.5))),
+        "dense": int(np.sum(valid >= 0.5)),
+    }
+    assert stats.excellent_pixels == int(np.sum(valid > 0.6))
+
+def test_all_nan_has_no_data():
+    stats = summarize_ndvi(np.full((4, 4), np.nan, dtype=np.float32))
+    assert not stats.has_data and stats.mean is None and stats.health_status is None
+    assert stats.to_dict()["data_coverage_pct"] == 0.0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,71 @@
+# Unit tests for ndvi_tiles — run with: python -m pytest -q
+
+import os
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from ndvi_colors import NDVI_PALETTE, NO_DATA_CLASS, classify_ndvi
+from ndvi_tiles import TILE_SIZE, build_tile_pyramid, encode_palette_png, lonlat_to_tile, native_zoom
+
+def decode_palette_png(data):
+    """Minimal reader for the unfiltered 8-bit palette PNGs the exporter writes"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks, offset = {}, 8
+    while offset < len(data):
+        length, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack(">I", data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, color_type) == (8, 3)
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width + 1)
+    assert (rows[:, 0] == 0).all()
+    palette = np.frombuffer(chunks[b"PLTE"], dtype=np.uint8).reshape(-1, 3)
+    alpha = np.frombuffer(chunks[b"tRNS"], dtype=np.uint8)
+    return rows[:, 1:], np.column_stack([palette, alpha])
+
+def tile_path(root, zoom, lon, lat):
+    x, y = lonlat_to_tile(lon, lat, zoom)
+    return os.path.join(root, str(zoom), str(int(x)), f"{int(y)}.png")
+
+def test_png_round_trip():
+    indices = np.random.default_rng(2).integers(0, len(NDVI_PALETTE), (7, 13)).astype(np.uint8)
+    decoded, palette = decode_palette_png(encode_palette_png(indices))
+    assert np.array_equal(decoded, indices) and np.array_equal(palette, NDVI_PALETTE)
+
+def test_native_zoom_matches_sentinel_resolution():
+    # ~10 m pixels at the equator: zoom 14 tiles are 9.55 m/px
+    assert native_zoom((121.0, -0.01, 121.02, 0.01), (222, 222)) == 14
+
+def test_pyramid_tiles_sample_the_raster(tmp_path):
+    bbox = (120.97, 14.58, 121.01, 14.62)
+    ndvi = np.random.default_rng(4).uniform(-0.3, 0.95, (400, 400)).astype(np.float32)
+    ndvi[:50] = np.nan
+    meta = build_tile_pyramid(ndvi, bbox, str(tmp_path), min_zoom=10, max_zoom=15)
+    assert meta["tiles"] > 0 and (meta["minZoom"], meta["maxZoom"]) == (10, 15)
+
+    classes = classify_ndvi(ndvi)
+    rng = np.random.default_rng(5)
+    for lon, lat in zip(rng.uniform(bbox[0], bbox[2], 40), rng.uniform(bbox[1], bbox[3], 40)):
+        path = tile_path(str(tmp_path), 15, lon, lat)
+        if not os.path.exists(path):  # only tiles without any data are skipped: the NaN rows up north
+            assert lat > bbox[3] - (bbox[3] - bbox[1]) * 50 / 400
+            continue
+        tile, _ = decode_palette_png(open(path, "rb").read())
+        x, y = lonlat_to_tile(lon, lat, 15)
+        px, py = int((x % 1) * TILE_SIZE), int((y % 1) * TILE_SIZE)
+        # Point and tile pixel center may straddle a raster cell edge: accept either neighbour
+        row = (bbox[3] - lat) / (bbox[3] - bbox[1]) * 400
+        col = (lon - bbox[0]) / (bbox[2] - bbox[0]) * 400
+        nearby = classes[max(int(row) - 1, 0):int(row) + 2, max(int(col) - 1, 0):int(col) + 2]
+        assert tile[py, px] in nearby
+
+    # The zoom 10 overview tile is mostly outside the raster, and transparent there
+    overview, _ = decode_palette_png(open(tile_path(str(tmp_path), 10, bbox[0], bbox[1]), "rb").read())
+    assert (overview == NO_DATA_CLASS).mean() > 0.9
+
+if __name__ == "__main__":
+    pytest.main([__file__])
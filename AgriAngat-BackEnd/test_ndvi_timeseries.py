@@ -0,0 +1,67 @@
+# Unit tests for ndvi_timeseries — run with: python -m pytest -q
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+from ndvi_timeseries import analyze_ndvi_series, collect_ndvi_series, season_intervals
+
+SEASON_START = datetime(2026, 6, 1)
+
+def fixture_fetch(start, end):
+    """Stand-in for Sentinel Hub: left half greening 0.003/day, right half flat, one cloudy row"""
+    day = ((start + (end - start) / 2) - SEASON_START).days
+    ndvi = np.full((12, 10), 0.4, dtype=np.float32)
+    ndvi[:, :5] += 0.003 * day
+    if day % 20 < 10:
+        ndvi[0] = np.nan
+    return ndvi
+
+def test_collect_stacks_intervals_in_order(tmp_path):
+    intervals = season_intervals(SEASON_START, datetime(2026, 9, 1), 10)
+    assert len(intervals) == 10 and intervals[-1][1] == datetime(2026, 9, 1)
+    dates, stack = collect_ndvi_series(intervals, fixture_fetch, max_workers=3, path=str(tmp_path / "stack.npy"))
+    assert stack.shape == (10, 12, 10) and isinstance(stack, np.memmap)
+    assert dates[0] == datetime(2026, 6, 6)
+    assert np.allclose(stack[:, 5, 0], 0.4 + 0.003 * np.array([(d - SEASON_START).days for d in dates]))
+
+def test_trend_peak_and_anomaly_match_fixture():
+    dates, stack = collect_ndvi_series(season_intervals(SEASON_START, datetime(2026, 9, 1), 10), fixture_fetch)
+    stack[4, 7, 8] = 0.05  # sudden stress on a flat pixel
+    trend = analyze_ndvi_series(stack, dates)
+
+    assert np.allclose(trend.slope[1:, :5], 0.003, atol=1e-6)
+    assert np.allclose(trend.slope[1:, 5:][np.arange(11) != 6], 0.0, atol=1e-6)
+    assert (trend.peak_index[1:, :5] == 9).all()
+    assert trend.observations[0, 0] < len(dates) == trend.observations[5, 5]
+    assert trend.anomaly_z[4, 7, 8] < -2 and trend.low_anomalies[4] == 1
+
+    summary = trend.summary()
+    assert summary["greeningPct"] == 50.0 and summary["degradingPct"] == 0.0
+    assert summary["perDate"][4]["lowAnomalyPct"] > 0
+
+def test_chunked_equals_single_block():
+    rng = np.random.default_rng(7)
+    stack = rng.uniform(0, 0.9, (8, 33, 17)).astype(np.float32)
+    stack[rng.random(stack.shape) < 0.3] = np.nan
+    dates = [datetime(2026, 1, 1 + 3 * i) for i in range(8)]
+    whole = analyze_ndvi_series(stack, dates, chunk_rows=33)
+    chunked = analyze_ndvi_series(stack, dates, chunk_rows=4)
+    for name in ("slope", "peak_value", "peak_index", "observations", "anomaly_z"):
+        assert np.array_equal(getattr(whole, name), getattr(chunked, name), equal_nan=True)
+
+def test_anomaly_raster_is_optional(tmp_path):
+    dates, stack = collect_ndvi_series(season_intervals(SEASON_START, datetime(2026, 9, 1), 10), fixture_fetch,
+                                       path=str(tmp_path / "stack.npy"))
+    stack[4, 7, 8] = 0.05
+    kept = analyze_ndvi_series(stack, dates, chunk_rows=5)
+    counts_only = analyze_ndvi_series(stack, dates, chunk_rows=5, keep_anomalies=False)
+    on_disk = analyze_ndvi_series(stack, dates, chunk_rows=5, anomaly_path=str(tmp_path / "z.npy"),
+                                  keep_anomalies=False)
+
+    assert counts_only.anomaly_z is None and counts_only.summary() == kept.summary()
+    assert isinstance(on_disk.anomaly_z, np.memmap)
+    assert np.array_equal(on_disk.anomaly_z, kept.anomaly_z, equal_nan=True)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
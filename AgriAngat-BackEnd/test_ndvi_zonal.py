@@ -0,0 +1,76 @@
+# Unit tests for ndvi_zonal — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from ndvi_zonal import group_parcels, parse_parcels, rasterize_parcels, zonal_ndvi_stats
+
+BBOX = (121.0, 14.5, 121.01, 14.51)
+SHAPE = (40, 50)
+
+def point_in_rings(lon, lat, rings):
+    """Plain even-odd ray casting, one point at a time"""
+    inside = False
+    for ring in rings:
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+            if (y0 <= lat) != (y1 <= lat) and lon < x0 + (lat - y0) * (x1 - x0) / (y1 - y0):
+                inside = not inside
+    return inside
+
+PARCELS = {
+    "type": "FeatureCollection",
+    "features": [
+        {"type": "Feature", "properties": {"id": "triangle"}, "geometry": {"type": "Polygon", "coordinates": [
+            [[121.001, 14.501], [121.004, 14.5015], [121.0025, 14.5055], [121.001, 14.501]]]}},
+        {"type": "Feature", "properties": {"name": "field with hole"}, "geometry": {"type": "Polygon", "coordinates": [
+            [[121.005, 14.502], [121.009, 14.502], [121.009, 14.508], [121.005, 14.508], [121.005, 14.502]],
+            [[121.006, 14.504], [121.008, 14.504], [121.008, 14.506], [121.006, 14.506], [121.006, 14.504]]]}},
+        {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [
+            [[121.0001, 14.5091], [121.00012, 14.5091], [121.00012, 14.50912], [121.0001, 14.5091]]]}},
+    ]
+}
+
+def test_rasterize_matches_ray_casting_at_pixel_centers():
+    parcels = parse_parcels(PARCELS)
+    assert [p.id for p in parcels] == ["triangle", "field with hole", "parcel_3"]
+    labels = rasterize_parcels(parcels, BBOX, SHAPE)
+
+    dx, dy = (BBOX[2] - BBOX[0]) / SHAPE[1], (BBOX[3] - BBOX[1]) / SHAPE[0]
+    expected = np.zeros(SHAPE, dtype=np.int32)
+    for r in range(SHAPE[0]):
+        for c in range(SHAPE[1]):
+            lon, lat = BBOX[0] + (c + 0.5) * dx, BBOX[3] - (r + 0.5) * dy
+            for label, feature in enumerate(PARCELS["features"][:2], start=1):
+                if point_in_rings(lon, lat, feature["geometry"]["coordinates"]):
+                    expected[r, c] = label
+    assert np.array_equal(labels == 1, expected == 1) and np.array_equal(labels == 2, expected == 2)
+    assert (labels == 3).sum() == 1  # smaller than a pixel: gets the pixel under its center
+
+def test_zonal_stats_match_per_parcel_reference():
+    rng = np.random.default_rng(11)
+    ndvi = rng.uniform(-0.2, 0.9, SHAPE).astype(np.float32)
+    ndvi[rng.random(SHAPE) < 0.2] = np.nan
+    labels = rasterize_parcels(parse_parcels(PARCELS), BBOX, SHAPE)
+    rows = zonal_ndvi_stats(ndvi, labels, ["a", "b", "c"])
+
+    for label, row in enumerate(rows, start=1):
+        values = ndvi[labels == label]
+        valid = values[~np.isnan(values)].astype(np.float64)
+        assert row["pixels"] == values.size and row["validPixels"] == valid.size
+        if valid.size:
+            assert row["mean"] == pytest.approx(valid.mean(), abs=1e-4)
+            assert row["median"] == pytest.approx(np.median(valid), abs=1e-4)
+            assert row["min"] == pytest.approx(valid.min(), abs=1e-4) and row["max"] == pytest.approx(valid.max(), abs=1e-4)
+            assert row["densePct"] == pytest.approx((valid >= 0.5).mean() * 100, abs=0.01)
+        else:
+            assert row["mean"] is None
+
+def test_nearby_parcels_share_one_raster():
+    parcels = parse_parcels(PARCELS)
+    far = parse_parcels({"type": "Polygon", "coordinates": [[[123.0, 10.0], [123.001, 10.0], [123.001, 10.001], [123.0, 10.0]]]})
+    groups = group_parcels(parcels + far)
+    assert sorted(len(members) for _, members in groups) == [1, 3]
+    bbox, members = next(g for g in groups if len(g[1]) == 3)
+    assert bbox[0] == pytest.approx(121.0001) and bbox[3] == pytest.approx(14.5091 + 0.00002)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
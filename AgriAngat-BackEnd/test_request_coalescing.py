@@ -0,0 +1,118 @@
+# Unit tests for request_coalescing — run with: python -m pytest -q
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from request_coalescing import AsyncCoalescingCache, CoalescingCache
+
+class Upstream:
+    """Counts calls; each call blocks until released so callers pile up behind it"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.release = threading.Event()
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return {"call": self.calls}
+
+def burst(cache, key, compute, n=8):
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        futures = [pool.submit(cache.get, key, compute) for _ in range(n)]
+        time.sleep(0.1)  # let every caller reach the cache before the upstream answers
+        compute.release.set()
+        return [f.exception() or f.result() for f in futures]
+
+def test_concurrent_callers_share_one_call():
+    cache = CoalescingCache(60)
+    upstream = Upstream()
+    results = burst(cache, "manila", upstream)
+    assert upstream.calls == 1 and results == [{"call": 1}] * 8
+    assert cache.get("manila", pytest.fail) == {"call": 1}  # fresh: served without calling
+    assert 59 < cache.remaining("manila") <= 60 and cache.remaining("cebu") == 0
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    cache = CoalescingCache(60)
+    upstream = Upstream(error=RuntimeError("OpenWeatherMap down"))
+    results = burst(cache, "manila", upstream)
+    assert upstream.calls == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "OpenWeatherMap down" for r in results)
+    assert cache.peek("manila") is None
+    assert cache.get("manila", lambda: "recovered") == "recovered"
+
+def test_expiry_and_per_value_ttl():
+    cache = CoalescingCache(0.05)
+    assert cache.get("k", lambda: 1) == 1
+    time.sleep(0.06)
+    assert cache.get("k", lambda: 2) == 2 and cache.peek("k") == 2
+
+    per_value = CoalescingCache(60, ttl_of=lambda value: value["ttl"])
+    per_value.get("short", lambda: {"ttl": 0.05})
+    per_value.get("long", lambda: {"ttl": 30})
+    assert per_value.remaining("short") <= 0.05 and 29 < per_value.remaining("long") <= 30
+    time.sleep(0.06)
+    assert per_value.get("short", lambda: {"ttl": 1})["ttl"] == 1
+
+def test_least_recently_used_keys_are_dropped_past_max_entries():
+    cache = CoalescingCache(0.01, max_entries=3)
+    for key in "abc":
+        cache.get(key, lambda: key)
+    time.sleep(0.02)
+    assert cache.peek("a") == "a"  # expired entries stay as last-known data while there is room
+    cache.get("a", lambda: "a2")   # refreshed: now the most recently used
+    cache.get("d", lambda: "d")
+    assert [cache.peek(key) for key in "abcd"] == ["a2", None, "c", "d"]
+
+    async def scenario():
+        async_cache = AsyncCoalescingCache(60, max_entries=2)
+
+        async def fetch():
+            return "v"
+
+        for key in "xyz":
+            await async_cache.get(key, fetch)
+        return [async_cache.peek(key) for key in "xyz"]
+
+    assert asyncio.run(scenario()) == [None, "v", "v"]
+
+def test_async_single_flight_errors_and_cancelled_waiters():
+    async def scenario():
+        cache = AsyncCoalescingCache(60)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        assert await asyncio.gather(*(cache.get("k", fetch) for _ in range(5))) == [1] * 5
+        assert cache.remaining("k") > 59
+
+        # A waiter that gives up does not cancel the fetch the others share
+        first = asyncio.ensure_future(cache.get("j", fetch))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get("j", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 2 and len(calls) == 2
+
+        async def failing():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("down")
+
+        results = await asyncio.gather(*(cache.get("e", failing) for _ in range(3)), return_exceptions=True)
+        assert len(calls) == 3 and all(isinstance(r, RuntimeError) for r in results)
+        assert cache.peek("e") is None
+
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    pytest.main([__file__])
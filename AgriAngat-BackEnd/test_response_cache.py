@@ -0,0 +1,49 @@
+# Unit tests for response_cache — run with: python -m pytest -q
+
+import gzip
+import json
+import time
+
+import pytest
+from response_cache import CachedResponse, ResponseCache
+
+def test_gzip_body_and_etag():
+    body = json.dumps({"city": "Manila", "temperature": 31}).encode("utf-8")
+    entry = CachedResponse(body, 600)
+    assert gzip.decompress(entry.gzip_body) == body
+    assert entry.etag == CachedResponse(body, 60).etag != CachedResponse(body + b" ", 600).etag
+    assert 599 <= entry.remaining_age() <= 600
+
+def test_if_none_match_forms():
+    entry = CachedResponse(b"{}", 600)
+    assert entry.matches(entry.etag)
+    assert entry.matches("W/" + entry.etag)
+    assert entry.matches(f'"other", {entry.etag}')
+    assert entry.matches("*")
+    assert not entry.matches('"other"') and not entry.matches(None) and not entry.matches("")
+
+def test_body_is_built_once_per_lifetime():
+    built = []
+    cache = ResponseCache(600, json.dumps)
+
+    def build():
+        built.append(1)
+        return {"n": len(built)}
+
+    first = cache.get("manila", build)
+    assert cache.get("manila", build) is first and len(built) == 1
+    cache.invalidate("manila")
+    assert json.loads(cache.get("manila", build).body) == {"n": 2}
+
+def test_lifetime_follows_the_data_behind_the_body():
+    cache = ResponseCache(600, json.dumps)
+    # Data fetched almost a full interval ago: the body must not live another 600 s
+    entry = cache.get("manila", lambda: {"t": 1}, max_age=lambda: 0.05)
+    assert entry.max_age == 0.05 and entry.remaining_age() == 0
+    time.sleep(0.06)
+    assert cache.get("manila", lambda: {"t": 2}) is not entry
+    # Never longer than the cache's own TTL
+    assert cache.get("cebu", lambda: {}, max_age=lambda: 10_000).max_age == 600
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,88 @@
+# Unit tests for soil_batch.analyze_points — run with: python -m pytest -q
+
+import math
+
+import pytest
+import requests
+import soil_store
+from soil_batch import analyze_points
+from soil_profile import SOIL_STATS
+from soil_store import CELL_SIZE_DEG, SoilStore, snap_to_cell
+
+MANILA = (14.5995, 120.9842)
+BAGUIO = (16.4023, 120.5960)
+OCEAN = (13.0, 125.0)
+
+class FakeResponse:
+    def __init__(self, status_code, params=None):
+        self.status_code = status_code
+        self.params = params
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+    def json(self):
+        ph = 55 if self.params["lat"] > 16 else 65  # Baguio acidic, Manila near neutral
+        return {"properties": {"layers": [
+            {"name": name, "unit_measure": {},
+             "depths": [{"label": depth, "values": {stat: ph if name == "phh2o" else 100 for stat in SOIL_STATS}}
+                        for depth in self.params["depth"]]}
+            for name in self.params["property"]
+        ]}}
+
+class FakeGuard:
+    """Answers like SoilGrids; rejects OCEAN with 400 and answers 503 when down"""
+
+    def __init__(self):
+        self.calls = []
+        self.down = False
+
+    def get(self, url, params, timeout, max_wait=None):
+        self.calls.append((params["lat"], params["lon"], max_wait))
+        if self.down:
+            return FakeResponse(503)
+        if snap_to_cell(params["lat"], params["lon"]) == snap_to_cell(*OCEAN):
+            return FakeResponse(400)
+        return FakeResponse(200, params)
+
+@pytest.fixture
+def guard(monkeypatch):
+    guard = FakeGuard()
+    monkeypatch.setattr(soil_store, "get_guard", lambda name: guard)
+    return guard
+
+@pytest.fixture
+def store(tmp_path):
+    return SoilStore(str(tmp_path / "soil.sqlite3"))
+
+def test_points_in_one_cell_share_a_request_and_keep_input_order(store, guard):
+    near_manila = (MANILA[0] + CELL_SIZE_DEG / 10, MANILA[1])
+    assert snap_to_cell(*near_manila) == snap_to_cell(*MANILA)
+    points = {"baguio": BAGUIO, "manila": MANILA, "near manila": near_manila}
+
+    results = analyze_points(points, store=store, properties=["phh2o"])
+    assert [r["name"] for r in results] == ["baguio", "manila", "near manila"]
+    assert [r["location"]["latitude"] for r in results] == [BAGUIO[0], MANILA[0], near_manila[0]]
+    assert len(guard.calls) == 2 and all(max_wait == math.inf for *_, max_wait in guard.calls)
+    assert results[0]["soil_properties"]["phh2o"]["mean"] == pytest.approx(5.5)
+    assert results[1]["soil_properties"] == results[2]["soil_properties"]
+
+    # Everything is stored now: a second batch makes no upstream calls
+    assert analyze_points(list(points.values()), store=store, properties=["phh2o"])[0]["name"] == "point_1"
+    assert len(guard.calls) == 2
+
+def test_rejected_location_becomes_an_error_row(store, guard):
+    results = analyze_points({"sea": OCEAN, "manila": MANILA}, store=store, properties=["phh2o"])
+    assert "rejected" in results[0]["error"] and "soil_properties" not in results[0]
+    assert "error" not in results[1]
+
+def test_upstream_outage_aborts_the_batch(store, guard):
+    guard.down = True
+    with pytest.raises(requests.HTTPError):
+        analyze_points({"manila": MANILA}, store=store, properties=["phh2o"])
+    with pytest.raises(ValueError):
+        analyze_points({"manila": MANILA}, depth="0-10cm", store=store)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,36 @@
+# Unit tests for soil_dataset.build_soil_dataset — run with: python -m pytest -q
+
+import pytest
+import requests
+import soil_store
+from soil_dataset import SoilDataset, build_soil_dataset
+from soil_store import SoilStore
+from test_soil_batch import BAGUIO, MANILA, OCEAN, FakeGuard
+
+@pytest.fixture
+def guard(monkeypatch):
+    guard = FakeGuard()
+    monkeypatch.setattr(soil_store, "get_guard", lambda name: guard)
+    return guard
+
+@pytest.fixture
+def store(tmp_path):
+    return SoilStore(str(tmp_path / "soil.sqlite3"))
+
+def test_rejected_location_is_skipped_and_reported(store, guard, tmp_path):
+    output = str(tmp_path / "dataset")
+    result = build_soil_dataset({"manila": MANILA, "sea": OCEAN, "baguio": BAGUIO}, output, store)
+    assert result["written"] == 2 and list(result["failed"]) == ["sea"]
+    assert "rejected" in result["failed"]["sea"]
+
+    dataset = SoilDataset(output)
+    assert [location["key"] for location in dataset.locations] == ["manila", "baguio"]
+    assert "sea" not in dataset
+
+def test_upstream_outage_stops_the_build(store, guard, tmp_path):
+    guard.down = True
+    with pytest.raises(requests.HTTPError):
+        build_soil_dataset({"manila": MANILA}, str(tmp_path / "dataset"), store)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
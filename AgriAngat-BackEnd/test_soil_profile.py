@@ -0,0 +1,58 @@
+# Unit tests for soil_profile.SoilProfile — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from soil_profile import SOIL_DEPTHS, SoilProfile
+
+def make_response(values):
+    """Minimal SoilGrids response with the same mapped value at every depth"""
+    layers = []
+    for name, mean in values.items():
+        layers.append({
+            "name": name,
+            "depths": [
+                {"label": label, "range": {}, "values": {"mean": mean, "Q0.05": None, "Q0.5": mean,
+                                                          "Q0.95": None, "uncertainty": None}}
+                for label in SOIL_DEPTHS
+            ]
+        })
+    return {"properties": {"layers": layers}}
+
+def test_conversion_and_missing_values():
+    profile = SoilProfile.from_soilgrids(make_response({"phh2o": 62, "nitrogen": 150}))
+    topsoil = profile.topsoil_dict()
+    assert topsoil["phh2o"]["mean"] == pytest.approx(6.2)
+    assert topsoil["nitrogen"]["mean"] == pytest.approx(1.5)
+    assert topsoil["phh2o"]["q05"] is None
+    assert "clay" not in topsoil
+
+def test_interpretation_and_crops():
+    profile = SoilProfile.from_soilgrids(make_response({
+        "phh2o": 50, "soc": 250, "nitrogen": 50, "clay": 450, "sand": 200, "silt": 350
+    }))
+    interpretation = profile.interpret()
+    assert interpretation["pH"].startswith("Acidic")
+    assert interpretation["nitrogen"].startswith("Low")
+    assert interpretation["texture"].startswith("Clay soil")
+    assert "nutrient_retention" not in interpretation
+
+    crops = profile.suggest_crops()
+    assert crops[:3] == ["Blueberries", "Cranberries", "Azaleas"]
+    assert "Sugar cane" in crops and "Leafy greens" in crops
+    assert len(crops) == len(set(crops))
+
+def test_batch_matches_single_profiles():
+    responses = [
+        make_response({"phh2o": 65, "clay": 200, "sand": 700, "silt": 100}),
+        make_response({"phh2o": 80, "soc": 50}),
+    ]
+    singles = [SoilProfile.from_soilgrids(r) for r in responses]
+    batch = SoilProfile.stack(singles)
+
+    assert batch.batch_shape == (2,)
+    assert batch.interpret() == [p.interpret() for p in singles]
+    assert batch.suggest_crops() == [p.suggest_crops() for p in singles]
+    np.testing.assert_array_equal(batch.get("phh2o"), [6.5, 8.0])
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,83 @@
+# Unit tests for soil_store.SoilStore — run with: python -m pytest -q
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import soil_store
+from soil_store import SoilStore, snap_to_cell
+
+CELL = snap_to_cell(14.5995, 120.9842)
+
+def response(layers):
+    """SoilGrids-shaped response from {name: {depth: {statistic: value}}}"""
+    return {"properties": {"layers": [
+        {"name": name, "unit_measure": {"d_factor": 10},
+         "depths": [{"label": depth, "values": values} for depth, values in depths.items()]}
+        for name, depths in layers.items()
+    ]}}
+
+def stored_values(store, name, depth):
+    layer = next(l for l in store.get_cell(CELL)["properties"]["layers"] if l["name"] == name)
+    return next(d for d in layer["depths"] if d["label"] == depth)["values"]
+
+@pytest.fixture
+def store(tmp_path):
+    return SoilStore(str(tmp_path / "soil.sqlite3"))
+
+def test_partial_layer_sets_merge(store):
+    store.put_cell(CELL, response({"phh2o": {"0-5cm": {"mean": 62}}}))
+    store.put_cell(CELL, response({"phh2o": {"0-5cm": {"Q0.5": 61}, "5-15cm": {"mean": 64}},
+                                   "soc": {"0-5cm": {"mean": 210}}}))
+    store.put_cell(CELL, response({"phh2o": {"0-5cm": {"mean": 63}}}))  # newer value wins, others are kept
+
+    assert stored_values(store, "phh2o", "0-5cm") == {"mean": 63, "Q0.5": 61}
+    assert stored_values(store, "phh2o", "5-15cm") == {"mean": 64}
+    assert stored_values(store, "soc", "0-5cm") == {"mean": 210}
+    assert store.cell_count() == 1 and not store.is_complete(CELL)
+
+def test_missing_properties(store):
+    assert store.missing_properties(CELL, ["phh2o", "soc"], ["0-5cm"], ["mean"]) == ["phh2o", "soc"]
+    store.put_cell(CELL, response({"phh2o": {"0-5cm": {"mean": 62}}, "soc": {"5-15cm": {"mean": 190}}}))
+
+    assert store.missing_properties(CELL, ["phh2o", "soc"], ["0-5cm"], ["mean"]) == ["soc"]
+    assert store.missing_properties(CELL, ["phh2o"], ["0-5cm"], ["mean", "Q0.5"]) == ["phh2o"]
+    assert store.missing_properties(CELL, ["phh2o"], ["0-5cm", "5-15cm"], ["mean"]) == ["phh2o"]
+    assert store.missing_properties(CELL, ["soc"], ["5-15cm"], ["mean"]) == []
+
+def test_concurrent_writers_keep_every_statistic(store):
+    def put(i):
+        SoilStore(store.path).put_cell(CELL, response({"phh2o": {"0-5cm": {f"stat{i}": i}}}))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(put, range(40)))
+    assert stored_values(store, "phh2o", "0-5cm") == {f"stat{i}": i for i in range(40)}
+
+def test_fetch_queries_only_missing_layers(store, monkeypatch):
+    calls = []
+
+    class FakeResponse:
+        def __init__(self, params):
+            self.params = params
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return response({name: {"0-5cm": {"mean": 50}} for name in self.params["property"]})
+
+    class FakeGuard:
+        def get(self, url, params, timeout, **kwargs):
+            calls.append(params["property"])
+            return FakeResponse(params)
+
+    monkeypatch.setattr(soil_store, "get_guard", lambda name: FakeGuard())
+    store.put_cell(CELL, response({"phh2o": {"0-5cm": {"mean": 62}}}))
+
+    result = store.fetch(14.5995, 120.9842, ["phh2o", "soc"], ["0-5cm"], ["mean"])
+    assert calls == [["soc"]]
+    assert {l["name"] for l in result["properties"]["layers"]} == {"phh2o", "soc"}
+    store.fetch(14.5995, 120.9842, ["phh2o", "soc"], ["0-5cm"], ["mean"])
+    assert len(calls) == 1  # second call served from the store
+
+if __name__ == "__main__":
+    pytest.main([__file__])
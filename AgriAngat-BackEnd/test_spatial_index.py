@@ -0,0 +1,34 @@
+# Unit tests for spatial_index.GeoIndex — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from ph_cities import CITY_CENTERS
+from spatial_index import GeoIndex, haversine_km
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(42)
+    points = np.column_stack([rng.uniform(4.5, 21, 5000), rng.uniform(116, 127, 5000)])
+    index = GeoIndex(points, leaf_size=16)
+
+    for lat, lon in zip(rng.uniform(4.5, 21, 50), rng.uniform(116, 127, 50)):
+        distances = haversine_km(lat, lon, points[:, 0], points[:, 1])
+        expected = np.sort(distances)[:4]
+        found = index.query(lat, lon, k=4)
+        assert [d for _, d in found] == pytest.approx(expected, abs=1e-6)
+        assert distances[found[0][0]] == pytest.approx(found[0][1], abs=1e-6)
+
+def test_nearest_city():
+    index = GeoIndex(list(CITY_CENTERS.values()), labels=list(CITY_CENTERS))
+    i, distance = index.nearest(16.41, 120.60)
+    assert index.labels[i] == "baguio"
+    assert distance < 2
+
+def test_batch_and_k_larger_than_index():
+    index = GeoIndex([[14.5995, 120.9842], [10.3157, 123.8854]])
+    indices, distances = index.query_batch([14.6, 10.3], [121.0, 123.9], k=5)
+    assert indices.shape == (2, 2)
+    assert list(indices[:, 0]) == [0, 1]
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
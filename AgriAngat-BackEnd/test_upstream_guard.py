@@ -0,0 +1,94 @@
+# Unit tests for upstream_guard.UpstreamGuard — run with: python -m pytest -q
+
+import asyncio
+import math
+import time
+
+import pytest
+import requests
+from upstream_guard import (CLOSED, HALF_OPEN, OPEN, UPSTREAM_LIMITS, CircuitOpenError, RateLimitedError,
+                            UpstreamGuard)
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+def failing():
+    raise requests.ConnectionError("down")
+
+def make_guard(tmp_path, **kwargs):
+    settings = dict(rate_per_second=1000, burst=1000, failure_threshold=3, reset_timeout=0.2)
+    settings.update(kwargs)
+    return UpstreamGuard("test", path=str(tmp_path / "guard.sqlite3"), **settings)
+
+def test_circuit_opens_fails_fast_and_recovers(tmp_path):
+    guard = make_guard(tmp_path)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            guard.call(failing)
+    guard.call(FakeResponse, 503)
+    assert guard.state()["circuit"] == OPEN
+
+    # Open circuit: the upstream is not called at all
+    with pytest.raises(CircuitOpenError):
+        guard.call(pytest.fail, "upstream called while open")
+
+    time.sleep(0.25)
+    guard.before_call()
+    assert guard.state()["circuit"] == HALF_OPEN
+    # Only one trial at a time while half-open
+    with pytest.raises(CircuitOpenError):
+        guard.before_call()
+    guard.record_success()
+    assert guard.state()["circuit"] == CLOSED
+    assert guard.call(FakeResponse, 200).status_code == 200
+
+def test_failed_trial_reopens(tmp_path):
+    guard = make_guard(tmp_path, failure_threshold=1)
+    guard.call(FakeResponse, 429)
+    time.sleep(0.25)
+    with pytest.raises(requests.ConnectionError):
+        guard.call(failing)
+    assert guard.state()["circuit"] == OPEN
+
+def test_token_bucket_is_shared_between_instances(tmp_path):
+    first = make_guard(tmp_path, rate_per_second=0.5, burst=2, max_wait=0.1)
+    second = make_guard(tmp_path, rate_per_second=0.5, burst=2, max_wait=0.1)
+    first.acquire()
+    second.acquire()
+    with pytest.raises(RateLimitedError):
+        first.acquire()
+    assert isinstance(RateLimitedError("x"), requests.RequestException)
+
+def test_batch_callers_wait_for_a_token(tmp_path):
+    guard = make_guard(tmp_path, rate_per_second=10, burst=1, max_wait=0.01)
+    guard.call(FakeResponse, 200)
+    with pytest.raises(RateLimitedError):
+        guard.call(FakeResponse, 200)
+    start = time.monotonic()
+    assert guard.call(FakeResponse, 200, max_wait=math.inf).status_code == 200
+    assert time.monotonic() - start >= 0.05
+
+def test_async_calls_share_the_breaker_and_bucket(tmp_path):
+    guard = make_guard(tmp_path, rate_per_second=20, burst=1, max_wait=0.01)
+
+    async def respond(status_code):
+        return FakeResponse(status_code)
+
+    async def scenario():
+        assert (await guard.acall(respond, 200)).status_code == 200
+        with pytest.raises(RateLimitedError):
+            await guard.acall(respond, 200)
+        start = time.monotonic()
+        await guard.acall(respond, 503, max_wait=1)
+        assert time.monotonic() - start >= 0.03
+        assert guard.state()["consecutiveFailures"] == 1
+
+    asyncio.run(scenario())
+
+def test_soilgrids_stays_within_fair_use():
+    rate, burst = UPSTREAM_LIMITS["soilgrids"]
+    assert rate * 60 <= 5 and burst <= 1
+
+if __name__ == "__main__":
+    pytest.main([__file__])
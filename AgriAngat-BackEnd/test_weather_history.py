@@ -0,0 +1,56 @@
+# Unit tests for weather_history.WeatherHistory — run with: python -m pytest -q
+
+import numpy as np
+import pytest
+from weather_history import DAY, PH_UTC_OFFSET, WeatherHistory
+
+END = 1760000000  # 2025-10-09 16:53 PHT
+
+def observation(dt, temp, rain=0.0):
+    return {"dt": int(dt), "main": {"temp": temp, "humidity": 70}, "rain": {"1h": rain}}
+
+def test_daily_summary_matches_brute_force(tmp_path):
+    history = WeatherHistory(str(tmp_path / "history.sqlite3"))
+    rng = np.random.default_rng(7)
+    times = np.sort(rng.choice(np.arange(END - 5 * DAY, END), 500, replace=False))
+    temps = rng.uniform(22, 34, 500)
+    rain = np.where(rng.random(500) < 0.3, rng.uniform(0, 4, 500), 0.0)
+    for t, temp, mm in zip(times, temps, rain):
+        history.record_current("Manila", observation(t, temp, mm))
+
+    summary = history.daily_summary("manila", days=3, end=END)
+    days = (times + PH_UTC_OFFSET) // DAY
+    last_day = (END + PH_UTC_OFFSET) // DAY
+    for i, day in enumerate(range(last_day - 2, last_day + 1)):
+        in_day = days == day
+        # Largest 1h total per clock hour, summed over the day
+        hourly = {}
+        for t, mm in zip(times[in_day], rain[in_day]):
+            hourly[t // 3600] = max(hourly.get(t // 3600, 0.0), mm)
+        assert summary["samples"][i] == in_day.sum()
+        assert summary["rain_mm"][i] == pytest.approx(sum(hourly.values()))
+        assert summary["temp_max"][i] == pytest.approx(temps[in_day].max())
+        assert summary["temp_mean"][i] == pytest.approx(temps[in_day].mean())
+
+    rolling = history.rolling_rainfall("manila", days=3, window=2, end=END)
+    assert rolling["rain_2d_mm"][-1] == pytest.approx(summary["rain_mm"][-2:].sum())
+
+def test_repeated_observations_and_forecast(tmp_path):
+    history = WeatherHistory(str(tmp_path / "history.sqlite3"))
+    history.record_current("cebu city", observation(END - 60, 30, 2.0))
+    history.record_current("cebu city", observation(END - 60, 30, 2.0))
+    assert history.window_aggregates("cebu city", END - DAY, END)["samples"] == 1
+
+    forecast = {"list": [{"dt": END + i * 10800, "main": {"temp": 28}, "rain": {"3h": 1.5}} for i in range(40)]}
+    history.record_forecast("cebu city", forecast, issued_at=END)
+    assert history.forecast_rain("cebu city", hours=24, now=END) == pytest.approx(12.0)
+
+def test_empty_history(tmp_path):
+    history = WeatherHistory(str(tmp_path / "history.sqlite3"))
+    summary = history.daily_summary("nowhere", days=2, end=END)
+    assert list(summary["samples"]) == [0, 0]
+    assert np.isnan(summary["temp_max"]).all()
+    assert history.forecast_rain("nowhere") is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
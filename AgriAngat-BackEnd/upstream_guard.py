@@ -0,0 +1,266 @@
+"""
+Rate limiting and circuit breaking for upstream APIs.
+
+Each upstream (OpenWeatherMap, SoilGrids) gets a token bucket and a circuit
+breaker whose state lives in one SQLite file, so every thread and every
+process on the box (Flask server, CLI scripts, batch jobs) draws from the
+same budget. When an upstream keeps failing the circuit opens and callers
+fail immediately instead of waiting out the timeout; after a cool-down one
+trial request is let through to probe it.
+
+UpstreamUnavailable subclasses requests.RequestException, so existing
+"except requests.RequestException" handlers already treat a throttled or
+open upstream like any other failed request.
+
+acall() is call() for coroutine functions such as httpx.AsyncClient.get: the
+SQLite bookkeeping runs on a worker thread and the rate-limit wait is an
+asyncio.sleep, so the ASGI server shares the same budget without blocking
+its event loop.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import requests
+
+DEFAULT_GUARD_PATH = os.getenv(
+    "UPSTREAM_GUARD_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "upstream_guard.sqlite3")
+)
+
+# name -> (requests per second, burst); override with <NAME>_RATE_PER_SECOND / <NAME>_BURST
+UPSTREAM_LIMITS = {
+    "openweathermap": (1.0, 10),   # free tier: 60 calls/minute
+    "soilgrids": (5 / 60, 1),      # ISRIC fair use: about 5 calls/minute
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """The upstream was not called: circuit open or no rate-limit token in time"""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class RateLimitedError(UpstreamUnavailable):
+    pass
+
+
+def is_failure_status(status_code: int) -> bool:
+    """Responses that count against the upstream's health (throttling and server errors)"""
+    return status_code == 429 or status_code >= 500
+
+
+class UpstreamGuard:
+    """Cross-process token bucket plus circuit breaker for one upstream"""
+
+    def __init__(self, name: str, rate_per_second: float, burst: int,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_wait: float = 2.0, path: str = DEFAULT_GUARD_PATH):
+        self.name = name
+        self.rate = rate_per_second
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+        self.path = path
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upstream_state (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    refilled_at REAL NOT NULL,
+                    circuit TEXT NOT NULL,
+                    failures INTEGER NOT NULL,
+                    opened_at REAL,
+                    trial_at REAL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO upstream_state VALUES (?, ?, ?, ?, 0, NULL, NULL)",
+                (name, float(burst), time.time(), CLOSED)
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """One write-locked transaction; BEGIN IMMEDIATE serializes all processes"""
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _row(self, conn) -> tuple:
+        return conn.execute(
+            "SELECT tokens, refilled_at, circuit, failures, opened_at, trial_at FROM upstream_state WHERE name = ?",
+            (self.name,)
+        ).fetchone()
+
+    # Token bucket
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return seconds until the next one"""
+        with self._transaction() as conn:
+            tokens, refilled_at = self._row(conn)[:2]
+            now = time.time()
+            tokens = min(self.burst, tokens + (now - refilled_at) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if wait == 0.0:
+                tokens -= 1
+            conn.execute("UPDATE upstream_state SET tokens = ?, refilled_at = ? WHERE name = ?",
+                         (tokens, now, self.name))
+        return wait
+
+    def acquire(self, max_wait: Optional[float] = None) -> None:
+        """Block until a token is taken, or raise RateLimitedError after max_wait seconds
+
+        Interactive callers keep the short default; batch jobs pass
+        max_wait=math.inf to wait their turn however long it takes.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitedError(f"{self.name}: rate limit reached, no token within {max_wait:g}s")
+            time.sleep(wait)
+
+    # Circuit breaker
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless the circuit lets this call through"""
+        with self._transaction() as conn:
+            circuit, _, opened_at, trial_at = self._row(conn)[2:]
+            now = time.time()
+            if circuit == CLOSED:
+                return
+            # Open: fail fast until the cool-down passes, then let one trial through.
+            # A trial that never reported back is replaced after another cool-down.
+            probe_since = trial_at if circuit == HALF_OPEN else opened_at
+            if now - probe_since < self.reset_timeout:
+                raise CircuitOpenError(f"{self.name}: circuit open, upstream marked unhealthy")
+            conn.execute("UPDATE upstream_state SET circuit = ?, trial_at = ? WHERE name = ?",
+                         (HALF_OPEN, now, self.name))
+
+    def record_success(self) -> None:
+        with self._transaction() as conn:
+            conn.execute("UPDATE upstream_state SET circuit = ?, failures = 0, opened_at = NULL, trial_at = NULL "
+                         "WHERE name = ?", (CLOSED, self.name))
+
+    def record_failure(self) -> None:
+        with self._transaction() as conn:
+            circuit, failures = self._row(conn)[2:4]
+            failures += 1
+            if circuit == HALF_OPEN or failures >= self.failure_threshold:
+                conn.execute("UPDATE upstream_state SET circuit = ?, failures = ?, opened_at = ?, trial_at = NULL "
+                             "WHERE name = ?", (OPEN, failures, time.time(), self.name))
+            else:
+                conn.execute("UPDATE upstream_state SET failures = ? WHERE name = ?", (failures, self.name))
+
+    def call(self, func: Callable[..., Any], *args, max_wait: Optional[float] = None, **kwargs) -> Any:
+        """Run one upstream request under the breaker and the rate limit
+
+        Exceptions and responses with is_failure_status count as failures;
+        responses are returned either way for the caller to inspect.
+        """
+        self.before_call()
+        self.acquire(max_wait)
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        if is_failure_status(getattr(result, "status_code", 200)):
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+    def get(self, url: str, max_wait: Optional[float] = None, **kwargs) -> requests.Response:
+        """requests.get through the guard"""
+        return self.call(requests.get, url, max_wait=max_wait, **kwargs)
+
+    async def aacquire(self, max_wait: Optional[float] = None) -> None:
+        """acquire() that waits for a token without blocking the event loop"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire)
+            if wait == 0.0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitedError(f"{self.name}: rate limit reached, no token within {max_wait:g}s")
+            await asyncio.sleep(wait)
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], *args,
+                    max_wait: Optional[float] = None, **kwargs) -> Any:
+        """call() for a coroutine function, e.g. acall(http_client.get, url)"""
+        await asyncio.to_thread(self.before_call)
+        await self.aacquire(max_wait)
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            await asyncio.to_thread(self.record_failure)
+            raise
+        if is_failure_status(getattr(result, "status_code", 200)):
+            await asyncio.to_thread(self.record_failure)
+        else:
+            await asyncio.to_thread(self.record_success)
+        return result
+
+    def state(self) -> Dict:
+        """Snapshot for health checks"""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            tokens, refilled_at, circuit, failures, opened_at, _ = self._row(conn)
+        now = time.time()
+        snapshot = {
+            "circuit": circuit,
+            "consecutiveFailures": failures,
+            "tokensAvailable": round(min(self.burst, tokens + (now - refilled_at) * self.rate), 2),
+            "ratePerSecond": self.rate,
+            "burst": self.burst
+        }
+        if circuit != CLOSED and opened_at is not None:
+            snapshot["retryInSeconds"] = round(max(0.0, self.reset_timeout - (now - opened_at)), 1)
+        return snapshot
+
+
+_guards: Dict[str, UpstreamGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(name: str) -> UpstreamGuard:
+    """Shared guard for a named upstream, configured from UPSTREAM_LIMITS and the environment"""
+    with _guards_lock:
+        if name not in _guards:
+            rate, burst = UPSTREAM_LIMITS.get(name, (1.0, 5))
+            prefix = name.upper()
+            _guards[name] = UpstreamGuard(
+                name,
+                rate_per_second=float(os.getenv(f"{prefix}_RATE_PER_SECOND", rate)),
+                burst=int(os.getenv(f"{prefix}_BURST", burst)),
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+                max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", "2"))
+            )
+        return _guards[name]
+
+
+def upstream_health() -> Dict[str, Dict]:
+    """State of every upstream guard, for /health"""
+    return {name: get_guard(name).state() for name in UPSTREAM_LIMITS}
@@ -0,0 +1,290 @@
+"""
+Local time series of OpenWeatherMap observations and forecasts.
+
+Every current-weather and forecast response the servers fetch is appended
+to SQLite, clustered on (location, time) so a window for one place is a
+single index range scan. Queries load the window as NumPy columns and
+aggregate them vectorized: per-day rainfall and temperature extremes with
+bincount / reduceat, rolling totals with a cumulative sum.
+
+Rain in a current-weather response is the last hour's total and the same
+hour is often seen several times, so observed rainfall is taken as the
+largest 1h value per clock hour, then summed. Forecast slots are
+non-overlapping 3h totals and are summed directly.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+DEFAULT_HISTORY_PATH = os.getenv(
+    "WEATHER_HISTORY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "weather_history.sqlite3")
+)
+
+# Days are Philippine calendar days
+PH_UTC_OFFSET = 8 * 3600
+DAY = 86400
+HOUR = 3600
+
+OBSERVATION_COLUMNS = ("observed_at", "temp", "temp_min", "temp_max", "humidity",
+                       "pressure", "wind_speed", "clouds", "rain_mm")
+FORECAST_COLUMNS = ("valid_at", "temp", "temp_min", "temp_max", "humidity",
+                    "wind_speed", "clouds", "rain_mm", "pop")
+
+
+def history_key(key: Hashable) -> str:
+    """Location key for a city name or a rounded (lat, lon) pair"""
+    if isinstance(key, tuple):
+        return f"{key[0]:.3f},{key[1]:.3f}"
+    return str(key).lower()
+
+
+def _day_index(timestamps: np.ndarray) -> np.ndarray:
+    return (timestamps + PH_UTC_OFFSET) // DAY
+
+
+def _day_label(day: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(int(day) * DAY))
+
+
+def _observation_row(current: Dict) -> tuple:
+    main = current.get("main", {})
+    return (
+        int(current["dt"]),
+        main.get("temp"),
+        main.get("temp_min"),
+        main.get("temp_max"),
+        main.get("humidity"),
+        main.get("pressure"),
+        current.get("wind", {}).get("speed"),
+        current.get("clouds", {}).get("all"),
+        current.get("rain", {}).get("1h", 0.0),
+    )
+
+
+def _forecast_row(item: Dict) -> tuple:
+    main = item.get("main", {})
+    return (
+        int(item["dt"]),
+        main.get("temp"),
+        main.get("temp_min"),
+        main.get("temp_max"),
+        main.get("humidity"),
+        item.get("wind", {}).get("speed"),
+        item.get("clouds", {}).get("all"),
+        item.get("rain", {}).get("3h", 0.0),
+        item.get("pop"),
+    )
+
+
+class WeatherHistory:
+    """Append-only observation/forecast store with windowed aggregates"""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS observations (
+                    location TEXT NOT NULL,
+                    observed_at INTEGER NOT NULL,
+                    fetched_at INTEGER NOT NULL,
+                    temp REAL, temp_min REAL, temp_max REAL, humidity REAL,
+                    pressure REAL, wind_speed REAL, clouds REAL, rain_mm REAL,
+                    PRIMARY KEY (location, observed_at)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS forecasts (
+                    location TEXT NOT NULL,
+                    issued_at INTEGER NOT NULL,
+                    valid_at INTEGER NOT NULL,
+                    temp REAL, temp_min REAL, temp_max REAL, humidity REAL,
+                    wind_speed REAL, clouds REAL, rain_mm REAL, pop REAL,
+                    PRIMARY KEY (location, issued_at, valid_at)
+                ) WITHOUT ROWID
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, reused across calls"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # Recording
+
+    def record_current(self, location: Hashable, current: Dict, fetched_at: Optional[float] = None) -> None:
+        """Append a current-weather response; repeats of the same observation time are ignored"""
+        observed_at, *values = _observation_row(current)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (history_key(location), observed_at, int(fetched_at or time.time()), *values)
+            )
+
+    def record_forecast(self, location: Hashable, forecast: Dict, issued_at: Optional[float] = None) -> None:
+        """Append every slot of a 5-day/3-hour forecast response"""
+        issued_at = int(issued_at or time.time())
+        key = history_key(location)
+        rows = [(key, issued_at, *_forecast_row(item)) for item in forecast.get("list", [])]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    # Raw windows
+
+    def observations(self, location: Hashable, start: float, end: float) -> Dict[str, np.ndarray]:
+        """Observation columns for start <= observed_at < end, in time order"""
+        rows = self._connect().execute(
+            f"SELECT {', '.join(OBSERVATION_COLUMNS)} FROM observations "
+            "WHERE location = ? AND observed_at >= ? AND observed_at < ? ORDER BY observed_at",
+            (history_key(location), int(start), int(end))
+        ).fetchall()
+        return self._columns(rows, OBSERVATION_COLUMNS)
+
+    def latest_forecast(self, location: Hashable) -> Dict[str, np.ndarray]:
+        """Forecast columns from the most recently issued forecast"""
+        rows = self._connect().execute(
+            f"SELECT {', '.join(FORECAST_COLUMNS)} FROM forecasts WHERE location = ? AND issued_at = "
+            "(SELECT MAX(issued_at) FROM forecasts WHERE location = ?) ORDER BY valid_at",
+            (history_key(location), history_key(location))
+        ).fetchall()
+        return self._columns(rows, FORECAST_COLUMNS)
+
+    @staticmethod
+    def _columns(rows, names) -> Dict[str, np.ndarray]:
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(names))
+        columns = {name: data[:, i] for i, name in enumerate(names)}
+        columns[names[0]] = columns[names[0]].astype(np.int64)
+        return columns
+
+    # Aggregates
+
+    @staticmethod
+    def hourly_rain(observed_at: np.ndarray, rain_1h: np.ndarray) -> tuple:
+        """(hour starts, mm) with one value per clock hour: the largest 1h total seen in it"""
+        if len(observed_at) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        hours = observed_at // HOUR
+        starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+        return hours[starts] * HOUR, np.maximum.reduceat(np.nan_to_num(rain_1h), starts)
+
+    def daily_summary(self, location: Hashable, days: int = 7, end: Optional[float] = None) -> Dict:
+        """Per-day rainfall, temperature extremes/mean and humidity for the last `days` days"""
+        end = time.time() if end is None else end
+        last_day = int(_day_index(np.int64(end)))
+        first_day = last_day - days + 1
+        start = first_day * DAY - PH_UTC_OFFSET
+        obs = self.observations(location, start, (last_day + 1) * DAY - PH_UTC_OFFSET)
+
+        day = _day_index(obs["observed_at"]) - first_day
+        counts = np.bincount(day, minlength=days)
+
+        hour_starts, hour_rain = self.hourly_rain(obs["observed_at"], obs["rain_mm"])
+        rain = np.bincount(_day_index(hour_starts) - first_day, weights=hour_rain, minlength=days)
+
+        temp = obs["temp"]
+        valid = ~np.isnan(temp)
+        temp_sum = np.bincount(day[valid], weights=temp[valid], minlength=days)
+        temp_count = np.bincount(day[valid], minlength=days)
+        temp_min = np.full(days, np.inf)
+        temp_max = np.full(days, -np.inf)
+        np.minimum.at(temp_min, day[valid], np.where(np.isnan(obs["temp_min"]), temp, obs["temp_min"])[valid])
+        np.maximum.at(temp_max, day[valid], np.where(np.isnan(obs["temp_max"]), temp, obs["temp_max"])[valid])
+
+        humidity = obs["humidity"]
+        h_valid = ~np.isnan(humidity)
+        h_sum = np.bincount(day[h_valid], weights=humidity[h_valid], minlength=days)
+        h_count = np.bincount(day[h_valid], minlength=days)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "days": [_day_label(d) for d in range(first_day, last_day + 1)],
+                "samples": counts,
+                "rain_mm": rain,
+                "temp_min": np.where(temp_count > 0, temp_min, np.nan),
+                "temp_max": np.where(temp_count > 0, temp_max, np.nan),
+                "temp_mean": temp_sum / temp_count,
+                "humidity_mean": h_sum / h_count,
+            }
+
+    @staticmethod
+    def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+        """Trailing window sums (shorter at the start) via one cumulative sum"""
+        totals = np.cumsum(np.nan_to_num(values, nan=0.0))
+        shifted = np.concatenate([np.zeros(min(window, len(totals))), totals[:-window]])
+        return totals - shifted
+
+    def rolling_rainfall(self, location: Hashable, days: int = 7, window: int = 3,
+                         end: Optional[float] = None) -> Dict:
+        """Daily rainfall and its trailing `window`-day totals over the last `days` days"""
+        summary = self.daily_summary(location, days + window - 1, end)
+        rain = summary["rain_mm"]
+        return {
+            "days": summary["days"][window - 1:],
+            "rain_mm": rain[window - 1:],
+            f"rain_{window}d_mm": self.rolling_sum(rain, window)[window - 1:],
+        }
+
+    def window_aggregates(self, location: Hashable, start: float, end: float) -> Dict:
+        """Totals and extremes over an arbitrary [start, end) window"""
+        obs = self.observations(location, start, end)
+        _, hour_rain = self.hourly_rain(obs["observed_at"], obs["rain_mm"])
+        temp = obs["temp"]
+        if not np.any(~np.isnan(temp)):
+            return {"samples": len(temp), "rain_mm": float(hour_rain.sum())}
+        return {
+            "samples": len(temp),
+            "rain_mm": float(hour_rain.sum()),
+            "temp_min": float(np.nanmin(np.fmin(obs["temp_min"], temp))),
+            "temp_max": float(np.nanmax(np.fmax(obs["temp_max"], temp))),
+            "temp_mean": float(np.nanmean(temp)),
+            "humidity_mean": float(np.nanmean(obs["humidity"])) if np.any(~np.isnan(obs["humidity"])) else None,
+        }
+
+    def forecast_rain(self, location: Hashable, hours: int = 72, now: Optional[float] = None) -> Optional[float]:
+        """Expected rainfall (mm) over the next `hours` from the latest stored forecast"""
+        forecast = self.latest_forecast(location)
+        if len(forecast["valid_at"]) == 0:
+            return None
+        now = time.time() if now is None else now
+        upcoming = (forecast["valid_at"] >= now) & (forecast["valid_at"] < now + hours * HOUR)
+        return float(np.nansum(forecast["rain_mm"][upcoming]))
+
+
+def _json_number(value) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def build_history_payload(history: WeatherHistory, location: Hashable, days: int = 7) -> Dict:
+    """Per-day weather history plus weekly rainfall for the /history endpoint"""
+    summary = history.daily_summary(location, days)
+    rolling = history.rolling_rainfall(location, days, window=7)
+    daily = [
+        {
+            "date": summary["days"][i],
+            "samples": int(summary["samples"][i]),
+            "rainMm": _json_number(summary["rain_mm"][i]),
+            "rain7dMm": _json_number(rolling["rain_7d_mm"][i]),
+            "tempMin": _json_number(summary["temp_min"][i]),
+            "tempMax": _json_number(summary["temp_max"][i]),
+            "tempMean": _json_number(summary["temp_mean"][i]),
+            "humidityMean": _json_number(summary["humidity_mean"][i]),
+        }
+        for i in range(days)
+    ]
+    return {
+        "success": True,
+        "location": str(location).title(),
+        "days": daily,
+        "rainLast7DaysMm": _json_number(rolling["rain_7d_mm"][-1]) if days else None,
+        "forecastRainNext72hMm": _json_number(history.forecast_rain(location, 72)),
+    }
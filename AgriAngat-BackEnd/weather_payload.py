@@ -0,0 +1,383 @@
+"""
+Response shaping shared by the Flask and ASGI weather servers.
+
+Everything here is pure: upstream JSON and local datasets in, the mobile
+app's JSON payloads out. Keeping it in one place means both servers return
+exactly the same contract.
+"""
+from datetime import datetime
+
+
+def get_agricultural_assessment(temp, humidity, wind_speed, rain_chance, condition):
+    """Generate agricultural weather assessment based on weather conditions"""
+    tips = []
+    
+    # Temperature assessment
+    if temp < 20:
+        tips.append({
+            "title": "Cool Temperature Alert",
+            "description": f"Temperature is {temp}°C. Consider protecting sensitive crops from cold. Good for cool-season vegetables like lettuce, cabbage, and peas."
+        })
+    elif 20 <= temp <= 30:
+        tips.append({
+            "title": "Optimal Growing Conditions",
+            "description": f"Temperature is {temp}°C - ideal for most tropical crops. Perfect for rice, corn, and most vegetables. Monitor soil moisture regularly."
+        })
+    else:
+        tips.append({
+            "title": "High Temperature Warning",
+            "description": f"Temperature is {temp}°C. Ensure adequate irrigation and shade for crops. Heat-stress resistant varieties recommended."
+        })
+    
+    # Humidity assessment
+    if humidity > 80:
+        tips.append({
+            "title": "High Humidity Alert",
+            "description": f"Humidity is {humidity}%. Watch for fungal diseases. Ensure good air circulation and consider fungicide application if needed."
+        })
+    elif humidity < 40:
+        tips.append({
+            "title": "Low Humidity Notice",
+            "description": f"Humidity is {humidity}%. Increase irrigation frequency. Consider mulching to retain soil moisture."
+        })
+    else:
+        tips.append({
+            "title": "Good Humidity Levels",
+            "description": f"Humidity is {humidity}% - favorable for most crops. Maintain current watering schedule."
+        })
+    
+    # Wind assessment
+    if wind_speed > 15:
+        tips.append({
+            "title": "Strong Wind Warning",
+            "description": f"Wind speed is {wind_speed} km/h. Secure young plants and provide windbreaks for tall crops like corn and banana."
+        })
+    
+    # Rain assessment
+    if rain_chance > 70:
+        tips.append({
+            "title": "High Rain Probability",
+            "description": f"{rain_chance}% chance of rain. Delay pesticide application. Ensure proper drainage to prevent waterlogging."
+        })
+    elif rain_chance < 20:
+        tips.append({
+            "title": "Low Rain Probability",
+            "description": f"Only {rain_chance}% chance of rain. Plan irrigation schedule. Check soil moisture levels regularly."
+        })
+    
+    return tips
+
+
+def format_soil_data(dataset, row):
+    """Format topsoil values from the soil dataset in the mobile app's soilData shape"""
+    fields = [
+        ("pH Level", "phh2o", "{:.1f}"),
+        ("Organic Carbon", "soc", "{:.1f} g/kg"),
+        ("Clay Content", "clay", "{:.0f}%"),
+        ("Sand Content", "sand", "{:.0f}%"),
+    ]
+    soil_info = {}
+    for label, prop, fmt in fields:
+        value = dataset.value(row, prop)
+        if value is not None:
+            soil_info[label] = fmt.format(value)
+    return soil_info
+
+
+def build_forecast(forecast_json):
+    """Condense the 3-hourly OpenWeatherMap forecast into 3 daily entries"""
+    forecast_data = []
+    
+    # Get next 3 days (skip today, take tomorrow and next 2 days)
+    daily_forecasts = {}
+    for item in forecast_json['list'][:24]:  # Next 24 entries (3 hours each = 72 hours)
+        date = datetime.fromtimestamp(item['dt']).strftime('%Y-%m-%d')
+        if date not in daily_forecasts:
+            daily_forecasts[date] = {
+                'temp_min': item['main']['temp_min'],
+                'temp_max': item['main']['temp_max'],
+                'condition': item['weather'][0]['description'].title(),
+                'icon': 'rain' if 'rain' in item['weather'][0]['main'].lower() else 'sun'
+            }
+        else:
+            daily_forecasts[date]['temp_min'] = min(daily_forecasts[date]['temp_min'], item['main']['temp_min'])
+            daily_forecasts[date]['temp_max'] = max(daily_forecasts[date]['temp_max'], item['main']['temp_max'])
+    
+    # Convert to forecast format (include today, next 2 days)
+    dates = sorted(daily_forecasts.keys())[:3]  # Include today, get next 3 days total
+    for i, date in enumerate(dates):
+        if i < 3:  # Limit to 3 days
+            day_data = daily_forecasts[date]
+            forecast_data.append({
+                "day": f"Day {i+1}",
+                "condition": day_data['condition'],
+                "tempRange": f"{int(day_data['temp_min'])}°C - {int(day_data['temp_max'])}°C",
+                "icon": day_data['icon']
+            })
+    
+    return forecast_data
+
+
+def build_weather_data(city_name, lat, lon, current_data, forecast_data):
+    """Shape current conditions and forecast into the mobile app's weatherData payload"""
+    # Extract weather information
+    temperature = round(current_data['main']['temp'])
+    humidity = current_data['main']['humidity']
+    wind_speed = round(current_data['wind']['speed'] * 3.6)  # Convert m/s to km/h
+    condition = current_data['weather'][0]['description'].title()
+    
+    # Calculate rain chance from cloudiness and weather condition
+    rain_chance = 0
+    if 'rain' in current_data:
+        rain_chance = 80
+    elif current_data['clouds']['all'] > 80:
+        rain_chance = 60
+    elif current_data['clouds']['all'] > 50:
+        rain_chance = 30
+    else:
+        rain_chance = 10
+    
+    # Generate agricultural assessment
+    agricultural_tips = get_agricultural_assessment(temperature, humidity, wind_speed, rain_chance, condition)
+    
+    return {
+        "location": city_name.title(),
+        "description": condition,
+        "temperature": temperature,
+        "humidity": humidity,
+        "windSpeed": wind_speed,
+        "rainChance": rain_chance,
+        "coordinates": {
+            "lat": lat,
+            "lon": lon
+        },
+        "forecast": forecast_data,
+        "tips": agricultural_tips
+    }
+
+
+def build_weather_response(city_name, weather_data):
+    """Full /api/weather response body for a city"""
+    weather_response = {
+        "success": True,
+        "weatherData": weather_data
+    }
+    
+    print(f"✅ Returning real weather data for {city_name}: {weather_data['temperature']}°C, {weather_data['description']}")
+    return weather_response
+
+
+# Sample soil data for a few cities without a SoilGrids dataset row
+SAMPLE_CITY_SOIL = {
+    'manila': {
+        "pH Level": "6.2", "Organic Carbon": "18.5 g/kg", 
+        "Clay Content": "35%", "Sand Content": "25%"
+    },
+    'cebu city': {
+        "pH Level": "6.8", "Organic Carbon": "22.1 g/kg", 
+        "Clay Content": "28%", "Sand Content": "32%"
+    },
+    'davao city': {
+        "pH Level": "6.5", "Organic Carbon": "24.8 g/kg", 
+        "Clay Content": "30%", "Sand Content": "28%"
+    },
+    'baguio': {
+        "pH Level": "5.9", "Organic Carbon": "31.2 g/kg", 
+        "Clay Content": "42%", "Sand Content": "18%"
+    },
+    'iloilo city': {
+        "pH Level": "6.4", "Organic Carbon": "20.3 g/kg", 
+        "Clay Content": "33%", "Sand Content": "26%"
+    }
+}
+
+
+def soil_cache_key(city_name, dataset=None):
+    """Response cache key for a city's soil, or None for generic fallback soil, which must not take a cache slot"""
+    city_key = city_name.lower()
+    if city_key in SAMPLE_CITY_SOIL or (dataset is not None and dataset.index_of(city_key) is not None):
+        return city_key
+    return None
+
+
+def build_soil_payload(city_name, dataset=None):
+    """Full /api/soil response body for a city - prebuilt SoilGrids dataset, mock fallback"""
+    city_key = city_name.lower()
+    
+    # Known locations are a constant-time index into the memory-mapped dataset
+    row = dataset.index_of(city_key) if dataset is not None else None
+    if row is not None:
+        soil_info = format_soil_data(dataset, row)
+        location = dataset.locations[row]
+        if soil_info:
+            print(f"✅ Returning SoilGrids data for {city_name}: pH {soil_info.get('pH Level', 'n/a')}")
+            return {
+                "success": True,
+                "city": city_name.title(),
+                "coordinates": {"latitude": location["lat"], "longitude": location["lon"]},
+                "soilData": soil_info
+            }
+    
+    # Get city-specific soil data or default
+    soil_info = SAMPLE_CITY_SOIL.get(city_key, {
+        "pH Level": "6.3", "Organic Carbon": "19.5 g/kg", 
+        "Clay Content": "32%", "Sand Content": "27%"
+    })
+    
+    # Mock soil data
+    mock_soil_data = {
+        "success": True,
+        "city": city_name.title(),
+        "coordinates": {"latitude": 14.5995, "longitude": 120.9842},
+        "soilData": soil_info
+    }
+    
+    print(f"✅ Returning soil data for {city_name}: pH {soil_info['pH Level']}")
+    return mock_soil_data
+
+
+def build_cities_payload(catalogue):
+    """Full /api/cities response body"""
+    cities_response = {
+        "success": True,
+        "cities": catalogue.entries,
+        "count": len(catalogue)
+    }
+    
+    print(f"✅ Returning {len(catalogue)} Philippine cities")
+    return cities_response
+
+
+def parse_weather_batch(body, max_items):
+    """Batch request body -> items in request order
+
+    Accepts {"cities": ["Manila", ...], "coordinates": [{"lat": 14.6, "lon": 121.0}, ...]}.
+    Items are ("city", name), ("coords", (lat, lon)), or ("invalid_city" /
+    "invalid_coords", original entry).
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    
+    cities = body.get("cities") or []
+    coordinates = body.get("coordinates") or []
+    if not isinstance(cities, list) or not isinstance(coordinates, list):
+        raise ValueError("'cities' and 'coordinates' must be lists")
+    if not cities and not coordinates:
+        raise ValueError("Provide 'cities' and/or 'coordinates'")
+    if len(cities) + len(coordinates) > max_items:
+        raise ValueError(f"At most {max_items} items per batch")
+    
+    items = []
+    for city in cities:
+        if isinstance(city, str) and city.strip():
+            items.append(("city", city.strip()))
+        else:
+            items.append(("invalid_city", city))
+    for point in coordinates:
+        try:
+            lat, lon = float(point["lat"]), float(point["lon"])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError
+            items.append(("coords", (lat, lon)))
+        except (KeyError, TypeError, ValueError):
+            items.append(("invalid_coords", point))
+    return items
+
+
+def build_nearest_cities(index, city_centers, lats, lons, k=1):
+    """Nearest city entries for each coordinate, closest first, with distances in km"""
+    indices, distances = index.query_batch(lats, lons, k)
+    results = []
+    for row_indices, row_distances in zip(indices, distances):
+        nearest = []
+        for i, distance in zip(row_indices, row_distances):
+            city_name = index.labels[i]
+            city_lat, city_lon = city_centers[city_name]
+            nearest.append({
+                "city": city_name.title(),
+                "key": city_name.replace(" ", "_"),
+                "distance": round(float(distance), 2),
+                "coordinates": {
+                    "latitude": city_lat,
+                    "longitude": city_lon
+                }
+            })
+        results.append(nearest)
+    return results
+
+
+def parse_coordinates(lat, lon):
+    """(lat, lon) as floats within WGS84 range, or ValueError"""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("'lat' and 'lon' must be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("'lat' must be within ±90 and 'lon' within ±180")
+    return lat, lon
+
+
+def parse_nearest_k(value, max_k=20):
+    """Number of nearest cities requested, clamped to 1..max_k, or ValueError"""
+    try:
+        return min(max(int(value), 1), max_k)
+    except (TypeError, ValueError):
+        raise ValueError("'k' must be an integer")
+
+
+def parse_history_days(value, max_days=90):
+    """Days of weather history requested, clamped to 1..max_days, or ValueError"""
+    try:
+        return min(max(int(value), 1), max_days)
+    except (TypeError, ValueError):
+        raise ValueError("'days' must be an integer")
+
+
+def parse_city_lookup(body, max_points):
+    """Batch city lookup body -> (lats, lons, k); any malformed point rejects the request
+
+    Accepts {"points": [{"lat": 14.6, "lon": 121.0}, ...], "k": 1}.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    
+    points = body.get("points")
+    if not isinstance(points, list):
+        raise ValueError("'points' must be a list")
+    if len(points) > max_points:
+        raise ValueError(f"At most {max_points} points per request")
+    
+    lats, lons = [], []
+    for i, point in enumerate(points):
+        if not isinstance(point, dict):
+            raise ValueError(f"Point {i} must be an object with 'lat' and 'lon'")
+        try:
+            lat, lon = parse_coordinates(point.get("lat"), point.get("lon"))
+        except ValueError as e:
+            raise ValueError(f"Point {i}: {e}")
+        lats.append(lat)
+        lons.append(lon)
+    return lats, lons, parse_nearest_k(body.get("k", 1))
+
+
+def weather_batch_key(item):
+    """Cache/de-duplication key for a batch item; nearby coordinates (~100 m) share one fetch"""
+    kind, value = item
+    if kind == "city":
+        return value.lower()
+    if kind == "coords":
+        return (round(value[0], 3), round(value[1], 3))
+    return None
+
+
+def build_weather_batch_result(item, weather_data=None, error=None):
+    """One entry of the /api/weather/batch results list"""
+    kind, value = item
+    query = {"lat": value[0], "lon": value[1]} if kind == "coords" else value
+    if kind == "invalid_coords":
+        error = "Invalid coordinates"
+    elif kind == "invalid_city":
+        error = "Invalid city name"
+    if error is not None:
+        return {"query": query, "success": False, "error": str(error)}
+    return {"query": query, "success": True, "weatherData": weather_data}